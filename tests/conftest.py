@@ -1,4 +1,18 @@
+import json
+import threading
+
 import pytest
+import responses
+
+from trading_ig.rest import IGService
+from trading_ig.stream import IGStreamService
+
+"""
+fakes and fixtures shared by the unit tests
+"""
+
+HEADERS = {"CST": "abc123", "X-SECURITY-TOKEN": "xyz987"}
+BASE_URL = "https://demo-api.ig.com/gateway/deal"
 
 
 def pytest_addoption(parser):
@@ -19,3 +33,153 @@ def pytest_collection_modifyitems(config, items):
     for item in items:
         if "slow" in item.keywords:
             item.add_marker(skip_slow)
+
+
+def position(epic="CS.D.GBPUSD.TODAY.IP", **kwargs):
+    """Arguments for IGService.create_open_position(), for a market BUY"""
+    params = {
+        "currency_code": "GBP",
+        "direction": "BUY",
+        "epic": epic,
+        "expiry": "DFB",
+        "force_open": True,
+        "guaranteed_stop": False,
+        "level": None,
+        "limit_distance": None,
+        "limit_level": None,
+        "order_type": "MARKET",
+        "quote_id": None,
+        "size": 1,
+        "stop_distance": None,
+        "stop_level": None,
+        "trailing_stop": False,
+        "trailing_stop_increment": None,
+    }
+    params.update(kwargs)
+    return params
+
+
+def confirm(deal_reference, status="ACCEPTED"):
+    """A deal confirmation, for a position opened in GBP/USD"""
+    return {
+        "dealReference": deal_reference,
+        "dealId": f"DIAAAA{deal_reference}",
+        "dealStatus": status,
+        "reason": "SUCCESS",
+        "epic": "CS.D.GBPUSD.TODAY.IP",
+        "status": "OPEN",
+        "affectedDeals": [],
+    }
+
+
+class FakeUpdate:
+    """A Lightstreamer TRADE update, with the fields JSON encoded"""
+
+    def __init__(self, fields):
+        self.fields = {
+            field: None if value is None else json.dumps(value)
+            for field, value in fields.items()
+        }
+
+    def getItemName(self):
+        return "TRADE:ABC123"
+
+    def getChangedFields(self):
+        return self.fields
+
+
+class FakeClient:
+    """A Lightstreamer client that records subscriptions"""
+
+    def __init__(self):
+        self.subscriptions = []
+
+    def subscribe(self, subscription):
+        self.subscriptions.append(subscription)
+
+    def unsubscribe(self, subscription):
+        self.subscriptions.remove(subscription)
+
+
+class FakeDealing:
+    """
+    Accepts deals with the reference REF-<epic or deal ID>, and confirms
+    them. Deals for an epic or deal ID in refused are refused, and their
+    confirms are REJECTED if in rejected, or not found if in missing.
+    Confirms wait until released is set, which it is to start with
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.refused = set()
+        self.rejected = set()
+        self.missing = set()
+        self.released = threading.Event()
+        self.released.set()
+
+    def deal(self, request):
+        body = json.loads(request.body) if request.body else {}
+        deal_id = body.get("dealId") or request.url.rsplit("/", 1)[-1]
+        key = body.get("epic") or deal_id
+        self.requests.append(dict(body, key=key))
+        if key in self.refused:
+            return 400, HEADERS, json.dumps({"errorCode": "error.service.refused"})
+        return 200, HEADERS, json.dumps({"dealReference": f"REF-{key}"})
+
+    def confirm(self, request):
+        self.released.wait(5)
+        deal_reference = request.url.rsplit("/", 1)[-1]
+        key = deal_reference[4:]
+        if key in self.missing:
+            body = {"errorCode": "error.confirms.deal-not-found"}
+            return 200, HEADERS, json.dumps(body)
+        status = "REJECTED" if key in self.rejected else "ACCEPTED"
+        body = {"dealReference": deal_reference, "dealStatus": status}
+        return 200, HEADERS, json.dumps(body)
+
+
+@pytest.fixture
+def rsps():
+    with responses.RequestsMock(assert_all_requests_are_fired=False) as rsps:
+        yield rsps
+
+
+@pytest.fixture
+def ig_service():
+    return IGService("username", "password", "api_key", "DEMO", "ABC123")
+
+
+@pytest.fixture
+def stream(ig_service):
+    stream = IGStreamService(ig_service)
+    stream.ls_client = FakeClient()
+    return stream
+
+
+@pytest.fixture
+def account(rsps):
+    """Answers the positions and working orders in tests/data"""
+    with open("tests/data/positions_v2.json", "r") as file:
+        positions = json.loads(file.read())
+    with open("tests/data/workingorders_v2.json", "r") as file:
+        orders = json.loads(file.read())
+    rsps.add(responses.GET, f"{BASE_URL}/positions", headers=HEADERS, json=positions)
+    rsps.add(responses.GET, f"{BASE_URL}/workingorders", headers=HEADERS, json=orders)
+    return rsps
+
+
+@pytest.fixture
+def dealing(rsps, account):
+    """A FakeDealing answering the dealing endpoints"""
+    fake = FakeDealing()
+    rsps.add_callback(
+        responses.POST,
+        responses.matchers.re.compile(f"{BASE_URL}/(positions|workingorders)/otc.*"),
+        callback=fake.deal,
+    )
+    rsps.add_callback(
+        responses.GET,
+        responses.matchers.re.compile(f"{BASE_URL}/confirms/.*"),
+        callback=fake.confirm,
+    )
+    return fake
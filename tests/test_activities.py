@@ -1,6 +1,7 @@
 import json
 import re
 from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs, urlparse
 
 import pandas as pd
 import responses
@@ -66,3 +67,141 @@ class TestActivities:
         assert isinstance(result, pd.DataFrame)
         assert result.shape[0] == 3
         assert result.shape[1] == 17
+
+    @responses.activate
+    def test_activities_v2_pages(self):
+        # fetch_account_activity_v2, five pages of two
+
+        def page_callback(request):
+            query = parse_qs(urlparse(request.url).query)
+            page = int(query["pageNumber"][0])
+            body = {
+                "activities": [
+                    {"date": f"2021-01-0{page}T10:00:0{i}", "dealId": f"D{page}{i}"}
+                    for i in range(2)
+                ],
+                "metadata": {
+                    "pageData": {"pageNumber": page, "pageSize": 2, "totalPages": 5}
+                },
+            }
+            return (
+                200,
+                {"CST": "abc123", "X-SECURITY-TOKEN": "xyz987"},
+                json.dumps(body),
+            )
+
+        responses.add_callback(
+            responses.GET,
+            "https://demo-api.ig.com/gateway/deal/history/activity/",
+            callback=page_callback,
+        )
+
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        to_date = datetime.now(timezone.utc)
+        result = ig_service.fetch_account_activity_v2(
+            to_date - timedelta(days=7), to_date, page_size=2
+        )
+
+        assert len(responses.calls) == 5
+        assert list(result["dealId"]) == [
+            f"D{page}{i}" for page in range(1, 6) for i in range(2)
+        ]
+
+
+class FakeActivityV3:
+    """Serves v3 activity in [from, to), newest first, one page at a time, with
+    a paging.next link for the rest of the range"""
+
+    def __init__(self, dates, page_size):
+        self.activities = [
+            {"date": date, "dealId": f"DEAL{i}", "epic": "CS.D.GBPUSD.TODAY.IP"}
+            for i, date in enumerate(dates)
+        ]
+        self.page_size = page_size
+
+    def __call__(self, request):
+        query = parse_qs(urlparse(request.url).query)
+        start, end = query["from"][0], query["to"][0]
+        matches = sorted(
+            (a for a in self.activities if start <= a["date"] < end),
+            key=lambda a: a["date"],
+            reverse=True,
+        )
+        page = matches[: self.page_size]
+        next_link = None
+        if len(matches) > self.page_size:
+            next_link = (
+                f"/history/activity?version=3&from={start}&to={page[-1]['date']}"
+            )
+        body = {"activities": page, "metadata": {"paging": {"next": next_link}}}
+        return 200, {"CST": "abc123", "X-SECURITY-TOKEN": "xyz987"}, json.dumps(body)
+
+
+class TestActivitiesV3:
+    start = datetime(2021, 1, 1, tzinfo=timezone.utc)
+
+    def dates(self):
+        start = self.start
+        # a few quiet days, then a busy hour
+        dates = [start + timedelta(days=i) for i in range(5)]
+        dates += [start + timedelta(days=6, minutes=i) for i in range(40)]
+        return [d.strftime("%Y-%m-%dT%H:%M:%S") for d in dates]
+
+    @responses.activate
+    def test_activity_v3_serial(self):
+        responses.add_callback(
+            responses.GET,
+            "https://demo-api.ig.com/gateway/deal/history/activity/",
+            callback=FakeActivityV3(self.dates(), page_size=10),
+        )
+        ig_service = IGService(
+            "username", "password", "api_key", "DEMO", return_dataframe=False
+        )
+        result = ig_service.fetch_account_activity(
+            self.start, self.start + timedelta(days=7), page_size=10
+        )
+        assert len(responses.calls) == 5
+        assert len(result["activities"]) == 45
+
+    @responses.activate
+    def test_activity_v3_windows(self):
+        fake = FakeActivityV3(self.dates(), page_size=10)
+        responses.add_callback(
+            responses.GET,
+            "https://demo-api.ig.com/gateway/deal/history/activity/",
+            callback=fake,
+        )
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        result = ig_service.fetch_account_activity(
+            self.start, self.start + timedelta(days=7), page_size=10, max_workers=4
+        )
+
+        assert isinstance(result, pd.DataFrame)
+        assert len(result) == 45
+        assert result["dealId"].is_unique
+        assert list(result["date"]) == sorted(self.dates(), reverse=True)
+
+    @responses.activate
+    def test_activity_v3_windows_same_second(self):
+        fake = FakeActivityV3(self.dates(), page_size=10)
+        # a deal amended in the same second it was opened
+        amend = dict(fake.activities[-1], description="Amended")
+        fake.activities.append(amend)
+        responses.add_callback(
+            responses.GET,
+            "https://demo-api.ig.com/gateway/deal/history/activity/",
+            callback=fake,
+        )
+        ig_service = IGService(
+            "username", "password", "api_key", "DEMO", return_dataframe=False
+        )
+        result = ig_service.fetch_account_activity(
+            self.start, self.start + timedelta(days=7), page_size=10, max_workers=4
+        )
+
+        activities = result["activities"]
+        assert len(activities) == 46
+        assert [a for a in activities if a["dealId"] == amend["dealId"]] == [
+            fake.activities[-2],
+            amend,
+        ]
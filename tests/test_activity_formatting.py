@@ -0,0 +1,142 @@
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pytest
+
+from trading_ig.rest import IGService
+
+"""
+unit tests for format_activities(), checked against the original
+json_normalize based implementation
+"""
+
+
+def legacy_format_activities(raw_json):
+    details = [
+        "marketName",
+        "goodTillDate",
+        "currency",
+        "size",
+        "direction",
+        "level",
+        "stopLevel",
+        "stopDistance",
+        "guaranteedStop",
+        "trailingStopDistance",
+        "trailingStep",
+        "limitLevel",
+        "limitDistance",
+    ]
+    df = pd.json_normalize(
+        raw_json["activities"],
+        record_path=["details", ["actions"]],
+        meta=[
+            "date",
+            "epic",
+            "period",
+            "dealId",
+            "channel",
+            "type",
+            "status",
+            "description",
+        ]
+        + [["details", col] for col in details],
+    )
+    df = df.rename(columns={f"details.{col}": col for col in details})
+    cols = df.columns.tolist()
+    cols = cols[2:] + cols[:2]
+    return df[cols]
+
+
+def synthetic_activities(count):
+    start = datetime(2021, 1, 1, tzinfo=timezone.utc)
+    activities = []
+    for i in range(count):
+        actions = [
+            {"actionType": "POSITION_OPENED", "affectedDealId": f"DEAL{i}"}
+            for _ in range(random.randint(1, 3))
+        ]
+        activities.append(
+            {
+                "date": (start + timedelta(minutes=i)).strftime("%Y-%m-%dT%H:%M:%S"),
+                "epic": "CS.D.GBPUSD.TODAY.IP",
+                "period": "DFB",
+                "dealId": f"DEAL{i}",
+                "channel": "WEB",
+                "type": "POSITION",
+                "status": "ACCEPTED",
+                "description": "Position opened: DEAL",
+                "details": {
+                    "dealReference": f"REF{i}",
+                    "actions": actions,
+                    "marketName": "GBP/USD",
+                    "goodTillDate": None,
+                    "currency": "GBP",
+                    "size": random.choice([1, 2.5]),
+                    "direction": "BUY",
+                    "level": round(random.uniform(1.2, 1.4), 4),
+                    "stopLevel": None,
+                    "stopDistance": None,
+                    "guaranteedStop": False,
+                    "trailingStopDistance": None,
+                    "trailingStep": None,
+                    "limitLevel": None,
+                    "limitDistance": None,
+                },
+            }
+        )
+    return {"activities": activities}
+
+
+class TestActivityFormatting:
+    def test_format_activities(self):
+        raw = synthetic_activities(50)
+        pd.testing.assert_frame_equal(
+            IGService.format_activities(raw), legacy_format_activities(raw)
+        )
+
+    def test_format_activities_irregular(self):
+        raw = synthetic_activities(5)
+        raw["activities"][1]["details"]["actions"] = []
+        raw["activities"][2]["details"]["actions"][0]["extra"] = "x"
+        del raw["activities"][3]["details"]["actions"][0]["affectedDealId"]
+        pd.testing.assert_frame_equal(
+            IGService.format_activities(raw), legacy_format_activities(raw)
+        )
+
+    def test_format_activities_missing_field(self):
+        # json_normalize raises KeyError, the flattener fills in None
+        raw = synthetic_activities(3)
+        del raw["activities"][1]["channel"]
+        result = IGService.format_activities(raw)
+        assert result["channel"].isna().sum() == len(
+            raw["activities"][1]["details"]["actions"]
+        )
+
+    def test_format_activities_empty(self):
+        raw = {"activities": []}
+        pd.testing.assert_frame_equal(
+            IGService.format_activities(raw), legacy_format_activities(raw)
+        )
+
+    @pytest.mark.slow
+    def test_benchmark(self):
+        raw = synthetic_activities(50_000)
+
+        start = time.perf_counter()
+        expected = legacy_format_activities(raw)
+        legacy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = IGService.format_activities(raw)
+        new_time = time.perf_counter() - start
+
+        print(
+            f"\nformat_activities: 50k activities, {len(result)} actions, "
+            f"json_normalize {legacy_time:.3f}s, single pass {new_time:.3f}s "
+            f"({legacy_time / new_time:.1f}x)"
+        )
+        pd.testing.assert_frame_equal(result, expected)
+        assert new_time < legacy_time
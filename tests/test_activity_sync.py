@@ -0,0 +1,135 @@
+import json
+from datetime import timedelta
+from urllib.parse import parse_qs, urlparse
+
+import responses
+from conftest import BASE_URL, HEADERS
+
+from trading_ig.activity import ActivitySync, activity_key
+from trading_ig.rest import IGService
+
+"""
+unit tests for the incremental activity sync
+"""
+
+URL = f"{BASE_URL}/history/activity/"
+
+
+def activity(date, deal_id, description="Position opened"):
+    return {
+        "date": date,
+        "epic": "CS.D.GBPUSD.TODAY.IP",
+        "period": "DFB",
+        "dealId": deal_id,
+        "channel": "WEB",
+        "type": "POSITION",
+        "status": "ACCEPTED",
+        "description": description,
+        "details": None,
+    }
+
+
+class FakeActivityHistory:
+    """Serves v3 activity, newest first, filtered by the 'from' parameter"""
+
+    def __init__(self):
+        self.activities = []
+        self.requested_from = []
+
+    def __call__(self, request):
+        query = parse_qs(urlparse(request.url).query)
+        start = query["from"][0]
+        self.requested_from.append(start)
+        activities = [a for a in self.activities if a["date"] >= start]
+        activities.sort(key=lambda a: a["date"], reverse=True)
+        body = {"activities": activities, "metadata": {"paging": {"next": None}}}
+        return 200, HEADERS, json.dumps(body)
+
+
+class TestActivitySync:
+    @responses.activate
+    def test_sync(self):
+        history = FakeActivityHistory()
+        responses.add_callback(responses.GET, URL, callback=history)
+        history.activities = [
+            activity("2030-01-01T10:00:00", "DEAL1"),
+            activity("2030-01-01T10:05:00", "DEAL2"),
+        ]
+
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        sync = ActivitySync(ig_service, ":memory:", lookback=timedelta(days=7))
+
+        new = sync.sync()
+        assert [a["dealId"] for a in new] == ["DEAL1", "DEAL2"]
+        assert sync.cursor() == (
+            "2030-01-01T10:05:00",
+            {activity_key(history.activities[1])},
+        )
+
+        # nothing new
+        assert sync.sync() == []
+        assert history.requested_from[-1] == "2030-01-01T10:05:00"
+
+        # a new activity in the same second as the cursor, and a later one
+        history.activities += [
+            activity("2030-01-01T10:05:00", "DEAL3"),
+            activity("2030-01-01T11:00:00", "DEAL4"),
+        ]
+        new = sync.sync()
+        assert [a["dealId"] for a in new] == ["DEAL3", "DEAL4"]
+        assert sync.cursor() == (
+            "2030-01-01T11:00:00",
+            {activity_key(history.activities[3])},
+        )
+
+        stored = sync.read()
+        assert [a["dealId"] for a in stored] == ["DEAL1", "DEAL2", "DEAL3", "DEAL4"]
+        assert stored[0] == history.activities[0]
+        assert len(sync.read(from_date="2030-01-01T10:05:00")) == 3
+
+    @responses.activate
+    def test_same_deal_same_second(self):
+        history = FakeActivityHistory()
+        responses.add_callback(responses.GET, URL, callback=history)
+        history.activities = [
+            activity("2030-01-01T10:00:00", "DEAL1", "Position amended"),
+            activity("2030-01-01T10:00:00", "DEAL1", "Stop changed"),
+        ]
+
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        sync = ActivitySync(ig_service, ":memory:", lookback=timedelta(days=7))
+        assert len(sync.sync()) == 2
+
+        # and a third, after the cursor was set at that second
+        history.activities.append(
+            activity("2030-01-01T10:00:00", "DEAL1", "Limit changed")
+        )
+        new = sync.sync()
+        assert [a["description"] for a in new] == ["Limit changed"]
+        assert sorted(a["description"] for a in sync.read()) == [
+            "Limit changed",
+            "Position amended",
+            "Stop changed",
+        ]
+        assert sync.sync() == []
+
+    @responses.activate
+    def test_persisted(self, tmp_path):
+        history = FakeActivityHistory()
+        responses.add_callback(responses.GET, URL, callback=history)
+        history.activities = [activity("2030-01-01T10:00:00", "DEAL1")]
+
+        path = str(tmp_path / "activity.sqlite")
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        sync = ActivitySync(ig_service, path)
+        sync.sync()
+        sync.close()
+
+        sync = ActivitySync(ig_service, path)
+        assert sync.sync() == []
+        assert history.requested_from[-1] == "2030-01-01T10:00:00"
+        assert len(sync.read()) == 1
+
+        sync.reset()
+        assert sync.cursor() == (None, set())
+        assert sync.read() == []
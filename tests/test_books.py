@@ -0,0 +1,160 @@
+from threading import Thread
+
+import pytest
+from conftest import FakeUpdate
+
+from trading_ig.streamer.books import DealBook, PositionBook, WorkingOrderBook
+
+"""
+unit tests for the stream maintained position and working order books
+"""
+
+
+def opu(deal_id, status, epic="CS.D.GBPUSD.TODAY.IP", direction="BUY", size=1):
+    return {
+        "dealId": deal_id,
+        "dealReference": f"REF{deal_id}",
+        "dealStatus": "ACCEPTED",
+        "status": status,
+        "epic": epic,
+        "direction": direction,
+        "size": size,
+        "level": 1.3,
+    }
+
+
+@pytest.mark.usefixtures("account")
+class TestPositionBook:
+    def test_seed(self, stream):
+        book = PositionBook().attach(stream)
+
+        assert len(book) == 2
+        assert "ABCDE12345" in book
+        assert book.get("ABCDE12345")["size"] == 10.0
+        assert book.get("ABCDE12345")["instrumentName"] is not None
+        assert [p["dealId"] for p in book.by_epic("MT.D.XYZ.MONTH1.IP")] == [
+            "ABCDE54321"
+        ]
+        assert book.net_exposure("MT.D.ABC.Month1.IP") == 10.0
+        assert stream.ls_client.subscriptions[0].getItems() == ["TRADE:ABC123"]
+
+    def test_updates(self, stream):
+        book = PositionBook().attach(stream)
+        events = []
+        book.add_listener(lambda status, position: events.append((status, position)))
+        listener = stream.trade_listener
+
+        listener.onItemUpdate(FakeUpdate({"OPU": opu("DEAL1", "OPEN", size=3)}))
+        listener.onItemUpdate(
+            FakeUpdate({"OPU": opu("DEAL2", "OPEN", direction="SELL", size=5)})
+        )
+        assert book.net_exposure("CS.D.GBPUSD.TODAY.IP") == -2
+
+        # partly closed
+        listener.onItemUpdate(
+            FakeUpdate({"OPU": opu("DEAL2", "UPDATED", direction="SELL", size=1)})
+        )
+        assert book.net_exposure("CS.D.GBPUSD.TODAY.IP") == 2
+        assert book.get("DEAL2")["size"] == 1
+
+        listener.onItemUpdate(FakeUpdate({"OPU": opu("DEAL1", "DELETED", size=3)}))
+        listener.onItemUpdate(FakeUpdate({"OPU": opu("DEAL2", "DELETED", size=1)}))
+        assert book.get("DEAL1") is None
+        assert book.by_epic("CS.D.GBPUSD.TODAY.IP") == []
+        assert book.net_exposure("CS.D.GBPUSD.TODAY.IP") == 0
+        assert [status for status, _ in events] == [
+            "OPEN",
+            "OPEN",
+            "UPDATED",
+            "DELETED",
+            "DELETED",
+        ]
+        assert events[-1][1]["dealId"] == "DEAL2"
+
+    def test_updates_before_seed(self):
+        book = PositionBook()
+        book.apply(opu("DEAL1", "OPEN"))
+        book.apply(opu("DEAL2", "OPEN"))
+        book.apply(opu("DEAL2", "DELETED"))
+        assert len(book) == 0
+
+        book.seed([opu("DEAL3", "OPEN")])
+        assert sorted(p["dealId"] for p in book) == ["DEAL1", "DEAL3"]
+        assert book.net_exposure("CS.D.GBPUSD.TODAY.IP") == 2
+
+    def test_live_update_during_replay(self):
+        live = opu("DEAL2", "DELETED")
+
+        class ReplayBook(PositionBook):
+            def from_stream(self, update):
+                # a live update arrives while the pending ones are replayed
+                if update["dealId"] == "DEAL1":
+                    thread.start()
+                return update
+
+        def wait_for_live(status, position):
+            if position["dealId"] == "DEAL1":
+                thread.join()
+
+        book = ReplayBook()
+        book.add_listener(wait_for_live)
+        thread = Thread(target=book.apply, args=(live,))
+        book.apply(opu("DEAL1", "OPEN"))
+        book.apply(opu("DEAL2", "OPEN"))
+        book.seed([])
+        thread.join()
+
+        # the live DELETED is applied after the older pending OPEN
+        assert [p["dealId"] for p in book] == ["DEAL1"]
+        assert book.net_exposure("CS.D.GBPUSD.TODAY.IP") == 1
+
+    def test_load_required(self):
+        class NoLoadBook(DealBook):
+            field = "OPU"
+
+        with pytest.raises(TypeError):
+            NoLoadBook()
+
+
+@pytest.mark.usefixtures("account")
+class TestWorkingOrderBook:
+    def test_seed(self, stream):
+        book = WorkingOrderBook().attach(stream)
+
+        assert len(book) == 1
+        order = book.get("ABCD1234")
+        assert order["epic"] == "CS.D.CFDGOLD.CFDGC.IP"
+        assert order["size"] is not None
+        assert order["level"] is not None
+        assert book.by_epic("CS.D.CFDGOLD.CFDGC.IP") == [order]
+
+    def test_fills_and_cancels(self, stream):
+        book = WorkingOrderBook().attach(stream)
+        events = []
+        book.add_listener(
+            lambda status, order: events.append((status, order["dealId"]))
+        )
+        listener = stream.trade_listener
+
+        for deal_id in ("ORDER1", "ORDER2", "ORDER3"):
+            listener.onItemUpdate(FakeUpdate({"WOU": opu(deal_id, "OPEN")}))
+        assert len(book.by_epic("CS.D.GBPUSD.TODAY.IP")) == 3
+
+        # cancelled
+        listener.onItemUpdate(FakeUpdate({"WOU": opu("ORDER1", "DELETED")}))
+        # filled, order update first
+        listener.onItemUpdate(FakeUpdate({"WOU": opu("ORDER2", "DELETED")}))
+        listener.onItemUpdate(FakeUpdate({"OPU": opu("ORDER2", "OPEN")}))
+        # filled, position update first
+        listener.onItemUpdate(FakeUpdate({"OPU": opu("ORDER3", "OPEN")}))
+        listener.onItemUpdate(FakeUpdate({"WOU": opu("ORDER3", "DELETED")}))
+        # an unrelated position
+        listener.onItemUpdate(FakeUpdate({"OPU": opu("DEAL1", "OPEN")}))
+
+        assert book.by_epic("CS.D.GBPUSD.TODAY.IP") == []
+        assert events[3:] == [
+            ("DELETED", "ORDER1"),
+            ("DELETED", "ORDER2"),
+            ("FILLED", "ORDER2"),
+            ("FILLED", "ORDER3"),
+        ]
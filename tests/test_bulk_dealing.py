@@ -0,0 +1,49 @@
+from conftest import position
+
+from trading_ig.rest import IGService
+
+"""
+unit tests for bulk dealing
+"""
+
+
+class TestBulkDealing:
+    def test_close_all_positions(self, dealing):
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        dealing.rejected.add("ABCDE54321")
+        report = ig_service.close_all_positions()
+
+        assert len(report) == 2
+        assert sorted(r["dealId"] for r in dealing.requests) == [
+            "ABCDE12345",
+            "ABCDE54321",
+        ]
+        assert {r["direction"] for r in dealing.requests} == {"SELL"}
+        assert report[0].request["size"] == 10.0
+        assert [r.deal_reference for r in report.accepted] == ["REF-ABCDE12345"]
+        assert [r.deal_reference for r in report.rejected] == ["REF-ABCDE54321"]
+        assert report.failed == []
+
+    def test_close_filtered(self, dealing):
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        report = ig_service.close_all_positions(
+            filter=lambda p: p["market"]["epic"] == "MT.D.XYZ.MONTH1.IP"
+        )
+        assert [r.request["deal_id"] for r in report] == ["ABCDE54321"]
+
+    def test_cancel_all_working_orders(self, dealing):
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        report = ig_service.cancel_all_working_orders()
+        assert [r.deal_reference for r in report.accepted] == ["REF-ABCD1234"]
+
+    def test_submit_orders(self, dealing):
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        dealing.refused.add("CS.D.EURUSD.TODAY.IP")
+        epics = ["CS.D.GBPUSD.TODAY.IP", "CS.D.EURUSD.TODAY.IP", "CS.D.USDJPY.TODAY.IP"]
+        report = ig_service.submit_orders([position(epic) for epic in epics])
+
+        assert [r.request["epic"] for r in report] == epics
+        assert len(report.accepted) == 2
+        assert report[1].deal_reference is None
+        assert "error.service.refused" in str(report[1].error)
+        assert repr(report) == "DealReport(2 accepted, 0 rejected, 1 failed)"
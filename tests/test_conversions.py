@@ -0,0 +1,104 @@
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from trading_ig.conversions import (
+    _resolution_from_alias,
+    conv_datetime,
+    conv_resol,
+    parse_timestamp,
+    parse_timestamps,
+)
+
+"""
+unit tests for the conversions module
+"""
+
+
+class TestConversions:
+    @pytest.mark.parametrize("resolution", ["MINUTE", "HOUR_4", "DAY"])
+    def test_conv_resol_ig_resolution(self, resolution):
+        assert conv_resol(resolution) == resolution
+
+    def test_conv_resol_unknown(self):
+        assert conv_resol("7Min") == "7Min"
+
+    @pytest.mark.parametrize(
+        "alias,resolution",
+        [("1Min", "MINUTE"), ("5min", "MINUTE_5"), ("4H", "HOUR_4"), ("M", "MONTH")],
+    )
+    def test_conv_resol_without_pandas(self, monkeypatch, alias, resolution):
+        monkeypatch.setattr("trading_ig.conversions._HAS_PANDAS", False)
+        _resolution_from_alias.cache_clear()
+        try:
+            assert conv_resol(alias) == resolution
+            assert conv_resol("7Min") == "7Min"
+        finally:
+            _resolution_from_alias.cache_clear()
+
+    @pytest.mark.parametrize(
+        "timestamp",
+        [
+            "2020:09:01-05:06:07",
+            "2020/09/01 05:06:07",
+            "2020-09-01T05:06:07",
+            "2020-09-01 05:06:07",
+        ],
+    )
+    def test_parse_timestamp(self, timestamp):
+        assert parse_timestamp(timestamp) == datetime.fromisoformat(
+            "2020-09-01T05:06:07"
+        )
+
+    def test_parse_timestamp_date(self):
+        assert parse_timestamp("2020/09/01") == datetime.fromisoformat("2020-09-01")
+        assert conv_datetime("2020-09-01 05:06:07", 1) == "2020:09:01-05:06:07"
+
+    def test_parse_timestamp_other(self):
+        assert parse_timestamp("1 Sep 2020 05:06") == datetime.fromisoformat(
+            "2020-09-01T05:06"
+        )
+
+    @pytest.mark.parametrize(
+        "times,fmt",
+        [
+            (["2020:09:01-05:06:07", "2021:12:31-23:59:59"], "%Y:%m:%d-%H:%M:%S"),
+            (["2020/09/01 05:06:07", "2021/12/31 23:59:59"], "%Y/%m/%d %H:%M:%S"),
+            (["2020-09-01T05:06:07", "2021-12-31T23:59:59"], "%Y-%m-%dT%H:%M:%S"),
+        ],
+    )
+    def test_parse_timestamps(self, times, fmt):
+        expected = pd.to_datetime(times, format=fmt).values
+        assert (parse_timestamps(times) == expected).all()
+        assert (parse_timestamps(np.array(times, dtype="S19")) == expected).all()
+
+    def test_parse_timestamps_invalid(self):
+        assert len(parse_timestamps([])) == 0
+        with pytest.raises(ValueError):
+            parse_timestamps(["2020-09-01"])
+        with pytest.raises(ValueError):
+            parse_timestamps(["2020/13/01 05:06:07"])
+
+    @pytest.mark.slow
+    def test_benchmark(self):
+        index = pd.date_range("2000-01-01", periods=2_000_000, freq="min")
+        times = np.array(list(index.strftime("%Y/%m/%d %H:%M:%S")))
+
+        start = time.perf_counter()
+        expected = pd.to_datetime(times, format="%Y/%m/%d %H:%M:%S")
+        pandas_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = parse_timestamps(times)
+        new_time = time.perf_counter() - start
+
+        print(
+            f"\n2M timestamps: pandas.to_datetime {pandas_time:.3f}s, "
+            f"parse_timestamps {new_time:.3f}s "
+            f"({len(times) / new_time / 1e6:.1f}M per second)"
+        )
+        assert (result == expected.values).all()
+        assert new_time < pandas_time
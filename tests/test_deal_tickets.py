@@ -0,0 +1,66 @@
+from concurrent.futures import wait
+
+import pytest
+import responses
+from conftest import BASE_URL, HEADERS, position
+
+from trading_ig.deals import DealTicket
+from trading_ig.rest import IGService
+
+"""
+unit tests for non-blocking dealing
+"""
+
+
+class TestDealTickets:
+    def test_tickets(self, dealing):
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        dealing.released.clear()
+        tickets = [
+            ig_service.create_open_position(block=False, **position(epic))
+            for epic in ("CS.D.GBPUSD.TODAY.IP", "CS.D.EURUSD.TODAY.IP")
+        ]
+        tickets.append(ig_service.delete_working_order("DEAL1", block=False))
+        references = [
+            "REF-CS.D.GBPUSD.TODAY.IP",
+            "REF-CS.D.EURUSD.TODAY.IP",
+            "REF-DEAL1",
+        ]
+
+        # the tickets are back before any confirm is
+        assert all(isinstance(ticket, DealTicket) for ticket in tickets)
+        assert [ticket.deal_reference for ticket in tickets] == references
+        assert not any(ticket.done() for ticket in tickets)
+
+        dealing.released.set()
+        done, _ = wait(tickets, timeout=5)
+        assert len(done) == 3
+        assert [ticket.confirm()["dealReference"] for ticket in tickets] == references
+
+    def test_ticket_error(self, dealing):
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        dealing.missing.add("CS.D.GBPUSD.TODAY.IP")
+        ticket = ig_service.create_open_position(block=False, **position())
+        with pytest.raises(Exception, match="deal-not-found"):
+            ticket.result(timeout=5)
+
+    def test_logout(self, dealing, rsps):
+        rsps.add(responses.POST, f"{BASE_URL}/session", headers=HEADERS, json={})
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        ticket = ig_service.create_open_position(block=False, **position())
+        ticket.result(timeout=5)
+        executor = ig_service._executor
+
+        # the confirm workers are stopped with the session
+        ig_service.logout()
+        assert ig_service._executor is None
+        with pytest.raises(RuntimeError):
+            executor.submit(print)
+
+    def test_blocking(self, dealing):
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        result = ig_service.create_open_position(**position())
+        assert result == {
+            "dealReference": "REF-CS.D.GBPUSD.TODAY.IP",
+            "dealStatus": "ACCEPTED",
+        }
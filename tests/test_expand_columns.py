@@ -0,0 +1,112 @@
+import json
+import time
+
+import pandas as pd
+import pytest
+
+from trading_ig.rest import IGService
+
+"""
+unit tests for expand_columns(), checked against the original column by
+column implementation
+"""
+
+
+def legacy_expand_columns(
+    data, d_cols, flag_col_prefix=False, col_overlap_allowed=None
+):
+    if col_overlap_allowed is None:
+        col_overlap_allowed = []
+    for col_lev1, lst_col in d_cols.items():
+        ser = data[col_lev1]
+        del data[col_lev1]
+        for col in lst_col:
+            if col not in data.columns or col in col_overlap_allowed:
+                colname = col_lev1 + "_" + col if flag_col_prefix else col
+                data[colname] = ser.map(lambda x: x[col], na_action="ignore")
+            else:
+                raise (NotImplementedError(f"col overlap: {col}"))
+    return data
+
+
+def load(name, key):
+    with open(f"tests/data/{name}.json") as file:
+        return json.load(file)[key]
+
+
+CASES = [
+    ("positions_v2", "positions", IGService._position_columns("2"), None),
+    ("positions_v1", "positions", IGService._position_columns("1"), None),
+    (
+        "workingorders_v2",
+        "workingOrders",
+        IGService._working_order_columns("2"),
+        ["epic"],
+    ),
+    (
+        "workingorders_v1",
+        "workingOrders",
+        IGService._working_order_columns("1"),
+        ["epic"],
+    ),
+]
+
+
+def check(records, d_cols, flag_col_prefix=False, col_overlap_allowed=None):
+    result = IGService.expand_columns(
+        pd.DataFrame(records), d_cols, flag_col_prefix, col_overlap_allowed
+    )
+    expected = legacy_expand_columns(
+        pd.DataFrame(records), d_cols, flag_col_prefix, col_overlap_allowed
+    )
+    pd.testing.assert_frame_equal(result, expected)
+
+
+class TestExpandColumns:
+    @pytest.mark.parametrize("name,key,d_cols,allowed", CASES)
+    @pytest.mark.parametrize("flag_col_prefix", [False, True])
+    def test_expand_columns(self, name, key, d_cols, allowed, flag_col_prefix):
+        check(load(name, key), d_cols, flag_col_prefix, allowed)
+
+    @pytest.mark.parametrize("name,key,d_cols,allowed", CASES)
+    def test_expand_columns_missing_nested(self, name, key, d_cols, allowed):
+        records = load(name, key)
+        records.append({col: None for col in records[0]})
+        check(records, d_cols, col_overlap_allowed=allowed)
+
+    def test_expand_columns_missing_value(self):
+        records = [{"x": 1, "a": {"k": 1}}, {"x": 2, "a": {"k": None}}]
+        check(records, {"a": ["k"]})
+
+    def test_expand_columns_empty(self):
+        data = pd.DataFrame(columns=["x", "a"])
+        result = IGService.expand_columns(data, {"a": ["k", "l"]})
+        assert list(result.columns) == ["x", "k", "l"]
+        assert len(result) == 0
+        assert (result.dtypes == object).all()
+
+    def test_expand_columns_overlap(self):
+        records = [{"k": 1, "a": {"k": 2}}]
+        with pytest.raises(NotImplementedError):
+            IGService.expand_columns(pd.DataFrame(records), {"a": ["k"]})
+
+    @pytest.mark.slow
+    def test_benchmark(self):
+        d_cols = IGService._position_columns("2")
+        records = load("positions_v2", "positions") * 2_500
+
+        start = time.perf_counter()
+        expected = legacy_expand_columns(pd.DataFrame(records), d_cols)
+        legacy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = IGService.expand_columns(pd.DataFrame(records), d_cols)
+        new_time = time.perf_counter() - start
+
+        print(
+            f"\nexpand_columns: {len(result)} positions, "
+            f"column by column {legacy_time:.3f}s, single pass {new_time:.3f}s "
+            f"({legacy_time / new_time:.1f}x)"
+        )
+        pd.testing.assert_frame_equal(result, expected)
+        assert new_time < legacy_time
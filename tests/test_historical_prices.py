@@ -2,11 +2,13 @@ import datetime
 import json
 import re
 
+import numpy as np
 import pandas as pd
 import pytest
 import responses
+from responses import matchers
 
-from trading_ig.rest import IGService
+from trading_ig.rest import IGException, IGService
 
 """
 unit tests for historical prices methods
@@ -449,3 +451,154 @@ class TestHistoricalPrices:
                 epic="MT.D.GC.Month2.IP", resolution="X", numpoints=10
             )
             assert "Invalid frequency" in str(excinfo.value)
+
+    @staticmethod
+    def add_paged_responses():
+        with open("tests/data/historic_prices.json", "r") as file:
+            response_body = json.loads(file.read())
+
+        for page in (1, 2):
+            body = json.loads(json.dumps(response_body))
+            body["prices"] = response_body["prices"][(page - 1) * 5 : page * 5]
+            body["metadata"]["pageData"] = {
+                "pageSize": 5,
+                "pageNumber": page,
+                "totalPages": 2,
+            }
+            responses.add(
+                responses.GET,
+                "https://demo-api.ig.com/gateway/deal/prices/MT.D.GC.Month2.IP",
+                match=[
+                    matchers.query_param_matcher(
+                        {"pageNumber": str(page)}, strict_match=False
+                    )
+                ],
+                headers={"CST": "abc123", "X-SECURITY-TOKEN": "xyz987"},
+                json=body,
+                status=200,
+            )
+
+    @responses.activate
+    def test_historical_prices_v3_paged(self):
+        # fetch_historical_prices v3 - multiple pages bundled into one object
+        self.add_paged_responses()
+
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        result = ig_service.fetch_historical_prices_by_epic(
+            epic="MT.D.GC.Month2.IP", pagesize=5, wait=0
+        )
+
+        assert len(responses.calls) == 2
+        assert result["prices"].shape == (10, 13)
+
+    @responses.activate
+    def test_iter_historical_prices(self):
+        # iter_historical_prices - one formatted chunk per page
+        self.add_paged_responses()
+
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        chunks = ig_service.iter_historical_prices(
+            epic="MT.D.GC.Month2.IP", pagesize=5, wait=0
+        )
+
+        first = next(chunks)
+        assert isinstance(first, pd.DataFrame)
+        assert first.shape == (5, 13)
+        assert len(responses.calls) == 1
+
+        rest = list(chunks)
+        assert len(rest) == 1
+        assert len(responses.calls) == 2
+        assert rest[0].index[0] > first.index[-1]
+
+    @responses.activate
+    def test_iter_historical_prices_stopped_early(self):
+        # iter_historical_prices - allowance recorded when the caller stops
+        self.add_paged_responses()
+
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        chunks = ig_service.iter_historical_prices(
+            epic="MT.D.GC.Month2.IP", pagesize=5, wait=0
+        )
+        next(chunks)
+        assert ig_service._historical_allowance is None
+
+        chunks.close()
+        assert len(responses.calls) == 1
+        assert ig_service._historical_allowance is not None
+
+    @responses.activate
+    def test_iter_historical_prices_raw(self):
+        # iter_historical_prices - raw pages
+        self.add_paged_responses()
+
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        chunks = list(
+            ig_service.iter_historical_prices(
+                epic="MT.D.GC.Month2.IP",
+                pagesize=5,
+                wait=0,
+                format=lambda prices, version: prices,
+            )
+        )
+
+        assert [len(chunk) for chunk in chunks] == [5, 5]
+        assert chunks[1][0]["snapshotTime"] == "2020/10/12 21:55:00"
+
+    @responses.activate
+    def test_historical_prices_v3_numpy(self):
+        # fetch_historical_prices v3 - numpy output format
+        with open("tests/data/historic_prices.json", "r") as file:
+            response_body = json.loads(file.read())
+
+        responses.add(
+            responses.GET,
+            "https://demo-api.ig.com/gateway/deal/prices/MT.D.GC.Month2.IP",
+            match=[
+                matchers.query_param_matcher(
+                    {"resolution": "MINUTE"}, strict_match=False
+                )
+            ],
+            headers={"CST": "abc123", "X-SECURITY-TOKEN": "xyz987"},
+            json=response_body,
+            status=200,
+        )
+
+        ig_service = IGService(
+            "username", "password", "api_key", "DEMO", output_format="numpy"
+        )
+        result = ig_service.fetch_historical_prices_by_epic(
+            epic="MT.D.GC.Month2.IP", resolution="MINUTE"
+        )
+        prices = result["prices"]
+
+        assert isinstance(prices, np.ndarray)
+        assert prices.shape == (10,)
+        assert prices["time"][1] - prices["time"][0] == np.timedelta64(1, "m")
+
+    @responses.activate
+    def test_historical_prices_v3_numpy_pandas_resolution(self):
+        # pandas style resolutions are converted whatever the output format
+        with open("tests/data/historic_prices.json", "r") as file:
+            response_body = json.loads(file.read())
+
+        responses.add(
+            responses.GET,
+            "https://demo-api.ig.com/gateway/deal/prices/MT.D.GC.Month2.IP",
+            headers={"CST": "abc123", "X-SECURITY-TOKEN": "xyz987"},
+            json=response_body,
+            status=200,
+        )
+
+        ig_service = IGService(
+            "username", "password", "api_key", "DEMO", output_format="numpy"
+        )
+        ig_service.fetch_historical_prices_by_epic(
+            epic="MT.D.GC.Month2.IP", resolution="1Min"
+        )
+
+        assert responses.calls[0].request.params["resolution"] == "MINUTE"
+
+    def test_invalid_output_format(self):
+        with pytest.raises(IGException):
+            IGService("username", "password", "api_key", "DEMO", output_format="xml")
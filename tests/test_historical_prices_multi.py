@@ -0,0 +1,115 @@
+import json
+
+import pandas as pd
+import responses
+from conftest import BASE_URL, HEADERS
+from responses import matchers
+
+from trading_ig.rest import ApiExceededException, IGException, IGService
+
+"""
+unit tests for fetching historical prices for multiple epics
+"""
+
+URL = f"{BASE_URL}/prices/"
+
+
+def add_responses():
+    with open("tests/data/historic_prices.json", "r") as file:
+        minutes = json.loads(file.read())
+    # second epic has the first five bars only
+    partial = json.loads(json.dumps(minutes))
+    partial["prices"] = partial["prices"][:5]
+
+    responses.add(responses.GET, URL + "EPIC.A", headers=HEADERS, json=minutes)
+    responses.add(responses.GET, URL + "EPIC.B", headers=HEADERS, json=partial)
+    responses.add(responses.GET, URL + "EPIC.C", status=500)
+
+
+class TestHistoricalPricesMulti:
+    @responses.activate
+    def test_multi_dict(self):
+        add_responses()
+
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        result = ig_service.fetch_historical_prices_multi(
+            ["EPIC.A", "EPIC.B", "EPIC.C"], resolution="1Min", wait=0
+        )
+
+        prices = result["prices"]
+        assert list(prices) == ["EPIC.A", "EPIC.B"]
+        assert prices["EPIC.A"].index.equals(prices["EPIC.B"].index)
+        assert prices["EPIC.B"].shape == (10, 13)
+        assert prices["EPIC.B"]["bid"]["Open"].isna().sum() == 5
+
+        assert list(result["errors"]) == ["EPIC.C"]
+        assert isinstance(result["errors"]["EPIC.C"], IGException)
+
+    @responses.activate
+    def test_multi_panel(self):
+        add_responses()
+
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        result = ig_service.fetch_historical_prices_multi(
+            ["EPIC.A", "EPIC.B"], resolution="1Min", wait=0, panel=True
+        )
+
+        prices = result["prices"]
+        assert isinstance(prices, pd.DataFrame)
+        assert prices.shape == (10, 26)
+        assert prices["EPIC.A"]["ask"]["Close"].iloc[0] == 1927.9
+        assert result["errors"] == {}
+
+    @responses.activate
+    def test_multi_limiter_per_page(self):
+        with open("tests/data/historic_prices.json", "r") as file:
+            response_body = json.loads(file.read())
+        for epic in ("EPIC.A", "EPIC.B"):
+            for page in (1, 2):
+                body = json.loads(json.dumps(response_body))
+                body["metadata"]["pageData"]["pageNumber"] = page
+                body["metadata"]["pageData"]["totalPages"] = 2
+                responses.add(
+                    responses.GET,
+                    URL + epic,
+                    match=[
+                        matchers.query_param_matcher(
+                            {"pageNumber": str(page)}, strict_match=False
+                        )
+                    ],
+                    headers=HEADERS,
+                    json=body,
+                )
+
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        pauses = []
+        ig_service.non_trading_rate_limit_pause_or_pass = lambda: pauses.append(1)
+        result = ig_service.fetch_historical_prices_multi(
+            ["EPIC.A", "EPIC.B"], resolution="1Min", wait=0, max_workers=2
+        )
+
+        assert list(result["prices"]) == ["EPIC.A", "EPIC.B"]
+        # the limiter is taken for each page, not once per epic
+        assert len(responses.calls) == 4
+        assert len(pauses) == 4
+
+    @responses.activate
+    def test_multi_allowance_exhausted(self):
+        with open("tests/data/historic_prices.json", "r") as file:
+            response_body = json.loads(file.read())
+        response_body["metadata"]["allowance"]["remainingAllowance"] = 0
+        responses.add(
+            responses.GET, URL + "EPIC.A", headers=HEADERS, json=response_body
+        )
+        responses.add(
+            responses.GET, URL + "EPIC.B", headers=HEADERS, json=response_body
+        )
+
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        result = ig_service.fetch_historical_prices_multi(
+            ["EPIC.A", "EPIC.B"], resolution="1Min", wait=0, max_workers=1
+        )
+
+        assert list(result["prices"]) == ["EPIC.A"]
+        assert isinstance(result["errors"]["EPIC.B"], ApiExceededException)
+        assert len(responses.calls) == 1
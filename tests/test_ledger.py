@@ -0,0 +1,194 @@
+import json
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import responses
+from conftest import BASE_URL, HEADERS
+
+from trading_ig.ledger import Ledger, parse_amount
+from trading_ig.rest import IGService
+
+"""
+unit tests for the local transaction and activity ledger
+"""
+
+ACTIVITY_URL = f"{BASE_URL}/history/activity/"
+TRANSACTIONS_URL = f"{BASE_URL}/history/transactions"
+EPIC = "CS.D.GBPUSD.TODAY.IP"
+
+
+def activity(date, deal_id, action_type, affected_deal_id, size, level):
+    return {
+        "date": date,
+        "epic": EPIC,
+        "period": "DFB",
+        "dealId": deal_id,
+        "channel": "WEB",
+        "type": "POSITION",
+        "status": "ACCEPTED",
+        "description": "Position",
+        "details": {
+            "dealReference": f"REF{deal_id}",
+            "actions": [
+                {"actionType": action_type, "affectedDealId": affected_deal_id}
+            ],
+            "marketName": "GBP/USD",
+            "currency": "GBP",
+            "size": size,
+            "direction": "BUY",
+            "level": level,
+        },
+    }
+
+
+def transaction(date, trans_type, pnl, instrument="GBP/USD"):
+    return {
+        "date": date[:10],
+        "dateUtc": date,
+        "openDateUtc": date,
+        "instrumentName": instrument,
+        "period": "-",
+        "profitAndLoss": pnl,
+        "transactionType": trans_type,
+        "reference": f"T{date[-8:]}",
+        "openLevel": "-",
+        "closeLevel": "-",
+        "size": "-",
+        "currency": "£",
+        "cashTransaction": trans_type != "DEAL",
+    }
+
+
+class FakeHistory:
+    """Serves activity and transactions, filtered by the 'from' parameter"""
+
+    def __init__(self):
+        self.activities = []
+        self.transactions = []
+        self.requested_from = []
+
+    def activity(self, request):
+        start = parse_qs(urlparse(request.url).query)["from"][0]
+        self.requested_from.append(start)
+        activities = [a for a in self.activities if a["date"] >= start]
+        body = {"activities": activities, "metadata": {"paging": {"next": None}}}
+        return 200, HEADERS, json.dumps(body)
+
+    def history(self, request):
+        start = parse_qs(urlparse(request.url).query)["from"][0]
+        transactions = [t for t in self.transactions if t["dateUtc"] >= start]
+        body = {
+            "transactions": transactions,
+            "metadata": {"pageData": {"pageNumber": 1, "totalPages": 1}},
+        }
+        return 200, HEADERS, json.dumps(body)
+
+
+@pytest.fixture
+def history():
+    history = FakeHistory()
+    history.activities = [
+        activity("2021-01-04T09:00:00", "D1", "POSITION_OPENED", "P1", 2, 1.30),
+        activity(
+            "2021-01-04T12:00:00", "D2", "POSITION_PARTIALLY_CLOSED", "P1", 1, 1.31
+        ),
+        activity("2021-01-05T09:00:00", "D3", "POSITION_CLOSED", "P1", 1, 1.32),
+        activity("2021-01-05T10:00:00", "D4", "POSITION_OPENED", "P2", 5, 1.33),
+    ]
+    history.transactions = [
+        transaction("2021-01-04T12:00:00", "DEAL", "£10.00"),
+        transaction("2021-01-05T09:00:00", "DEAL", "£20.00"),
+        transaction("2021-01-05T22:00:00", "CHART", "£-0.50"),
+        transaction("2021-01-06T08:00:00", "DEPO", "£1,000.00", "Deposit"),
+    ]
+    with responses.RequestsMock() as rsps:
+        rsps.add_callback(responses.GET, ACTIVITY_URL, callback=history.activity)
+        rsps.add_callback(responses.GET, TRANSACTIONS_URL, callback=history.history)
+        yield history
+
+
+def ledger(return_dataframe=True):
+    ig_service = IGService(
+        "username", "password", "api_key", "DEMO", return_dataframe=return_dataframe
+    )
+    return Ledger(ig_service, ":memory:", lookback=timedelta(days=365 * 100))
+
+
+TO_DATE = datetime(2021, 1, 7, tzinfo=timezone.utc)
+
+
+class TestLedger:
+    def test_parse_amount(self):
+        assert parse_amount("£-1.23") == -1.23
+        assert parse_amount("1,234.50") == 1234.5
+        assert parse_amount("-") is None
+        assert parse_amount(None) is None
+
+    def test_sync(self, history):
+        book = ledger()
+        assert book.sync(to_date=TO_DATE) == (4, 4)
+        assert book.sync(to_date=TO_DATE) == (0, 0)
+        # the second sync starts from the activity cursor
+        assert book.cursor()[0] == "2021-01-05T10:00:00"
+        assert history.requested_from[-1] == "2021-01-05T10:00:00"
+
+        transactions = book.transactions()
+        assert list(transactions["profit_and_loss"]) == [10.0, 20.0, -0.5, 1000.0]
+        # epics come from the activities with the same market name
+        assert list(transactions["epic"]) == [EPIC] * 3 + [None]
+        assert len(book.transactions(trans_type="DEAL", epic=EPIC)) == 2
+
+    def test_reports(self, history):
+        book = ledger(return_dataframe=False)
+        book.sync(to_date=TO_DATE)
+
+        assert book.pnl_by_instrument_and_day() == [
+            {
+                "day": "2021-01-04",
+                "instrument_name": "GBP/USD",
+                "epic": EPIC,
+                "currency": "£",
+                "deals": 1,
+                "profit_and_loss": 10.0,
+            },
+            {
+                "day": "2021-01-05",
+                "instrument_name": "GBP/USD",
+                "epic": EPIC,
+                "currency": "£",
+                "deals": 1,
+                "profit_and_loss": 20.0,
+            },
+        ]
+        fees = book.fees()
+        assert len(fees) == 1
+        assert (fees[0]["transaction_type"], fees[0]["amount"]) == ("CHART", -0.5)
+
+        trips = book.round_trips()
+        assert [(t["deal_id"], t["close_size"], t["close_level"]) for t in trips] == [
+            ("P1", 1, 1.31),
+            ("P1", 1, 1.32),
+            ("P2", None, None),
+        ]
+        assert len(book.round_trips(from_date="2021-01-05T00:00:00")) == 1
+
+    def test_reset(self, history):
+        book = ledger()
+        book.sync(to_date=TO_DATE)
+        book.reset()
+        assert book.cursor() == (None, set())
+        assert len(book.transactions()) == 0
+        assert len(book.round_trips()) == 0
+
+    def test_same_deal_same_second(self):
+        book = ledger(return_dataframe=False)
+        opened = activity("2021-01-04T09:00:00", "D1", "POSITION_OPENED", "P1", 2, 1.3)
+        amended = activity(
+            "2021-01-04T09:00:00", "D1", "STOP_LIMIT_AMENDED", "P1", 2, 1.3
+        )
+        amended["details"]["stopLevel"] = 1.25
+        assert book.add_activities([opened, amended]) == 2
+        assert book.add_activities([opened, amended]) == 0
+        # the amend doesn't duplicate the round trip
+        assert len(book.round_trips()) == 1
@@ -0,0 +1,146 @@
+import json
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import responses
+from conftest import BASE_URL, HEADERS
+
+from trading_ig.planner import (
+    estimate_points,
+    plan_chunks,
+    resolution_seconds,
+    stitch_chunks,
+)
+from trading_ig.rest import ApiExceededException, IGService
+
+"""
+unit tests for the historical price chunk planner
+"""
+
+URL = f"{BASE_URL}/prices/MT.D.GC.Month2.IP"
+
+
+def minute_bar(dt):
+    bar = {
+        "snapshotTime": dt.strftime("%Y/%m/%d %H:%M:%S"),
+        "snapshotTimeUTC": dt.strftime("%Y-%m-%dT%H:%M:%S"),
+        "lastTradedVolume": 1,
+    }
+    for field in ("openPrice", "closePrice", "highPrice", "lowPrice"):
+        bar[field] = {"bid": 100.0, "ask": 101.0, "lastTraded": None}
+    return bar
+
+
+def prices_callback(request):
+    """Returns a one minute bar for every minute from -> to, inclusive"""
+    query = parse_qs(urlparse(request.url).query)
+    start = datetime.fromisoformat(query["from"][0]).replace(tzinfo=timezone.utc)
+    end = datetime.fromisoformat(query["to"][0]).replace(tzinfo=timezone.utc)
+    prices = []
+    while start <= end:
+        prices.append(minute_bar(start))
+        start += timedelta(minutes=1)
+    body = {
+        "prices": prices,
+        "instrumentType": "COMMODITIES",
+        "metadata": {
+            "allowance": {
+                "remainingAllowance": 9000,
+                "totalAllowance": 10000,
+                "allowanceExpiry": 600000,
+            },
+            "size": len(prices),
+            "pageData": {"pageSize": 0, "pageNumber": 1, "totalPages": 1},
+        },
+    }
+    return 200, HEADERS, json.dumps(body)
+
+
+class TestPlanner:
+    def test_resolution_seconds(self):
+        assert resolution_seconds("MINUTE_5") == 300
+        assert resolution_seconds("4h") == 14400
+        with pytest.raises(ValueError):
+            resolution_seconds("7Min")
+
+    def test_plan_chunks(self):
+        chunks = plan_chunks(
+            "2021-01-04T09:03:30", "2021-01-04T10:00:00", "MINUTE_5", max_points=5
+        )
+        # aligned to the 5 minute boundary, each chunk starting on the last bar
+        # of the one before
+        assert chunks == [
+            ("2021-01-04T09:00:00", "2021-01-04T09:20:00"),
+            ("2021-01-04T09:20:00", "2021-01-04T09:40:00"),
+            ("2021-01-04T09:40:00", "2021-01-04T10:00:00"),
+        ]
+        assert estimate_points(chunks, "MINUTE_5") == 15
+
+    def test_plan_chunks_small_range(self):
+        start = datetime(2021, 1, 4, 9, tzinfo=timezone.utc)
+        chunks = plan_chunks(start, start + timedelta(hours=1), "1h")
+        assert chunks == [("2021-01-04T09:00:00", "2021-01-04T10:00:00")]
+
+    def test_plan_chunks_invalid(self):
+        with pytest.raises(ValueError):
+            plan_chunks("2021-01-04T10:00:00", "2021-01-04T09:00:00", "HOUR")
+        with pytest.raises(ValueError):
+            plan_chunks("2021-01-04T09:00:00", "2021-01-04T10:00:00", "HOUR", 1)
+
+    def test_stitch_chunks(self):
+        start = datetime(2021, 1, 4, 9, tzinfo=timezone.utc)
+        bars = [minute_bar(start + timedelta(minutes=i)) for i in range(5)]
+        stitched = stitch_chunks([bars[:3], bars[2:], []])
+        assert stitched == bars
+
+    @responses.activate
+    def test_fetch_in_chunks(self):
+        responses.add_callback(responses.GET, URL, callback=prices_callback)
+
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        result = ig_service.fetch_historical_prices_by_epic_in_chunks(
+            "MT.D.GC.Month2.IP",
+            "1Min",
+            "2021-01-04T09:00:00",
+            "2021-01-04T10:39:00",
+            max_points=21,
+            wait=0,
+        )
+
+        assert len(responses.calls) == 5
+        # one page per chunk
+        query = parse_qs(urlparse(responses.calls[0].request.url).query)
+        assert query["pageSize"] == ["21"]
+        assert len(result["metadata"]["chunks"]) == 5
+        prices = result["prices"]
+        assert len(prices) == 100
+        assert prices.index.is_unique
+        assert prices.index.is_monotonic_increasing
+
+    @responses.activate
+    def test_fetch_in_chunks_allowance(self):
+        responses.add_callback(responses.GET, URL, callback=prices_callback)
+
+        ig_service = IGService(
+            "username", "password", "api_key", "DEMO", return_dataframe=False
+        )
+        ig_service.fetch_historical_prices_by_epic_in_chunks(
+            "MT.D.GC.Month2.IP",
+            "MINUTE",
+            "2021-01-04T09:00:00",
+            "2021-01-04T09:10:00",
+            wait=0,
+        )
+        assert len(responses.calls) == 1
+
+        # about 10,000 bars, more than the 9,000 remaining
+        with pytest.raises(ApiExceededException):
+            ig_service.fetch_historical_prices_by_epic_in_chunks(
+                "MT.D.GC.Month2.IP",
+                "MINUTE",
+                "2021-01-04T00:00:00",
+                "2021-01-11T00:00:00",
+                wait=0,
+            )
+        assert len(responses.calls) == 1
@@ -0,0 +1,281 @@
+import json
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+from pandas import json_normalize
+
+from trading_ig.rest import IGService
+from trading_ig.utils import DATE_FORMATS
+
+"""
+unit tests for the price formatters, checked against the original
+json_normalize based implementations
+"""
+
+
+def legacy_format_prices(prices, version, flag_calc_spread=False):
+    def cols(typ):
+        return {
+            f"openPrice.{typ}": "Open",
+            f"highPrice.{typ}": "High",
+            f"lowPrice.{typ}": "Low",
+            f"closePrice.{typ}": "Close",
+            "lastTradedVolume": "Volume",
+        }
+
+    last = prices[0]["lastTradedVolume"] or prices[0]["closePrice"]["lastTraded"]
+    df = json_normalize(prices)
+    df = df.set_index("snapshotTime")
+    df.index = pd.to_datetime(df.index, format=DATE_FORMATS[int(version)])
+    df.index.name = "DateTime"
+
+    df_ask = df[["openPrice.ask", "highPrice.ask", "lowPrice.ask", "closePrice.ask"]]
+    df_ask = df_ask.rename(columns=cols("ask"))
+    df_bid = df[["openPrice.bid", "highPrice.bid", "lowPrice.bid", "closePrice.bid"]]
+    df_bid = df_bid.rename(columns=cols("bid"))
+    if flag_calc_spread:
+        df_spread = df_ask - df_bid
+    if last:
+        df_last = df[
+            [
+                "openPrice.lastTraded",
+                "highPrice.lastTraded",
+                "lowPrice.lastTraded",
+                "closePrice.lastTraded",
+                "lastTradedVolume",
+            ]
+        ]
+        df_last = df_last.rename(columns=cols("lastTraded"))
+
+    data = [df_bid, df_ask]
+    keys = ["bid", "ask"]
+    if flag_calc_spread:
+        data.append(df_spread)
+        keys.append("spread")
+    if last:
+        data.append(df_last)
+        keys.append("last")
+    df2 = pd.concat(data, axis=1, keys=keys)
+    for col in df2.select_dtypes(include=["object"]).columns:
+        df2[col] = pd.to_numeric(df2[col], errors="coerce")
+    return df2
+
+
+def legacy_normalize(prices, version):
+    df = json_normalize(prices)
+    if version == "3":
+        df = df.set_index("snapshotTimeUTC")
+        df = df.drop(columns=["snapshotTime"])
+        date_format = "%Y-%m-%dT%H:%M:%S"
+    else:
+        df = df.set_index("snapshotTime")
+        date_format = DATE_FORMATS[int(version)]
+    df.index = pd.to_datetime(df.index, format=date_format)
+    df.index.name = "DateTime"
+    return df
+
+
+def legacy_flat_prices(prices, version):
+    df = legacy_normalize(prices, version)
+    df = df.drop(
+        columns=[
+            "openPrice.lastTraded",
+            "closePrice.lastTraded",
+            "highPrice.lastTraded",
+            "lowPrice.lastTraded",
+        ]
+    )
+    return df.rename(
+        columns={
+            "openPrice.bid": "open.bid",
+            "openPrice.ask": "open.ask",
+            "closePrice.bid": "close.bid",
+            "closePrice.ask": "close.ask",
+            "highPrice.bid": "high.bid",
+            "highPrice.ask": "high.ask",
+            "lowPrice.bid": "low.bid",
+            "lowPrice.ask": "low.ask",
+            "lastTradedVolume": "volume",
+        }
+    )
+
+
+def legacy_mid_prices(prices, version):
+    df = legacy_normalize(prices, version)
+    df["Open"] = df[["openPrice.bid", "openPrice.ask"]].mean(axis=1)
+    df["High"] = df[["highPrice.bid", "highPrice.ask"]].mean(axis=1)
+    df["Low"] = df[["lowPrice.bid", "lowPrice.ask"]].mean(axis=1)
+    df["Close"] = df[["closePrice.bid", "closePrice.ask"]].mean(axis=1)
+    df = df.drop(
+        columns=[
+            f"{field}.{typ}"
+            for field in ("openPrice", "closePrice", "highPrice", "lowPrice")
+            for typ in ("lastTraded", "bid", "ask")
+        ]
+    )
+    return df.rename(columns={"lastTradedVolume": "Volume"})
+
+
+def load_prices(filename):
+    with open(f"tests/data/{filename}", "r") as file:
+        return json.loads(file.read())["prices"]
+
+
+def synthetic_prices(count, last_traded=False):
+    """v3 style raw prices, one bar per minute"""
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    prices = []
+    for i in range(count):
+        dt = start + timedelta(minutes=i)
+        bar = {
+            "snapshotTime": dt.strftime("%Y/%m/%d %H:%M:%S"),
+            "snapshotTimeUTC": dt.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        for field in ("openPrice", "closePrice", "highPrice", "lowPrice"):
+            bid = round(random.uniform(1000, 2000), 1)
+            bar[field] = {
+                "bid": bid,
+                "ask": bid + 0.6,
+                "lastTraded": bid + 0.3 if last_traded else None,
+            }
+        bar["lastTradedVolume"] = random.randint(0, 1000)
+        prices.append(bar)
+    return prices
+
+
+FIXTURES = [
+    ("historic_prices.json", "3"),
+    ("historic_prices_v1.json", "1"),
+    ("historic_prices_v2.json", "2"),
+]
+
+
+class TestPriceFormatting:
+    @pytest.mark.parametrize("filename,version", FIXTURES)
+    @pytest.mark.parametrize("flag_calc_spread", [False, True])
+    def test_format_prices(self, filename, version, flag_calc_spread):
+        prices = load_prices(filename)
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        pd.testing.assert_frame_equal(
+            ig_service.format_prices(prices, version, flag_calc_spread),
+            legacy_format_prices(prices, version, flag_calc_spread),
+        )
+
+    @pytest.mark.parametrize("filename,version", FIXTURES)
+    def test_flat_prices(self, filename, version):
+        prices = load_prices(filename)
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        pd.testing.assert_frame_equal(
+            ig_service.flat_prices(prices, version),
+            legacy_flat_prices(prices, version),
+        )
+
+    @pytest.mark.parametrize("filename,version", FIXTURES)
+    def test_mid_prices(self, filename, version):
+        prices = load_prices(filename)
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        pd.testing.assert_frame_equal(
+            ig_service.mid_prices(prices, version),
+            legacy_mid_prices(prices, version),
+        )
+
+    def test_format_prices_last_traded(self):
+        prices = synthetic_prices(50, last_traded=True)
+        prices[3]["openPrice"]["ask"] = None
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        pd.testing.assert_frame_equal(
+            ig_service.format_prices(prices, "3", True),
+            legacy_format_prices(prices, "3", True),
+        )
+        pd.testing.assert_frame_equal(
+            ig_service.mid_prices(prices, "3"), legacy_mid_prices(prices, "3")
+        )
+
+    @pytest.mark.slow
+    @pytest.mark.parametrize(
+        "formatter,legacy",
+        [
+            ("format_prices", legacy_format_prices),
+            ("flat_prices", legacy_flat_prices),
+            ("mid_prices", legacy_mid_prices),
+        ],
+    )
+    def test_benchmark(self, formatter, legacy):
+        prices = synthetic_prices(100_000)
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+
+        start = time.perf_counter()
+        expected = legacy(prices, "3")
+        legacy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = getattr(ig_service, formatter)(prices, "3")
+        new_time = time.perf_counter() - start
+
+        print(
+            f"\n{formatter}: 100k bars, json_normalize {legacy_time:.3f}s, "
+            f"single pass {new_time:.3f}s ({legacy_time / new_time:.1f}x)"
+        )
+        pd.testing.assert_frame_equal(result, expected)
+        assert new_time < legacy_time
+
+    def test_structured_prices(self):
+        prices = load_prices("historic_prices.json")
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        records = ig_service.structured_prices(prices, "3")
+
+        assert isinstance(records, np.ndarray)
+        assert len(records) == 10
+        assert records.dtype["time"] == np.dtype("datetime64[s]")
+        assert records["time"][0] == np.datetime64("2020-10-12T20:50:00")
+        assert records["bid_open"][0] == 1926.4
+        assert records["ask_close"][0] == 1927.9
+        assert records["volume"][0] == 60
+
+        expected = legacy_flat_prices(prices, "3")
+        assert (records["time"] == expected.index.values).all()
+        assert (records["bid_low"] == expected["low.bid"]).all()
+
+    def test_structured_prices_missing_volume(self):
+        prices = load_prices("historic_prices.json")
+        prices[1]["lastTradedVolume"] = None
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        records = ig_service.structured_prices(prices, "3")
+
+        assert records.dtype["volume"] == np.int64
+        assert records["volume"][1] == -1
+        assert records["volume"][0] == 60
+
+    @pytest.mark.parametrize("filename,version", FIXTURES[1:])
+    def test_structured_prices_v1_v2(self, filename, version):
+        prices = load_prices(filename)
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        records = ig_service.structured_prices(prices, version, np.float32)
+
+        expected = legacy_flat_prices(prices, version)
+        assert records.dtype["bid_open"] == np.dtype("float32")
+        assert (records["time"] == expected.index.values).all()
+        assert (records["volume"] == expected["volume"]).all()
+
+    def test_structured_prices_without_pandas(self):
+        # pandas must not be needed to build the structured array
+        script = (
+            "import sys, json\n"
+            "sys.modules['pandas'] = None\n"
+            "from trading_ig.rest import IGService\n"
+            "ig = IGService('u', 'p', 'k', 'DEMO', output_format='numpy')\n"
+            "with open('tests/data/historic_prices.json') as f:\n"
+            "    prices = json.load(f)['prices']\n"
+            "print(len(ig._format_price_data(prices, '3')))\n"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", script], capture_output=True, text=True, check=False
+        )
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.strip() == "10"
@@ -0,0 +1,170 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pytest
+import responses
+
+from trading_ig.resample import check_resolutions, resample_prices, resample_rule
+from trading_ig.rest import IGService
+from trading_ig.store import PriceStore
+
+"""
+unit tests for resampling historical prices
+"""
+
+
+def hourly_prices(start, hours):
+    """v3 style raw prices, one bar per hour, skipping weekends"""
+    prices = []
+    for i in range(hours):
+        dt = start + timedelta(hours=i)
+        if dt.weekday() >= 5:
+            continue
+        bar = {
+            "snapshotTime": dt.strftime("%Y/%m/%d %H:%M:%S"),
+            "snapshotTimeUTC": dt.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        for field, shift in (
+            ("openPrice", 0),
+            ("highPrice", 5),
+            ("lowPrice", -5),
+            ("closePrice", 1),
+        ):
+            bid = 1000.0 + i + shift
+            bar[field] = {"bid": bid, "ask": bid + 1, "lastTraded": None}
+        bar["lastTradedVolume"] = 10
+        prices.append(bar)
+    return prices
+
+
+class TestResample:
+    def test_resample_rule(self):
+        assert resample_rule("MINUTE_5") == "5min"
+        assert resample_rule("5Min") == "5min"
+        assert resample_rule("4h") == "4h"
+        assert resample_rule("DAY") == "1D"
+        with pytest.raises(ValueError):
+            resample_rule("7Min")
+
+    def test_check_resolutions(self):
+        check_resolutions("MINUTE", "MINUTE_15")
+        check_resolutions("1Min", "DAY")
+        check_resolutions("HOUR", "WEEK")
+        for source, target in [
+            ("HOUR", "MINUTE_5"),
+            ("MINUTE_2", "MINUTE_5"),
+            ("HOUR", "HOUR"),
+            ("WEEK", "MONTH"),
+        ]:
+            with pytest.raises(ValueError):
+                check_resolutions(source, target)
+
+    def test_resample_ohlc(self):
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        start = datetime(2021, 3, 1, tzinfo=timezone.utc)  # a Monday
+        prices = ig_service.format_prices(hourly_prices(start, 24), "3", True)
+
+        result = resample_prices(prices, "HOUR_4")
+        assert list(result.columns) == list(prices.columns)
+        assert len(result) == 6
+        first = result.iloc[0]
+        assert first[("bid", "Open")] == 1000.0
+        assert first[("bid", "High")] == 1008.0
+        assert first[("bid", "Low")] == 995.0
+        assert first[("bid", "Close")] == 1004.0
+        assert first[("ask", "Close")] == 1005.0
+        assert first[("spread", "High")] == 1.0
+
+    def test_weekend_gap(self):
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        start = datetime(2021, 3, 4, tzinfo=timezone.utc)  # a Thursday
+        prices = ig_service.flat_prices(hourly_prices(start, 24 * 7), "3")
+
+        result = resample_prices(prices, "DAY")
+        # Thu, Fri, Mon, Tue, Wed - nothing for the weekend
+        assert [ts.day for ts in result.index] == [4, 5, 8, 9, 10]
+        assert (result["volume"] == 240).all()
+
+    def test_session_offset(self):
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        start = datetime(2021, 3, 1, tzinfo=timezone.utc)
+        prices = ig_service.mid_prices(hourly_prices(start, 48), "3")
+
+        result = resample_prices(prices, "1D", offset="22h")
+        assert list(result.index) == [
+            pd.Timestamp("2021-02-28 22:00"),
+            pd.Timestamp("2021-03-01 22:00"),
+            pd.Timestamp("2021-03-02 22:00"),
+        ]
+        assert list(result["Volume"]) == [220, 240, 20]
+        assert result["Open"].iloc[1] == prices["Open"].iloc[22]
+
+    @responses.activate
+    def test_store_fetch_resampled(self):
+        with open("tests/data/historic_prices.json", "r") as file:
+            response_body = json.loads(file.read())
+        responses.add(
+            responses.GET,
+            "https://demo-api.ig.com/gateway/deal/prices/MT.D.GC.Month2.IP",
+            headers={"CST": "abc123", "X-SECURITY-TOKEN": "xyz987"},
+            json=response_body,
+        )
+
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        store = PriceStore(ig_service, ":memory:")
+        args = ("2020-10-12T20:50:00", "2020-10-12T20:59:00")
+
+        five = store.fetch_resampled("MT.D.GC.Month2.IP", "5Min", "1Min", *args)
+        ten = store.fetch_resampled("MT.D.GC.Month2.IP", "10Min", "1Min", *args)
+
+        # one request serves both resolutions
+        assert len(responses.calls) == 1
+        assert five["prices"].shape == (2, 13)
+        assert ten["prices"].shape == (1, 13)
+        assert ten["prices"][("last", "Volume")].iloc[0] == 264
+        assert ten["prices"][("bid", "Open")].iloc[0] == 1926.4
+
+    @responses.activate
+    def test_store_fetch_resampled_utc(self):
+        start = datetime(2021, 6, 1, tzinfo=timezone.utc)  # a Tuesday
+        prices = hourly_prices(start, 48)
+        # an account an hour ahead of UTC, as in summer in London
+        for bar in prices:
+            local = datetime.fromisoformat(bar["snapshotTimeUTC"]) + timedelta(hours=1)
+            bar["snapshotTime"] = local.strftime("%Y/%m/%d %H:%M:%S")
+        metadata = {
+            "allowance": {
+                "remainingAllowance": 9000,
+                "totalAllowance": 10000,
+                "allowanceExpiry": 600000,
+            },
+            "size": len(prices),
+            "pageData": {"pageSize": 0, "pageNumber": 1, "totalPages": 1},
+        }
+        responses.add(
+            responses.GET,
+            "https://demo-api.ig.com/gateway/deal/prices/MT.D.GC.Month2.IP",
+            headers={"CST": "abc123", "X-SECURITY-TOKEN": "xyz987"},
+            json={"prices": prices, "metadata": metadata},
+        )
+
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        store = PriceStore(ig_service, ":memory:")
+        result = store.fetch_resampled(
+            "MT.D.GC.Month2.IP",
+            "DAY",
+            "HOUR",
+            "2021-06-01T00:00:00",
+            "2021-06-02T23:00:00",
+        )
+
+        # days start at midnight UTC, not midnight local time
+        daily = result["prices"]
+        assert list(daily.index) == [
+            pd.Timestamp("2021-06-01"),
+            pd.Timestamp("2021-06-02"),
+        ]
+        assert daily[("bid", "Open")].iloc[0] == 1000.0
+        assert daily[("bid", "Close")].iloc[0] == 1024.0
+        assert list(daily[("last", "Volume")]) == [240, 240]
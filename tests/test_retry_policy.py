@@ -0,0 +1,134 @@
+import json
+import time
+
+import pytest
+import responses
+from conftest import BASE_URL, HEADERS
+
+from trading_ig.rest import IGService
+from trading_ig.retry import RetryPolicy
+
+"""
+unit tests for RetryPolicy, and the deal and position lookups that use it
+"""
+
+NOT_FOUND = json.dumps({"errorCode": "error.confirms.deal-not-found"})
+
+
+class FakeLookup:
+    """Answers 404 until ready, then the body, recording when it was asked"""
+
+    def __init__(self, body, ready_after):
+        self.body = json.dumps(body)
+        self.ready_after = ready_after
+        self.times = []
+
+    def __call__(self, request):
+        self.times.append(time.monotonic())
+        if len(self.times) > self.ready_after:
+            return 200, HEADERS, self.body
+        return 404, HEADERS, NOT_FOUND
+
+
+class TestRetryPolicy:
+    def test_delays(self):
+        policy = RetryPolicy(initial=0.1, multiplier=2, max_delay=0.5)
+        delays = policy.delays()
+        assert [next(delays) for _ in range(5)] == [0.1, 0.2, 0.4, 0.5, 0.5]
+
+    def test_call(self):
+        results = iter([None, None, "ok", "late"])
+        policy = RetryPolicy(initial=0.001, jitter=0)
+        assert policy.call(lambda: next(results), lambda r: r is None) == "ok"
+
+    def test_deadline(self):
+        calls = []
+        policy = RetryPolicy(initial=0.01, max_delay=0.02, deadline=0.1)
+        start = time.monotonic()
+        result = policy.call(lambda: calls.append(1) or len(calls), lambda r: True)
+        elapsed = time.monotonic() - start
+        assert result == len(calls) > 3
+        assert elapsed < 0.2
+        # a caller's deadline overrides the policy's
+        calls.clear()
+        policy.call(lambda: calls.append(1), lambda r: True, deadline=0)
+        assert len(calls) == 1
+
+    def test_jitter(self, monkeypatch):
+        sleeps = []
+        monkeypatch.setattr("trading_ig.retry.time.sleep", sleeps.append)
+        monkeypatch.setattr("trading_ig.retry.random.random", lambda: 0.5)
+        results = iter([None, None, None, "ok"])
+        policy = RetryPolicy(initial=1, jitter=0.2)
+        policy.call(lambda: next(results), lambda r: r is None)
+        assert sleeps == pytest.approx([0.9, 0.9, 0.9])
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            RetryPolicy(initial=0)
+        with pytest.raises(ValueError):
+            RetryPolicy(jitter=2)
+
+
+class TestLookups:
+    def test_confirm_retried_quickly(self, rsps):
+        fake = FakeLookup({"dealReference": "REF1", "dealStatus": "ACCEPTED"}, 2)
+        rsps.add_callback(responses.GET, f"{BASE_URL}/confirms/REF1", callback=fake)
+        ig_service = IGService(
+            "username",
+            "password",
+            "api_key",
+            "DEMO",
+            retry_policy=RetryPolicy(initial=0.01, jitter=0),
+        )
+        start = time.monotonic()
+        confirm = ig_service.fetch_deal_by_deal_reference("REF1")
+        assert confirm["dealStatus"] == "ACCEPTED"
+        assert len(fake.times) == 3
+        # retried after 10ms then 20ms, not a second each
+        assert time.monotonic() - start < 0.5
+        assert fake.times[2] - fake.times[1] > fake.times[1] - fake.times[0]
+
+    def test_retries_rate_limited(self, rsps):
+        fake = FakeLookup({"dealReference": "REF1", "dealStatus": "ACCEPTED"}, 2)
+        rsps.add_callback(responses.GET, f"{BASE_URL}/confirms/REF1", callback=fake)
+        ig_service = IGService(
+            "username",
+            "password",
+            "api_key",
+            "DEMO",
+            retry_policy=RetryPolicy(initial=0.01, jitter=0),
+        )
+        pauses = []
+        ig_service.non_trading_rate_limit_pause_or_pass = lambda: pauses.append(1)
+        ig_service.fetch_deal_by_deal_reference("REF1")
+        # the limiter is taken for every attempt, not just the first
+        assert len(fake.times) == 3
+        assert len(pauses) == 3
+
+    def test_confirm_deadline(self, rsps):
+        fake = FakeLookup({}, 1000)
+        rsps.add_callback(responses.GET, f"{BASE_URL}/confirms/REF1", callback=fake)
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        start = time.monotonic()
+        with pytest.raises(Exception, match="deal-not-found"):
+            ig_service.fetch_deal_by_deal_reference("REF1", deadline=0.3)
+        assert 0.3 <= time.monotonic() - start < 0.6
+        assert len(fake.times) > 2
+
+    def test_open_position(self, rsps):
+        fake = FakeLookup({"position": {"dealId": "DEAL1"}, "market": {}}, 1)
+        rsps.add_callback(responses.GET, f"{BASE_URL}/positions/DEAL1", callback=fake)
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        position = ig_service.fetch_open_position_by_deal_id("DEAL1", deadline=1)
+        assert position["position"]["dealId"] == "DEAL1"
+        assert len(fake.times) == 2
+
+    def test_open_positions(self, rsps):
+        fake = FakeLookup({"positions": []}, 1)
+        rsps.add_callback(responses.GET, f"{BASE_URL}/positions", callback=fake)
+        ig_service = IGService(
+            "username", "password", "api_key", "DEMO", return_dataframe=False
+        )
+        assert ig_service.fetch_open_positions(deadline=1) == {"positions": []}
+        assert len(fake.times) == 2
@@ -0,0 +1,91 @@
+import json
+
+import pandas as pd
+import responses
+from conftest import HEADERS
+
+from trading_ig.rest import IGService
+from trading_ig.schemas import DATETIME, cast_frame, empty_frame, nested_columns
+
+"""
+unit tests for the DataFrame schemas
+"""
+
+
+def typed_service():
+    return IGService("username", "password", "api_key", "DEMO", typed_columns=True)
+
+
+class TestSchemas:
+    def test_cast_frame(self):
+        data = pd.DataFrame(
+            {
+                "dateUtc": ["2021-01-05T10:00:00", None],
+                "size": ["+1", "-"],
+                "profitAndLoss": ["£-1,234.50", "E2.00"],
+                "epic": ["CS.D.GBPUSD.TODAY.IP"] * 2,
+                "reference": ["A", "B"],
+            }
+        )
+        original = data.copy()
+        typed = cast_frame(data)
+
+        # the frame passed in is left alone
+        pd.testing.assert_frame_equal(data, original)
+        data = typed
+        assert data["dateUtc"].dtype == DATETIME
+        assert data["dateUtc"][0] == pd.Timestamp("2021-01-05T10:00:00Z")
+        assert pd.isna(data["dateUtc"][1])
+        assert data["size"].tolist()[0] == 1.0
+        assert pd.isna(data["size"][1])
+        assert data["profitAndLoss"].tolist() == [-1234.5, 2.0]
+        assert data["epic"].dtype == "category"
+        assert data["reference"].dtype == object
+
+    def test_empty_frame(self):
+        columns = nested_columns({"a": ["epic", "size"], "b": ["epic", "name"]})
+        assert columns == ["epic", "size", "name"]
+        assert empty_frame(columns).dtypes.tolist() == [object] * 3
+        typed = empty_frame(columns, typed=True)
+        assert typed.dtypes.tolist() == ["category", "float64", object]
+
+    @responses.activate
+    def test_typed_positions(self):
+        with open("tests/data/positions_v2.json", "r") as file:
+            response_body = json.loads(file.read())
+        responses.add(
+            responses.GET,
+            "https://demo-api.ig.com/gateway/deal/positions",
+            headers=HEADERS,
+            json=response_body,
+            status=200,
+        )
+
+        positions = typed_service().fetch_open_positions()
+
+        assert positions.shape == (2, 32)
+        assert positions["createdDateUTC"].dtype == DATETIME
+        assert positions["createdDateUTC"][0] == pd.Timestamp("2020-06-01T12:00:00Z")
+        assert positions["level"].dtype == "float64"
+        assert positions["size"][0] == 10
+        assert positions["epic"].dtype == "category"
+        assert positions["direction"].dtype == "category"
+        # dates without a timezone are left alone
+        assert positions["createdDate"].dtype == object
+
+    @responses.activate
+    def test_typed_working_orders_empty(self):
+        responses.add(
+            responses.GET,
+            "https://demo-api.ig.com/gateway/deal/workingorders",
+            headers=HEADERS,
+            json={"workingOrders": []},
+            status=200,
+        )
+
+        orders = typed_service().fetch_working_orders()
+
+        assert len(orders) == 0
+        assert orders.columns[0] == "instrumentName"
+        assert orders["orderLevel"].dtype == "float64"
+        assert orders["epic"].dtype == "category"
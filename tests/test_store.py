@@ -0,0 +1,142 @@
+import json
+
+import pandas as pd
+import responses
+from conftest import BASE_URL
+
+from trading_ig.rest import IGService
+from trading_ig.store import PriceStore, merge_ranges, missing_ranges
+
+"""
+unit tests for the local price store
+"""
+
+PRICES_URL = f"{BASE_URL}/prices/MT.D.GC.Month2.IP"
+
+
+def add_prices_response():
+    with open("tests/data/historic_prices.json", "r") as file:
+        response_body = json.loads(file.read())
+
+    responses.add(
+        responses.GET,
+        PRICES_URL,
+        headers={"CST": "abc123", "X-SECURITY-TOKEN": "xyz987"},
+        json=response_body,
+        status=200,
+    )
+
+
+class TestPriceStore:
+    def test_missing_ranges(self):
+        covered = [("2020-01-02", "2020-01-03"), ("2020-01-05", "2020-01-06")]
+        assert missing_ranges("2020-01-01", "2020-01-07", covered) == [
+            ("2020-01-01", "2020-01-02"),
+            ("2020-01-03", "2020-01-05"),
+            ("2020-01-06", "2020-01-07"),
+        ]
+        assert missing_ranges("2020-01-02", "2020-01-03", covered) == []
+        assert missing_ranges("2020-01-08", "2020-01-09", covered) == [
+            ("2020-01-08", "2020-01-09")
+        ]
+
+    def test_merge_ranges(self):
+        ranges = [("c", "d"), ("a", "b"), ("b", "c"), ("x", "z")]
+        assert merge_ranges(ranges) == [("a", "d"), ("x", "z")]
+
+    @responses.activate
+    def test_fetch_served_from_store(self):
+        add_prices_response()
+
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        store = PriceStore(ig_service, ":memory:")
+
+        result = store.fetch(
+            "MT.D.GC.Month2.IP", "1Min", "2020-10-12T20:50:00", "2020-10-12T20:59:00"
+        )
+        assert isinstance(result["prices"], pd.DataFrame)
+        assert result["prices"].shape == (10, 13)
+        assert result["metadata"]["fetchedBars"] == 10
+        assert len(responses.calls) == 1
+
+        # second time around, nothing should be fetched
+        result = store.fetch(
+            "MT.D.GC.Month2.IP", "1Min", "2020-10-12T20:52:00", "2020-10-12T20:59:00"
+        )
+        assert result["prices"].shape == (8, 13)
+        assert result["metadata"]["fetchedRanges"] == []
+        assert len(responses.calls) == 1
+
+    @responses.activate
+    def test_fetch_only_missing_range(self):
+        add_prices_response()
+
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        store = PriceStore(ig_service, ":memory:")
+        store.fetch(
+            "MT.D.GC.Month2.IP", "1Min", "2020-10-12T20:50:00", "2020-10-12T20:59:00"
+        )
+        result = store.fetch(
+            "MT.D.GC.Month2.IP", "1Min", "2020-10-12T20:40:00", "2020-10-12T20:59:00"
+        )
+
+        assert len(responses.calls) == 2
+        assert result["metadata"]["fetchedRanges"] == [
+            ("2020-10-12T20:40:00", "2020-10-12T20:50:00")
+        ]
+        assert "from=2020-10-12T20%3A40%3A00" in responses.calls[1].request.url
+        assert "to=2020-10-12T20%3A50%3A00" in responses.calls[1].request.url
+        assert store.coverage("MT.D.GC.Month2.IP", "1Min") == [
+            ("2020-10-12T20:40:00", "2020-10-12T20:59:00")
+        ]
+
+    @responses.activate
+    def test_persisted(self, tmp_path):
+        add_prices_response()
+
+        path = str(tmp_path / "prices.sqlite")
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        store = PriceStore(ig_service, path)
+        store.fetch(
+            "MT.D.GC.Month2.IP", "1Min", "2020-10-12T20:50:00", "2020-10-12T20:59:00"
+        )
+        store.close()
+
+        ig_service = IGService(
+            "username", "password", "api_key", "DEMO", return_dataframe=False
+        )
+        store = PriceStore(ig_service, path)
+        result = store.fetch(
+            "MT.D.GC.Month2.IP", "MINUTE", "2020-10-12T20:50:00", "2020-10-12T20:59:00"
+        )
+
+        assert len(responses.calls) == 1
+        prices = result["prices"]
+        assert len(prices) == 10
+        assert prices[0]["snapshotTime"] == "2020/10/12 21:50:00"
+        assert prices[0]["openPrice"]["bid"] == 1926.4
+        assert prices[0]["openPrice"]["lastTraded"] is None
+        assert prices[0]["lastTradedVolume"] == 60
+
+    @responses.activate
+    def test_resolution_key_same_for_every_output_format(self, tmp_path):
+        add_prices_response()
+        path = str(tmp_path / "prices.sqlite")
+        for output_format in ("pandas", "dict"):
+            ig_service = IGService(
+                "username", "password", "api_key", "DEMO", output_format=output_format
+            )
+            store = PriceStore(ig_service, path)
+            store.fetch(
+                "MT.D.GC.Month2.IP",
+                "1Min",
+                "2020-10-12T20:50:00",
+                "2020-10-12T20:59:00",
+            )
+            assert store.coverage("MT.D.GC.Month2.IP", "MINUTE") == [
+                ("2020-10-12T20:50:00", "2020-10-12T20:59:00")
+            ]
+            store.close()
+
+        assert len(responses.calls) == 1
+        assert responses.calls[0].request.params["resolution"] == "MINUTE"
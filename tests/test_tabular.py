@@ -0,0 +1,152 @@
+import json
+import re
+
+import pandas as pd
+import pytest
+import responses
+from conftest import HEADERS
+
+from trading_ig.rest import IGService
+from trading_ig.tabular import expand_records
+
+"""
+unit tests for the Arrow and Polars tabular backends
+"""
+
+
+def load(filename):
+    with open(f"tests/data/{filename}", "r") as file:
+        return json.loads(file.read())
+
+
+def add_response(url, filename):
+    responses.add(
+        responses.GET,
+        re.compile(url),
+        match_querystring=False,
+        headers=HEADERS,
+        json=load(filename),
+        status=200,
+    )
+
+
+class TestTabular:
+    def test_expand_records_matches_pandas(self):
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        positions = load("positions_v2.json")["positions"]
+        cols = ig_service._position_columns("2")
+
+        rows, columns = expand_records(positions, cols)
+        expected = ig_service.expand_columns(pd.DataFrame(positions), cols)
+        assert columns == list(expected.columns)
+        assert rows[0]["dealId"] == expected["dealId"].iloc[0]
+        assert rows[1]["bid"] == expected["bid"].iloc[1]
+
+
+def column(table, name):
+    """Column values as a list, for either backend"""
+    return (
+        table[name].to_pylist()
+        if hasattr(table, "column_names")
+        else (table[name].to_list())
+    )
+
+
+@pytest.mark.parametrize("backend", ["arrow", "polars"])
+class TestBackends:
+    @pytest.fixture(autouse=True)
+    def _requires(self, backend):
+        pytest.importorskip({"arrow": "pyarrow", "polars": "polars"}[backend])
+
+    @responses.activate
+    def test_positions(self, backend):
+        add_response(
+            "https://demo-api.ig.com/gateway/deal/positions", "positions_v2.json"
+        )
+        ig_service = IGService(
+            "username", "password", "api_key", "DEMO", output_format=backend
+        )
+        result = ig_service.fetch_open_positions()
+
+        # same shape as the pandas DataFrame
+        assert result.shape == (2, 32)
+        assert column(result, "dealId") == ["ABCDE12345", "ABCDE54321"]
+
+    @responses.activate
+    def test_working_orders(self, backend):
+        add_response(
+            "https://demo-api.ig.com/gateway/deal/workingorders",
+            "workingorders_v2.json",
+        )
+        ig_service = IGService(
+            "username", "password", "api_key", "DEMO", output_format=backend
+        )
+        result = ig_service.fetch_working_orders()
+        assert result.shape[0] == 1
+
+    @responses.activate
+    def test_activities(self, backend):
+        add_response(
+            "https://demo-api.ig.com/gateway/deal/history/activity/.+",
+            "activities_v1.json",
+        )
+        ig_service = IGService(
+            "username", "password", "api_key", "DEMO", output_format=backend
+        )
+        result = ig_service.fetch_account_activity_by_period(10000000)
+        assert result.shape == (3, 17)
+
+    @responses.activate
+    def test_detailed_activities(self, backend):
+        activities = [
+            {
+                "date": "2021-01-01T10:00:00",
+                "epic": "CS.D.GBPUSD.TODAY.IP",
+                "dealId": "DIAAAA",
+                "details": {
+                    "size": 1,
+                    "actions": [
+                        {"actionType": "POSITION_OPENED", "affectedDealId": "A"},
+                        {"actionType": "STOP_LIMIT_AMENDED"},
+                    ],
+                },
+            }
+        ]
+        responses.add(
+            responses.GET,
+            "https://demo-api.ig.com/gateway/deal/history/activity/",
+            headers=HEADERS,
+            json={"activities": activities, "metadata": {"paging": {"next": None}}},
+        )
+        ig_service = IGService(
+            "username", "password", "api_key", "DEMO", output_format=backend
+        )
+        result = ig_service.fetch_account_activity(detailed=True)
+
+        # same columns as the pandas DataFrame
+        expected = IGService.format_activities({"activities": activities})
+        names = getattr(result, "column_names", None) or result.columns
+        assert list(names) == list(expected.columns)
+        assert column(result, "actionType") == [
+            "POSITION_OPENED",
+            "STOP_LIMIT_AMENDED",
+        ]
+        assert column(result, "affectedDealId") == ["A", None]
+        assert column(result, "size") == [1, 1]
+        assert column(result, "limitLevel") == [None, None]
+
+    @responses.activate
+    def test_prices(self, backend):
+        add_response(
+            "https://demo-api.ig.com/gateway/deal/prices/.+", "historic_prices.json"
+        )
+        ig_service = IGService(
+            "username", "password", "api_key", "DEMO", output_format=backend
+        )
+        result = ig_service.fetch_historical_prices_by_epic(
+            epic="MT.D.GC.Month2.IP", resolution="MINUTE", wait=0
+        )
+        prices = result["prices"]
+        assert prices.shape == (10, 10)
+        assert column(prices, "bid_open")[0] == 1926.4
+        assert column(prices, "volume")[0] == 60
@@ -0,0 +1,170 @@
+import json
+
+import pytest
+import responses
+from conftest import BASE_URL, HEADERS, FakeUpdate, confirm, position
+
+from trading_ig.tracing import LatencyHistogram, LatencyTracer
+
+"""
+unit tests for deal latency tracing
+"""
+
+EPIC = "CS.D.GBPUSD.TODAY.IP"
+
+
+def position_update(deal_reference):
+    return {
+        "dealReference": deal_reference,
+        "dealId": f"DIAAAA{deal_reference}",
+        "epic": EPIC,
+        "status": "OPEN",
+        "dealStatus": "ACCEPTED",
+    }
+
+
+class TestLatencyHistogram:
+    def test_quantiles(self):
+        histogram = LatencyHistogram()
+        for seconds in [0.003] * 90 + [0.3] * 9 + [4.0]:
+            histogram.add(seconds)
+        assert histogram.count == 100
+        assert histogram.mean == pytest.approx(0.0697)
+        assert histogram.quantile(0.5) == 0.005
+        assert histogram.quantile(0.99) == 0.5
+        assert histogram.quantile(1) == 4.0
+        assert histogram.to_dict()["buckets"][0.005] == 90
+
+    def test_empty(self):
+        histogram = LatencyHistogram()
+        assert histogram.mean is None
+        assert histogram.quantile(0.5) is None
+
+
+class TestLatencyTracer:
+    def test_rest(self, rsps, ig_service):
+        rsps.add(
+            responses.POST,
+            f"{BASE_URL}/positions/otc",
+            headers=HEADERS,
+            json={"dealReference": "REF1"},
+        )
+        rsps.add(
+            responses.GET,
+            f"{BASE_URL}/confirms/REF1",
+            headers=HEADERS,
+            json=confirm("REF1"),
+        )
+        tracer = LatencyTracer().attach(ig_service)
+        traces = []
+        tracer.add_exporter(traces.append)
+
+        ig_service.create_open_position(**position())
+
+        assert len(traces) == 1
+        trace = traces[0].to_dict()
+        assert trace["method"] == "create_open_position"
+        assert trace["order_type"] == "MARKET"
+        assert trace["deal_id"] == "DIAAAAREF1"
+        assert trace["confirm_source"] == "rest"
+        assert {"limiter", "dealing", "confirm", "total"} <= set(trace)
+        assert "stream" not in trace
+        assert trace["total"] >= trace["dealing"] + trace["confirm"]
+        assert tracer.histogram("total", epic=EPIC).count == 1
+        assert tracer.histogram("dealing", order_type="MARKET").count == 1
+        assert tracer.histogram("total").count == 1
+        assert tracer.histogram("total", epic="OTHER").count == 0
+        rows = [
+            (row["interval"], row["by"], row["key"], row["count"])
+            for row in tracer.summary()
+        ]
+        assert ("confirm", "epic", EPIC, 1) in rows
+
+    def test_stream(self, rsps, ig_service, stream):
+        listener = stream.subscribe_trade_confirms()
+        tracer = LatencyTracer().attach(ig_service, stream)
+        traces = []
+        tracer.add_exporter(traces.append)
+
+        def created(request):
+            # the confirm is streamed before the POST returns
+            listener.onItemUpdate(FakeUpdate({"CONFIRMS": confirm("REF1")}))
+            return 200, HEADERS, json.dumps({"dealReference": "REF1"})
+
+        rsps.add_callback(responses.POST, f"{BASE_URL}/positions/otc", callback=created)
+
+        ig_service.create_open_position(**position())
+        # waiting for the position update
+        assert traces == []
+
+        listener.onItemUpdate(FakeUpdate({"OPU": position_update("REF1")}))
+        assert len(traces) == 1
+        trace = traces[0]
+        assert trace.confirm_source == "stream"
+        # the confirm arrived before the deal reference
+        assert trace.intervals()["confirm"] <= 0
+        assert trace.intervals()["stream"] >= trace.intervals()["dealing"]
+
+    def test_stream_rejected(self, rsps, ig_service, stream):
+        rsps.add(
+            responses.POST,
+            f"{BASE_URL}/positions/otc",
+            headers=HEADERS,
+            json={"dealReference": "REF1"},
+        )
+        rsps.add(
+            responses.GET,
+            f"{BASE_URL}/confirms/REF1",
+            headers=HEADERS,
+            json=confirm("REF1", "REJECTED"),
+        )
+        tracer = LatencyTracer().attach(ig_service, stream)
+        traces = []
+        tracer.add_exporter(traces.append)
+
+        ig_service.create_open_position(**position())
+
+        # no position update is coming
+        assert len(traces) == 1
+        assert traces[0].deal_status == "REJECTED"
+
+    def test_max_pending(self, rsps, ig_service, stream):
+        tracer = LatencyTracer(max_pending=1).attach(ig_service, stream)
+        traces = []
+        tracer.add_exporter(traces.append)
+        for deal_reference in ("REF1", "REF2"):
+            trace = tracer.start("delete_working_order")
+            trace.mark("admitted")
+            trace.mark("sent")
+            trace.referenced(deal_reference)
+
+        assert [trace.deal_reference for trace in traces] == ["REF1"]
+        assert tracer.histogram("total").count == 0
+        assert tracer.histogram("dealing", order_type="delete_working_order").count == 1
+
+    def test_exporter_error(self, rsps, ig_service):
+        tracer = LatencyTracer().attach(ig_service)
+        traces = []
+        tracer.add_exporter(lambda trace: 1 / 0)
+        tracer.add_exporter(traces.append)
+        trace = tracer.start("update_open_position")
+        trace.referenced("REF1")
+        tracer.confirmed("REF1", confirm("REF1"), "rest")
+        assert len(traces) == 1
+        assert traces[0].epic == EPIC
+
+    def test_not_attached(self, rsps, ig_service):
+        rsps.add(
+            responses.POST,
+            f"{BASE_URL}/positions/otc",
+            headers=HEADERS,
+            json={"dealReference": "REF1"},
+        )
+        rsps.add(
+            responses.GET,
+            f"{BASE_URL}/confirms/REF1",
+            headers=HEADERS,
+            json=confirm("REF1"),
+        )
+        assert ig_service.tracer is None
+        assert ig_service.create_open_position(**position())["dealId"] == "DIAAAAREF1"
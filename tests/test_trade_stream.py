@@ -0,0 +1,114 @@
+import json
+import threading
+
+import responses
+from conftest import BASE_URL, HEADERS, FakeUpdate, confirm, position
+
+from trading_ig.streamer.trade import ConfirmStore, TradeListener
+
+"""
+unit tests for deal confirmations from the TRADE stream
+"""
+
+CONFIRMS_URL = f"{BASE_URL}/confirms/REF1"
+POSITIONS_URL = f"{BASE_URL}/positions/otc"
+
+
+class TestConfirmStore:
+    def test_get_waits(self):
+        store = ConfirmStore()
+        assert store.get("REF1", timeout=0.01) is None
+
+        timer = threading.Timer(0.05, store.put, [confirm("REF1")])
+        timer.start()
+        assert store.get("REF1", timeout=5)["dealId"] == "DIAAAAREF1"
+        timer.join()
+
+    def test_max_size(self):
+        store = ConfirmStore(max_size=2)
+        for ref in ("REF1", "REF2", "REF3"):
+            store.put(confirm(ref))
+        assert len(store) == 2
+        assert store.get("REF1") is None
+        assert store.get("REF3")["dealReference"] == "REF3"
+
+    def test_listener(self):
+        listener = TradeListener(ConfirmStore())
+        positions = []
+        listener.add_handler("OPU", positions.append)
+        listener.onItemUpdate(
+            FakeUpdate(
+                {
+                    "CONFIRMS": confirm("REF1"),
+                    "OPU": {"dealId": "DIAAAAREF1", "size": 1},
+                    "WOU": None,
+                }
+            )
+        )
+        assert listener.confirms.get("REF1")["dealStatus"] == "ACCEPTED"
+        assert positions == [{"dealId": "DIAAAAREF1", "size": 1}]
+
+    def test_failing_handler(self):
+        listener = TradeListener(ConfirmStore())
+        positions = []
+
+        def failing(update):
+            raise KeyError("epic")
+
+        listener.add_handler("OPU", failing)
+        listener.add_handler("OPU", positions.append)
+        listener.add_handler("CONFIRMS", failing)
+        listener.onItemUpdate(
+            FakeUpdate(
+                {
+                    "CONFIRMS": confirm("REF1"),
+                    "OPU": {"dealId": "DIAAAAREF1", "size": 1},
+                }
+            )
+        )
+        assert listener.confirms.get("REF1")["dealStatus"] == "ACCEPTED"
+        assert positions == [{"dealId": "DIAAAAREF1", "size": 1}]
+
+
+class TestStreamedConfirms:
+    @responses.activate
+    def test_confirm_from_stream(self, ig_service, stream):
+        listener = stream.subscribe_trade_confirms()
+        assert stream.ls_client.subscriptions[0].getItems() == ["TRADE:ABC123"]
+
+        def created(request):
+            # the confirm is streamed before the POST returns
+            listener.onItemUpdate(FakeUpdate({"CONFIRMS": confirm("REF1")}))
+            return 200, HEADERS, json.dumps({"dealReference": "REF1"})
+
+        responses.add_callback(responses.POST, POSITIONS_URL, callback=created)
+        result = ig_service.create_open_position(**position())
+
+        assert result["dealId"] == "DIAAAAREF1"
+        # no /confirms request
+        assert len(responses.calls) == 1
+
+    @responses.activate
+    def test_fallback_to_polling(self, ig_service, stream):
+        stream.subscribe_trade_confirms(timeout=0.01)
+        responses.add(
+            responses.POST,
+            POSITIONS_URL,
+            headers=HEADERS,
+            json={"dealReference": "REF1"},
+        )
+        responses.add(
+            responses.GET, CONFIRMS_URL, headers=HEADERS, json=confirm("REF1")
+        )
+
+        result = ig_service.create_open_position(**position())
+
+        assert result["dealId"] == "DIAAAAREF1"
+        assert len(responses.calls) == 2
+
+    def test_unsubscribe(self, ig_service, stream):
+        stream.subscribe_trade_confirms()
+        assert ig_service.confirms is not None
+        stream.unsubscribe_trade_confirms()
+        assert ig_service.confirms is None
+        assert stream.ls_client.subscriptions == []
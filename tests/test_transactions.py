@@ -0,0 +1,97 @@
+import json
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import responses
+from conftest import BASE_URL, HEADERS
+
+from trading_ig.rest import IGService
+
+"""
+unit tests for fetching the transaction history
+"""
+
+URL = f"{BASE_URL}/history/transactions"
+
+
+def transaction(i):
+    return {
+        "date": "2021-01-05",
+        "dateUtc": f"2021-01-05T10:00:{i:02d}",
+        "openDateUtc": f"2021-01-04T09:00:{i:02d}",
+        "instrumentName": "Spot Gold",
+        "period": "-",
+        "profitAndLoss": f"£-{i}.50",
+        "transactionType": "DEAL",
+        "reference": f"REF{i}",
+        "openLevel": "1850.5",
+        "closeLevel": "1851" if i % 2 else "-",
+        "size": "+1" if i % 2 else "-2.5",
+        "currency": "£",
+        "cashTransaction": False,
+    }
+
+
+def pages_callback(request):
+    """Serves 7 transactions, in pages of pageSize"""
+    query = parse_qs(urlparse(request.url).query)
+    page_size = int(query["pageSize"][0])
+    page = int(query.get("pageNumber", ["1"])[0])
+    transactions = [transaction(i) for i in range(7)]
+    total_pages = -(-len(transactions) // page_size)
+    body = {
+        "transactions": transactions[(page - 1) * page_size : page * page_size],
+        "metadata": {
+            "size": len(transactions),
+            "pageData": {
+                "pageNumber": page,
+                "pageSize": page_size,
+                "totalPages": total_pages,
+            },
+        },
+    }
+    return 200, HEADERS, json.dumps(body)
+
+
+class TestTransactions:
+    @responses.activate
+    def test_single_page(self):
+        responses.add_callback(responses.GET, URL, callback=pages_callback)
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        result = ig_service.fetch_transaction_history(page_size=3, page_number=2)
+
+        assert len(responses.calls) == 1
+        assert list(result["reference"]) == ["REF3", "REF4", "REF5"]
+        # untyped, as before
+        assert result["openLevel"].dtype == object
+
+    @responses.activate
+    def test_all_pages(self):
+        responses.add_callback(responses.GET, URL, callback=pages_callback)
+        ig_service = IGService("username", "password", "api_key", "DEMO")
+        result = ig_service.fetch_transaction_history(
+            page_size=2, all_pages=True, max_workers=4
+        )
+
+        assert len(responses.calls) == 4
+        assert list(result["reference"]) == [f"REF{i}" for i in range(7)]
+        assert result["openLevel"].dtype == "float64"
+        assert result["closeLevel"].isna().sum() == 4
+        assert list(result["size"][:2]) == [-2.5, 1.0]
+        assert result["profitAndLoss"][3] == -3.5
+        assert result["dateUtc"].dtype == "datetime64[ns, UTC]"
+        assert result["dateUtc"][1] == pd.Timestamp("2021-01-05T10:00:01Z")
+
+    @responses.activate
+    def test_iter_pages(self):
+        responses.add_callback(responses.GET, URL, callback=pages_callback)
+        ig_service = IGService(
+            "username", "password", "api_key", "DEMO", return_dataframe=False
+        )
+        pages = ig_service.iter_transaction_history(page_size=3)
+
+        first = next(pages)
+        assert len(responses.calls) == 1
+        assert len(first["transactions"]) == 3
+        assert [len(page["transactions"]) for page in pages] == [3, 1]
+        assert len(responses.calls) == 3
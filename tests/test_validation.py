@@ -0,0 +1,248 @@
+import json
+import time
+
+import pytest
+import responses
+from conftest import BASE_URL, HEADERS, position
+
+from trading_ig.rest import IGException
+from trading_ig.validation import (
+    MarketStore,
+    OrderValidationError,
+    OrderValidator,
+)
+
+"""
+unit tests for pre-trade validation
+"""
+
+EPIC = "CO.D.CFI.Month2.IP"
+
+# bid 8933, offer 8939, min deal size 0.25, min stop or limit distance
+# 10 points, max 75%, min guaranteed stop 10%, min trailing step 1 point
+POSITION = position(EPIC, expiry="-")
+
+
+def market(status="TRADEABLE"):
+    with open("tests/data/markets_epic.json") as file:
+        data = json.load(file)
+    data["snapshot"]["marketStatus"] = status
+    return data
+
+
+@pytest.fixture
+def rsps(rsps):
+    rsps.add(
+        responses.GET,
+        f"{BASE_URL}/markets/{EPIC}",
+        headers=HEADERS,
+        json=market(),
+    )
+    rsps.add(
+        responses.POST,
+        f"{BASE_URL}/positions/otc",
+        headers=HEADERS,
+        json={"dealReference": "REF1"},
+    )
+    rsps.add(
+        responses.GET,
+        f"{BASE_URL}/confirms/REF1",
+        headers=HEADERS,
+        json={"dealReference": "REF1", "dealStatus": "ACCEPTED"},
+    )
+    return rsps
+
+
+@pytest.fixture
+def validator(rsps, ig_service):
+    return OrderValidator(MarketStore(ig_service))
+
+
+def check_position(validator, **kwargs):
+    params = {
+        "direction": "BUY",
+        "size": 1,
+    }
+    params.update(kwargs)
+    return validator.check_open_position(EPIC, **params)
+
+
+class TestMarketStore:
+    def test_cached(self, rsps, ig_service):
+        markets = MarketStore(ig_service)
+        rules = markets.get(EPIC)
+        assert markets.get(EPIC) is rules
+        assert len(rsps.calls) == 1
+        assert rules.min_deal_size == 0.25
+        assert rules.min_stop_or_limit_distance == (10.0, "POINTS")
+        assert rules.max_stop_or_limit_distance == (75.0, "PERCENTAGE")
+        assert (rules.bid, rules.offer, rules.market_status) == (
+            8933.0,
+            8939.0,
+            "TRADEABLE",
+        )
+
+    def test_max_age(self, rsps, ig_service):
+        markets = MarketStore(ig_service, max_age=0)
+        markets.get(EPIC)
+        markets.get(EPIC)
+        assert len(rsps.calls) == 2
+
+    def test_load(self, rsps, ig_service):
+        rsps.add(
+            responses.GET,
+            f"{BASE_URL}/markets",
+            headers=HEADERS,
+            json={"marketDetails": [market("CLOSED")]},
+        )
+        markets = MarketStore(ig_service)
+        markets.load([EPIC])
+        assert EPIC in markets
+        assert markets.get(EPIC).market_status == "CLOSED"
+        assert len(rsps.calls) == 1
+
+    def test_update(self, rsps, ig_service):
+        markets = MarketStore(ig_service)
+        markets.get(EPIC)
+        markets.update(EPIC, bid="9000", offer="9006", market_status="EDITS_ONLY")
+        rules = markets.get(EPIC)
+        assert (rules.bid, rules.offer, rules.market_status) == (
+            9000.0,
+            9006.0,
+            "EDITS_ONLY",
+        )
+        markets.invalidate(EPIC)
+        assert EPIC not in markets
+
+
+class TestOrderValidator:
+    def test_valid(self, validator):
+        assert check_position(validator, stop_distance=20, limit_level=9000) == []
+
+    def test_size(self, validator):
+        assert check_position(validator, size=0.1) == [
+            "size 0.1 is below the minimum deal size 0.25"
+        ]
+
+    def test_market_status(self, validator):
+        validator.markets.get(EPIC)
+        validator.markets.update(EPIC, market_status="CLOSED")
+        assert check_position(validator) == ["market is CLOSED"]
+
+    def test_stop_and_limit_distances(self, validator):
+        assert check_position(validator, stop_distance=5, limit_distance=7000) == [
+            "stop distance 5 is below the minimum 10",
+            "limit distance 7000 is above the maximum 6704.25",
+        ]
+
+    def test_levels(self, validator):
+        # BUY deals at the offer, 8939
+        assert check_position(validator, stop_level=8935) == [
+            "stop distance 4 is below the minimum 10"
+        ]
+        assert check_position(validator, stop_level=8929) == []
+        assert check_position(validator, direction="SELL", limit_level=8940) == [
+            "limit level 8940 is on the wrong side of 8933"
+        ]
+
+    def test_guaranteed_stop(self, validator):
+        # 10% of the offer
+        assert check_position(validator, stop_distance=100, guaranteed_stop=True) == [
+            "stop distance 100 is below the minimum 893.9"
+        ]
+
+    def test_trailing_stop(self, validator):
+        assert check_position(
+            validator,
+            stop_distance=20,
+            trailing_stop=True,
+            trailing_stop_increment=0.5,
+        ) == ["trailing stop increment 0.5 is below the minimum 1"]
+
+    def test_working_order(self, validator):
+        def check(**kwargs):
+            params = {"direction": "BUY", "size": 1, "order_type": "LIMIT"}
+            params.update(kwargs)
+            return validator.check_working_order(EPIC, **params)
+
+        assert check(level=8900, stop_level=8880) == []
+        assert check(level=8900, stop_level=8895) == [
+            "stop distance 5 is below the minimum 10"
+        ]
+        assert check(level=8950) == [
+            "BUY LIMIT level 8950 is above the current price 8939"
+        ]
+        assert check(level=8900, order_type="STOP") == [
+            "BUY STOP level 8900 is below the current price 8939"
+        ]
+        assert check(direction="SELL", level=8900) == [
+            "SELL LIMIT level 8900 is below the current price 8933"
+        ]
+
+    def test_attached(self, rsps, ig_service, validator):
+        validator.attach(ig_service)
+        with pytest.raises(OrderValidationError) as excinfo:
+            ig_service.create_open_position(**dict(POSITION, size=0.1))
+        assert isinstance(excinfo.value, IGException)
+        assert excinfo.value.epic == EPIC
+        assert excinfo.value.errors == ["size 0.1 is below the minimum deal size 0.25"]
+        # only the market details were fetched, nothing was sent
+        assert [call.request.method for call in rsps.calls] == ["GET"]
+
+        confirm = ig_service.create_open_position(**POSITION)
+        assert confirm["dealStatus"] == "ACCEPTED"
+        assert len(rsps.calls) == 3
+
+    def test_market_reopens(self, rsps, validator):
+        # cached while the market was closed
+        rsps.replace(
+            responses.GET,
+            f"{BASE_URL}/markets/{EPIC}",
+            headers=HEADERS,
+            json=market("CLOSED"),
+        )
+        rules = validator.markets.get(EPIC)
+        assert check_position(validator) == ["market is CLOSED"]
+
+        # a stale status is no reason to refuse an order
+        rules.status_time -= validator.markets.snapshot_max_age + 1
+        assert check_position(validator) == []
+        # and a streamed status is used again
+        validator.markets.update(EPIC, market_status="TRADEABLE")
+        assert check_position(validator) == []
+        assert len(rsps.calls) == 1
+
+    def test_stale_prices(self, validator):
+        rules = validator.markets.get(EPIC)
+        validator.markets.update(EPIC, bid=8794, offer=8800)
+        assert validator.check_working_order(
+            EPIC, direction="BUY", size=1, level=8900, order_type="LIMIT"
+        ) == ["BUY LIMIT level 8900 is above the current price 8800"]
+        assert check_position(validator, stop_level=8795) == [
+            "stop distance 5 is below the minimum 10"
+        ]
+
+        # stale prices aren't used for the side and level checks
+        rules.price_time -= validator.markets.snapshot_max_age + 1
+        assert (
+            validator.check_working_order(
+                EPIC, direction="BUY", size=1, level=8900, order_type="LIMIT"
+            )
+            == []
+        )
+        assert check_position(validator, stop_level=8795) == []
+        # distances that don't need a price are still checked
+        assert check_position(validator, stop_distance=5) == [
+            "stop distance 5 is below the minimum 10"
+        ]
+
+    @pytest.mark.slow
+    def test_benchmark(self, validator):
+        validator.markets.get(EPIC)
+        count = 100_000
+        start = time.perf_counter()
+        for _ in range(count):
+            check_position(validator, stop_level=8900, limit_distance=50)
+        per_check = (time.perf_counter() - start) / count
+        print(f"\nvalidate: {per_check * 1e6:.1f}us per order")
+        assert per_check < 1e-4
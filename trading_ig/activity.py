@@ -0,0 +1,256 @@
+"""
+Incremental sync of account activity into a local store
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+class ActivityCursor:
+    """
+    The date of the latest activity stored, and the keys (see activity_key())
+    of the activities at that date, kept per account in an activity_cursor
+    table. Each sync only needs activity from the cursor date onwards, and
+    anything at that date with a key in the cursor is already stored.
+
+    Used by ActivitySync and Ledger, which provide _conn, _lock, account and
+    lookback
+    """
+
+    def _create_cursor_table(self):
+        # called with the lock held, inside a transaction
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS activity_cursor (
+                account TEXT PRIMARY KEY,
+                date TEXT NOT NULL,
+                keys TEXT NOT NULL
+            )"""
+        )
+
+    def cursor(self):
+        """
+        Returns the date of the latest activity synced, and the keys (see
+        activity_key()) of the activities at that date
+        :return: date (None if never synced) and keys
+        :rtype: tuple of (str, set)
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT date, keys FROM activity_cursor WHERE account = ?",
+                (self.account,),
+            ).fetchone()
+        if row is None:
+            return None, set()
+        return row[0], set(json.loads(row[1]))
+
+    def _cursor_from_date(self, cursor_date):
+        """The date to fetch activity from: the cursor date, or lookback
+        before now if never synced"""
+        if cursor_date is None:
+            return datetime.now(timezone.utc) - self.lookback
+        return datetime.strptime(cursor_date, TIME_FORMAT).replace(tzinfo=timezone.utc)
+
+    def _unseen(self, activities, cursor_date, seen):
+        """Returns the activities not already stored, oldest first"""
+        new = []
+        for activity in activities:
+            date = activity["date"][:19]
+            if cursor_date is not None and (
+                date < cursor_date
+                or (date == cursor_date and activity_key(activity) in seen)
+            ):
+                continue
+            new.append(activity)
+        new.sort(key=lambda activity: activity["date"])
+        return new
+
+    def _advance_cursor(self, new, cursor_date, seen):
+        """Moves the cursor past new activities, once they are stored"""
+        if not new:
+            return
+        last_date = new[-1]["date"][:19]
+        if last_date != cursor_date:
+            seen = set()
+        seen.update(activity_key(a) for a in new if a["date"][:19] == last_date)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO activity_cursor VALUES (?, ?, ?)",
+                (self.account, last_date, json.dumps(sorted(seen))),
+            )
+
+    def _reset_cursor(self):
+        # called with the lock held, inside a transaction
+        self._conn.execute(
+            "DELETE FROM activity_cursor WHERE account = ?", (self.account,)
+        )
+
+
+class ActivitySync(ActivityCursor):
+    """
+    Keeps a local copy of the account activity history (v3), in SQLite. The
+    date of the latest activity seen, and the keys of the activities at that
+    date, are stored as a cursor. Each sync() only asks IG for activity from
+    the cursor onwards, and skips anything already seen, so frequent syncs
+    are cheap however long the history gets.
+
+    IG dates activity to the second, so a sync always starts from the cursor
+    date itself; the keys are what stops activities at that date being
+    stored twice. A deal can have several activities in the same second (eg
+    an amend and a stop change), so activities are keyed on their content,
+    not just their deal ID
+    """
+
+    def __init__(
+        self,
+        ig_service,
+        path="activity.sqlite",
+        detailed=True,
+        lookback=timedelta(days=1),
+    ):
+        """
+        :param ig_service: service used to fetch activity
+        :type ig_service: IGService
+        :param path: SQLite database file. Use ':memory:' for a temporary store
+        :type path: str
+        :param detailed: fetch activity details (actions, size, levels...)
+        :type detailed: bool
+        :param lookback: how far back the first sync goes
+        :type lookback: timedelta
+        """
+        self.ig_service = ig_service
+        self.path = path
+        self.detailed = detailed
+        self.lookback = lookback
+        self._lock = Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._create_tables()
+
+    def _create_tables(self):
+        with self._lock, self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS activities (
+                    account TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    deal_id TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    epic TEXT,
+                    type TEXT,
+                    status TEXT,
+                    activity TEXT NOT NULL,
+                    PRIMARY KEY (account, date, deal_id, key)
+                ) WITHOUT ROWID"""
+            )
+            self._create_cursor_table()
+
+    def close(self):
+        self._conn.close()
+
+    @property
+    def account(self):
+        return self.ig_service.ACC_NUMBER or ""
+
+    def sync(self, to_date=None, page_size=50, session=None):
+        """
+        Fetches activity since the last sync (or since lookback, the first
+        time), and stores anything new
+
+        :param to_date: end date and time. Optional, default now
+        :type to_date: datetime
+        :param page_size: page size (min: 10, max: 500). Default 50
+        :type page_size: int
+        :param session: session object. Optional
+        :type session: Session
+        :return: the new activities, oldest first
+        :rtype: list of dict
+        """
+        cursor_date, seen = self.cursor()
+        data = self.ig_service._fetch_account_activity_raw(
+            self._cursor_from_date(cursor_date),
+            to_date,
+            self.detailed,
+            None,
+            None,
+            page_size,
+            session,
+        )
+        new = self._unseen(data["activities"], cursor_date, seen)
+        self.write(new)
+        self._advance_cursor(new, cursor_date, seen)
+        logger.info(
+            f"ActivitySync {self.account}: {len(new)} new activities, "
+            f"{len(data['activities']) - len(new)} already stored"
+        )
+        return new
+
+    def write(self, activities):
+        """Stores raw (v3) activities, ignoring any already stored"""
+        rows = [
+            (
+                self.account,
+                activity["date"][:19],
+                activity["dealId"],
+                activity_key(activity),
+                activity.get("epic"),
+                activity.get("type"),
+                activity.get("status"),
+                json.dumps(activity),
+            )
+            for activity in activities
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO activities VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def read(self, from_date=None, to_date=None):
+        """
+        Returns stored activities, oldest first, without fetching anything
+        :param from_date: start date and time, inclusive. Optional
+        :type from_date: datetime or str
+        :param to_date: end date and time, inclusive. Optional
+        :type to_date: datetime or str
+        :return: raw (v3) activities
+        :rtype: list of dict
+        """
+        where, args = "account = ?", [self.account]
+        if from_date is not None:
+            where += " AND date >= ?"
+            args.append(_date_string(from_date))
+        if to_date is not None:
+            where += " AND date <= ?"
+            args.append(_date_string(to_date))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT activity FROM activities WHERE {where} ORDER BY date, deal_id",
+                args,
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def reset(self):
+        """Removes stored activities and the cursor, for the current account"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM activities WHERE account = ?", (self.account,)
+            )
+            self._reset_cursor()
+
+
+def activity_key(activity):
+    """Returns a key for an activity, from its content"""
+    text = json.dumps(activity, sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def _date_string(dt):
+    if isinstance(dt, str):
+        return dt[:19]
+    return dt.strftime(TIME_FORMAT)
@@ -0,0 +1,189 @@
+"""
+Conversions between the time and resolution formats used by IG and pandas.
+Lookup tables are built once, on import, and timestamps can be parsed a whole
+array at a time
+"""
+
+import logging
+from datetime import datetime
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except ImportError:
+    _HAS_NUMPY = False
+else:
+    _HAS_NUMPY = True
+
+try:
+    import pandas as pd
+    from pandas.tseries.frequencies import to_offset
+except ImportError:
+    _HAS_PANDAS = False
+else:
+    _HAS_PANDAS = True
+
+DATE_FORMATS = {1: "%Y:%m:%d-%H:%M:%S", 2: "%Y/%m/%d %H:%M:%S", 3: "%Y/%m/%d %H:%M:%S"}
+
+# pandas offset alias -> IG resolution
+RESOLUTIONS = {
+    "1s": "SECOND",
+    "1Min": "MINUTE",
+    "2Min": "MINUTE_2",
+    "3Min": "MINUTE_3",
+    "5Min": "MINUTE_5",
+    "10Min": "MINUTE_10",
+    "15Min": "MINUTE_15",
+    "30Min": "MINUTE_30",
+    "1h": "HOUR",
+    "2h": "HOUR_2",
+    "3h": "HOUR_3",
+    "4h": "HOUR_4",
+    "D": "DAY",
+    "W": "WEEK",
+    "ME": "MONTH",
+}
+IG_RESOLUTIONS = frozenset(RESOLUTIONS.values())
+
+# IG resolution -> bar length, in seconds. Months are taken as 31 days
+RESOLUTION_SECONDS = {
+    "SECOND": 1,
+    "MINUTE": 60,
+    "MINUTE_2": 120,
+    "MINUTE_3": 180,
+    "MINUTE_5": 300,
+    "MINUTE_10": 600,
+    "MINUTE_15": 900,
+    "MINUTE_30": 1800,
+    "HOUR": 3600,
+    "HOUR_2": 7200,
+    "HOUR_3": 10800,
+    "HOUR_4": 14400,
+    "DAY": 86400,
+    "WEEK": 604800,
+    "MONTH": 2678400,
+}
+
+
+def _alias_key(alias):
+    # '1Min', '1min' and 'min' are the same offset
+    key = alias.lower()
+    if key.startswith("1") and not key[1:2].isdigit():
+        key = key[1:]
+    return key
+
+
+# RESOLUTIONS by _alias_key(), so the usual aliases resolve without pandas
+_ALIAS_RESOLUTIONS = {
+    _alias_key(alias): resolution for alias, resolution in RESOLUTIONS.items()
+}
+
+if _HAS_PANDAS:
+    _OFFSET_RESOLUTIONS = {
+        to_offset(alias): resolution for alias, resolution in RESOLUTIONS.items()
+    }
+
+# length of the fixed width IG timestamps, eg 2020/09/01 05:00:00
+TIMESTAMP_WIDTH = 19
+
+
+@lru_cache(maxsize=256)
+def _resolution_from_alias(alias):
+    # pandas 3.0 removes the 'H' and 'M' frequency aliases, in favour of
+    # 'h' and 'ME' so normalise them before calling to_offset
+    if isinstance(alias, str):
+        if alias.endswith("H"):
+            alias = alias[:-1] + "h"
+        elif alias in ("M", "1M"):
+            alias = "ME"
+        resolution = _ALIAS_RESOLUTIONS.get(_alias_key(alias))
+        if resolution is not None:
+            return resolution
+    if not _HAS_PANDAS:
+        return None
+    return _OFFSET_RESOLUTIONS.get(to_offset(alias))
+
+
+def conv_resol(resolution):
+    """Returns a string for resolution (from a Pandas). IG resolutions, eg
+    'MINUTE_5', are returned unchanged. The aliases in RESOLUTIONS are
+    converted without pandas; other spellings of the same offsets, eg
+    '60min', need pandas"""
+    if resolution in IG_RESOLUTIONS:
+        return resolution
+    ig_resolution = _resolution_from_alias(resolution)
+    if ig_resolution is None:
+        logger.warning(f"conv_resol returns '{resolution}'")
+        return resolution
+    return ig_resolution
+
+
+def parse_timestamp(timestamp):
+    """
+    Parses a single timestamp string, in any of the IG formats (2020:09:01-05:00:00,
+    2020/09/01 05:00:00 or 2020-09-01T05:00:00), or just the date part of one.
+    Anything else is passed to pandas, if installed
+    :param timestamp: timestamp
+    :type timestamp: str
+    :rtype: datetime.datetime
+    """
+    text = timestamp
+    if len(text) >= 10 and text[4] in ":/" and text[7] == text[4]:
+        date = f"{text[:4]}-{text[5:7]}-{text[8:10]}"
+        text = f"{date}T{text[11:]}" if len(text) > 10 else date
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        if _HAS_PANDAS:
+            return pd.to_datetime(timestamp)
+        raise
+
+
+def conv_datetime(dt, version=2):
+    """Converts dt to string like
+    version 1 = 2014:12:15-00:00:00
+    version 2 = 2014/12/15 00:00:00
+    version 3 = 2014/12/15 00:00:00
+    """
+    try:
+        if isinstance(dt, str):
+            dt = parse_timestamp(dt)
+
+        fmt = DATE_FORMATS[int(version)]
+        return dt.strftime(fmt)
+    except (ValueError, TypeError):
+        logger.warning(f"conv_datetime returns {dt}")
+        return dt
+
+
+def parse_timestamps(times):
+    """
+    Converts timestamp strings, in any of the fixed width IG formats
+    (2020:09:01-05:00:00, 2020/09/01 05:00:00 or 2020-09-01T05:00:00), to
+    numpy.datetime64, without pandas. The separators are rewritten a column at a
+    time to get ISO 8601, which numpy parses natively, so this is several times
+    faster than pandas.to_datetime() with a format
+    :param times: timestamps
+    :type times: numpy.ndarray or list of str
+    :return: timestamps, to the second
+    :rtype: numpy.ndarray of datetime64[s]
+    """
+    times = np.ascontiguousarray(times)
+    if times.dtype.kind == "O":
+        times = times.astype(str)
+    if len(times) == 0:
+        return np.array([], dtype="datetime64[s]")
+    if times.dtype.kind == "U" and times.dtype.itemsize == 4 * TIMESTAMP_WIDTH:
+        # each character is a uint32, and the timestamps are ASCII, so keeping
+        # the low byte is a much quicker encode than astype('S19')
+        chars = times.view(np.uint32).reshape(-1, TIMESTAMP_WIDTH).astype(np.uint8)
+    elif times.dtype.kind == "S" and times.dtype.itemsize == TIMESTAMP_WIDTH:
+        chars = times.view(np.uint8).reshape(-1, TIMESTAMP_WIDTH).copy()
+    else:
+        raise ValueError(f"Expected {TIMESTAMP_WIDTH} character timestamps")
+    chars[:, [4, 7]] = ord("-")
+    chars[:, 10] = ord("T")
+    chars[:, [13, 16]] = ord(":")
+    return chars.view(f"S{TIMESTAMP_WIDTH}").ravel().astype("datetime64[s]")
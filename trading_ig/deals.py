@@ -0,0 +1,123 @@
+"""
+Deal tickets, for dealing without waiting for each confirmation, and reports
+of bulk dealing operations
+"""
+
+from concurrent.futures import Future, wait
+from dataclasses import dataclass
+
+
+class DealTicket(Future):
+    """
+    The pending confirmation of a deal that IG has accepted for processing.
+    Returned by the dealing methods of IGService when called with
+    block=False, as soon as IG has replied with a deal reference. result()
+    waits for, and returns, the deal confirmation - as the dealing method
+    would have returned with block=True.
+
+    As a concurrent.futures.Future, tickets can be waited on together with
+    concurrent.futures.wait(), or awaited with asyncio.wrap_future()
+    """
+
+    def __init__(self, deal_reference):
+        super().__init__()
+        self.deal_reference = deal_reference
+
+    def __repr__(self):
+        return f"DealTicket({self.deal_reference!r}, {self._state.lower()})"
+
+    def confirm(self, timeout=None):
+        """Waits for the deal confirmation, same as result()"""
+        return self.result(timeout)
+
+    def resolve(self, fetch_confirm):
+        """Sets the result to fetch_confirm(deal_reference), or its exception"""
+        if not self.set_running_or_notify_cancel():
+            return
+        try:
+            self.set_result(fetch_confirm(self.deal_reference))
+        except Exception as ex:
+            self.set_exception(ex)
+
+
+@dataclass
+class DealResult:
+    """
+    The outcome of one deal in a bulk operation. request holds the keyword
+    arguments the dealing method was called with. If the request failed,
+    error is set; otherwise confirm holds the deal confirmation, which may
+    still have been rejected
+    """
+
+    request: dict
+    deal_reference: str = None
+    confirm: dict = None
+    error: Exception = None
+
+    @property
+    def accepted(self):
+        return self.confirm is not None and self.confirm.get("dealStatus") == "ACCEPTED"
+
+
+class DealReport:
+    """The results of a bulk dealing operation, in request order"""
+
+    def __init__(self, results):
+        self.results = list(results)
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self):
+        return len(self.results)
+
+    def __getitem__(self, index):
+        return self.results[index]
+
+    def __repr__(self):
+        return (
+            f"DealReport({len(self.accepted)} accepted, {len(self.rejected)} "
+            f"rejected, {len(self.failed)} failed)"
+        )
+
+    @property
+    def accepted(self):
+        return [result for result in self.results if result.accepted]
+
+    @property
+    def rejected(self):
+        """Deals that were confirmed, but not accepted"""
+        return [
+            result
+            for result in self.results
+            if result.confirm is not None and not result.accepted
+        ]
+
+    @property
+    def failed(self):
+        """Deals that were refused, or whose confirm couldn't be fetched"""
+        return [result for result in self.results if result.error is not None]
+
+
+def deal_report(requests, tickets):
+    """
+    Waits for the confirms of a batch of deals, and reports on them
+    :param requests: keyword arguments of each deal
+    :type requests: list of dict
+    :param tickets: a (DealTicket, exception) tuple for each deal, as
+        returned by utils.map_concurrently()
+    :type tickets: list of tuple
+    :rtype: DealReport
+    """
+    wait([ticket for ticket, _ in tickets if ticket is not None])
+    results = []
+    for request, (ticket, ex) in zip(requests, tickets):
+        if ex is not None:
+            results.append(DealResult(request, error=ex))
+        elif ticket.exception() is not None:
+            results.append(
+                DealResult(request, ticket.deal_reference, error=ticket.exception())
+            )
+        else:
+            results.append(DealResult(request, ticket.deal_reference, ticket.result()))
+    return DealReport(results)
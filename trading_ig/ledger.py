@@ -0,0 +1,444 @@
+"""
+Local, indexed ledger of transactions and account activity, for reporting
+without going back to IG
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+
+from .activity import TIME_FORMAT, ActivityCursor, _date_string, activity_key
+from .schemas import _NOT_AMOUNT
+from .utils import _HAS_PANDAS
+
+if _HAS_PANDAS:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# transaction types that move money in or out, rather than being charged
+FUNDING_TYPES = ("DEPO", "WITH")
+
+# activity action types that open and (partly) close a position
+OPEN_ACTIONS = ("POSITION_OPENED",)
+CLOSE_ACTIONS = ("POSITION_CLOSED", "POSITION_PARTIALLY_CLOSED")
+
+
+def parse_amount(text):
+    """Converts an IG amount, eg '£-1.23' or '1,234.50', to float. Returns
+    None for missing values"""
+    if text is None or isinstance(text, (int, float)):
+        return text
+    try:
+        return float(_NOT_AMOUNT.sub("", text))
+    except ValueError:
+        return None
+
+
+def _transaction_key(transaction):
+    # transactions have no ID of their own, so they are keyed on their content
+    text = json.dumps(transaction, sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class Ledger(ActivityCursor):
+    """
+    A local copy of the transaction history (v2) and account activity (v3),
+    in SQLite, indexed by date, epic, deal ID and transaction type. sync()
+    fetches only what is newer than the latest record stored, and everything
+    else - P&L, open/close pairs, fees - is answered from the local tables,
+    without spending any non-trading allowance.
+
+    Transactions only carry the instrument name, so their epic is looked up
+    from the detailed activities with the same market name, once both have
+    been synced. Activity is synced from a cursor, as with ActivitySync
+    """
+
+    def __init__(self, ig_service, path="ledger.sqlite", lookback=timedelta(days=30)):
+        """
+        :param ig_service: service used to fetch transactions and activity
+        :type ig_service: IGService
+        :param path: SQLite database file. Use ':memory:' for a temporary store
+        :type path: str
+        :param lookback: how far back the first sync goes
+        :type lookback: timedelta
+        """
+        self.ig_service = ig_service
+        self.path = path
+        self.lookback = lookback
+        self._lock = Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._create_tables()
+
+    def _create_tables(self):
+        with self._lock, self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS transactions (
+                    account TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    open_date TEXT,
+                    reference TEXT,
+                    transaction_type TEXT,
+                    instrument_name TEXT,
+                    epic TEXT,
+                    size REAL,
+                    open_level REAL,
+                    close_level REAL,
+                    profit_and_loss REAL,
+                    currency TEXT,
+                    cash_transaction INTEGER,
+                    transaction_json TEXT NOT NULL,
+                    PRIMARY KEY (account, key)
+                ) WITHOUT ROWID"""
+            )
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS activities (
+                    account TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    deal_id TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    epic TEXT,
+                    market_name TEXT,
+                    type TEXT,
+                    status TEXT,
+                    direction TEXT,
+                    size REAL,
+                    level REAL,
+                    activity_json TEXT NOT NULL,
+                    PRIMARY KEY (account, date, deal_id, key)
+                ) WITHOUT ROWID"""
+            )
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS actions (
+                    account TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    deal_id TEXT NOT NULL,
+                    activity_key TEXT NOT NULL,
+                    action_type TEXT NOT NULL,
+                    affected_deal_id TEXT NOT NULL,
+                    PRIMARY KEY (account, activity_key, action_type, affected_deal_id)
+                ) WITHOUT ROWID"""
+            )
+            self._create_cursor_table()
+            for table, column in (
+                ("transactions", "date"),
+                ("transactions", "epic"),
+                ("transactions", "reference"),
+                ("transactions", "transaction_type"),
+                ("activities", "date"),
+                ("activities", "epic"),
+                ("activities", "deal_id"),
+                ("activities", "market_name"),
+                ("actions", "affected_deal_id"),
+            ):
+                self._conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS {table}_{column} "
+                    f"ON {table} (account, {column})"
+                )
+
+    def close(self):
+        self._conn.close()
+
+    @property
+    def account(self):
+        return self.ig_service.ACC_NUMBER or ""
+
+    def _latest(self, table):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT MAX(date) FROM {table} WHERE account = ?", (self.account,)
+            ).fetchone()
+        if row[0] is None:
+            return datetime.now(timezone.utc) - self.lookback
+        return datetime.strptime(row[0], TIME_FORMAT).replace(tzinfo=timezone.utc)
+
+    def sync(self, to_date=None, max_workers=1, session=None):
+        """
+        Fetches transactions and activity newer than the latest stored (or
+        since lookback, the first time), and stores them. Records at the
+        latest date are fetched again, and ignored if already stored
+
+        :param to_date: end date and time. Optional, default now
+        :type to_date: datetime
+        :param max_workers: transaction pages fetched at a time, after the first
+        :type max_workers: int
+        :param session: session object. Optional
+        :type session: Session
+        :return: number of new transactions and of new activities stored
+        :rtype: tuple of (int, int)
+        """
+        to_date = to_date or datetime.now(timezone.utc)
+        new_activities = self.sync_activities(to_date, session)
+        new_transactions = self.sync_transactions(to_date, max_workers, session)
+        logger.info(
+            f"Ledger {self.account}: {new_transactions} new transactions, "
+            f"{new_activities} new activities"
+        )
+        return new_transactions, new_activities
+
+    def sync_transactions(self, to_date=None, max_workers=1, session=None):
+        """Fetches and stores transactions newer than the latest stored.
+        Returns the number of new transactions"""
+        to_date = to_date or datetime.now(timezone.utc)
+        params = self.ig_service._transaction_params(
+            None,
+            _date_string(self._latest("transactions")),
+            _date_string(to_date),
+            None,
+            500,
+            None,
+        )
+        count = 0
+        for page in self.ig_service._transaction_pages(params, session, max_workers):
+            count += self.add_transactions(page["transactions"])
+        return count
+
+    def sync_activities(self, to_date=None, session=None):
+        """Fetches and stores detailed activity since the cursor (see
+        ActivityCursor). Returns the number of new activities"""
+        cursor_date, seen = self.cursor()
+        data = self.ig_service._fetch_account_activity_raw(
+            self._cursor_from_date(cursor_date), to_date, True, None, None, 500, session
+        )
+        new = self._unseen(data["activities"], cursor_date, seen)
+        count = self.add_activities(new)
+        self._advance_cursor(new, cursor_date, seen)
+        return count
+
+    def add_transactions(self, transactions):
+        """
+        Stores raw (v2) transactions, as returned by fetch_transaction_history()
+        with return_dataframe=False, ignoring any already stored
+        :return: number of new transactions
+        :rtype: int
+        """
+        rows = [
+            (
+                self.account,
+                _transaction_key(transaction),
+                transaction["dateUtc"][:19],
+                (transaction.get("openDateUtc") or "")[:19] or None,
+                transaction.get("reference"),
+                transaction.get("transactionType"),
+                transaction.get("instrumentName"),
+                parse_amount(transaction.get("size")),
+                parse_amount(transaction.get("openLevel")),
+                parse_amount(transaction.get("closeLevel")),
+                parse_amount(transaction.get("profitAndLoss")),
+                transaction.get("currency"),
+                transaction.get("cashTransaction"),
+                json.dumps(transaction),
+            )
+            for transaction in transactions
+        ]
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                """INSERT OR IGNORE INTO transactions VALUES
+                (?, ?, ?, ?, ?, ?, ?, NULL, ?, ?, ?, ?, ?, ?, ?)""",
+                rows,
+            )
+            count = self._conn.total_changes - before
+            self._update_epics()
+        return count
+
+    def add_activities(self, activities):
+        """
+        Stores raw (v3) activities, as returned by fetch_account_activity()
+        with return_dataframe=False, ignoring any already stored. Open/close
+        pairing needs detailed activities
+        :return: number of new activities
+        :rtype: int
+        """
+        rows = []
+        actions = []
+        for activity in activities:
+            date = activity["date"][:19]
+            details = activity.get("details") or {}
+            # a deal can have several activities in the same second
+            key = activity_key(activity)
+            rows.append(
+                (
+                    self.account,
+                    date,
+                    activity["dealId"],
+                    key,
+                    activity.get("epic"),
+                    details.get("marketName"),
+                    activity.get("type"),
+                    activity.get("status"),
+                    details.get("direction"),
+                    details.get("size"),
+                    details.get("level"),
+                    json.dumps(activity),
+                )
+            )
+            actions.extend(
+                (
+                    self.account,
+                    date,
+                    activity["dealId"],
+                    key,
+                    action["actionType"],
+                    action["affectedDealId"],
+                )
+                for action in details.get("actions") or []
+            )
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO activities VALUES "
+                "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            count = self._conn.total_changes - before
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO actions VALUES (?, ?, ?, ?, ?, ?)", actions
+            )
+            self._update_epics()
+        return count
+
+    def _update_epics(self):
+        # called with the lock held, inside a transaction
+        self._conn.execute(
+            """UPDATE transactions SET epic = (
+                SELECT a.epic FROM activities a
+                WHERE a.account = transactions.account
+                AND a.market_name = transactions.instrument_name
+                AND a.epic IS NOT NULL LIMIT 1
+            ) WHERE account = ? AND epic IS NULL""",
+            (self.account,),
+        )
+
+    def _query(self, sql, args):
+        with self._lock:
+            cursor = self._conn.execute(sql, args)
+            columns = [col[0] for col in cursor.description]
+            rows = cursor.fetchall()
+        if self.ig_service.return_dataframe:
+            return pd.DataFrame.from_records(rows, columns=columns)
+        return [dict(zip(columns, row)) for row in rows]
+
+    def _where(self, from_date, to_date, prefix=""):
+        where, args = f"{prefix}account = ?", [self.account]
+        if from_date is not None:
+            where += f" AND {prefix}date >= ?"
+            args.append(_date_string(from_date))
+        if to_date is not None:
+            where += f" AND {prefix}date <= ?"
+            args.append(_date_string(to_date))
+        return where, args
+
+    def transactions(self, from_date=None, to_date=None, epic=None, trans_type=None):
+        """
+        Returns stored transactions, oldest first
+        :param from_date: start date and time (UTC), inclusive. Optional
+        :type from_date: datetime or str
+        :param to_date: end date and time (UTC), inclusive. Optional
+        :type to_date: datetime or str
+        :param epic: only transactions for this epic. Optional
+        :type epic: str
+        :param trans_type: only transactions of this type, eg 'DEAL'. Optional
+        :type trans_type: str
+        :return: Pandas DataFrame if configured, otherwise list of dict
+        """
+        where, args = self._where(from_date, to_date)
+        if epic is not None:
+            where += " AND epic = ?"
+            args.append(epic)
+        if trans_type is not None:
+            where += " AND transaction_type = ?"
+            args.append(trans_type)
+        return self._query(
+            f"""SELECT date, open_date, reference, transaction_type, instrument_name,
+                epic, size, open_level, close_level, profit_and_loss, currency,
+                cash_transaction
+            FROM transactions WHERE {where} ORDER BY date, reference""",
+            args,
+        )
+
+    def pnl_by_instrument_and_day(self, from_date=None, to_date=None):
+        """
+        Returns the realised P&L of deals, summed by instrument and (UTC) day
+        :return: day, instrument_name, epic, currency, deals, profit_and_loss.
+            Pandas DataFrame if configured, otherwise list of dict
+        """
+        where, args = self._where(from_date, to_date)
+        return self._query(
+            f"""SELECT substr(date, 1, 10) AS day, instrument_name, epic, currency,
+                COUNT(*) AS deals, SUM(profit_and_loss) AS profit_and_loss
+            FROM transactions WHERE {where} AND transaction_type = 'DEAL'
+            GROUP BY day, instrument_name, epic, currency
+            ORDER BY day, instrument_name""",
+            args,
+        )
+
+    def fees(self, from_date=None, to_date=None, exclude=FUNDING_TYPES):
+        """
+        Returns charges - funding, commission, guaranteed stop premiums and so
+        on - summed by instrument and transaction type. These are the
+        transactions that are neither deals nor of a type in exclude
+        :param exclude: transaction types that are not fees
+        :type exclude: tuple of str
+        :return: instrument_name, epic, transaction_type, currency, count,
+            amount. Pandas DataFrame if configured, otherwise list of dict
+        """
+        where, args = self._where(from_date, to_date)
+        excluded = ("DEAL",) + tuple(exclude)
+        where += f" AND transaction_type NOT IN ({', '.join('?' * len(excluded))})"
+        args.extend(excluded)
+        return self._query(
+            f"""SELECT instrument_name, epic, transaction_type, currency,
+                COUNT(*) AS count, SUM(profit_and_loss) AS amount
+            FROM transactions WHERE {where}
+            GROUP BY instrument_name, epic, transaction_type, currency
+            ORDER BY instrument_name, transaction_type""",
+            args,
+        )
+
+    def round_trips(self, from_date=None, to_date=None, epic=None):
+        """
+        Pairs each position opened in the range with the activity that
+        closed it, from the actions of detailed activities. A position
+        closed in several parts gives one row per part, and a position still
+        open has no close columns
+        :return: deal_id, epic, direction, size, open_date, open_level,
+            close_date, close_size, close_level. Pandas DataFrame if
+            configured, otherwise list of dict
+        """
+        where, args = self._where(from_date, to_date, prefix="o.")
+        if epic is not None:
+            where += " AND oa.epic = ?"
+            args.append(epic)
+        open_types = ", ".join(f"'{t}'" for t in OPEN_ACTIONS)
+        close_types = ", ".join(f"'{t}'" for t in CLOSE_ACTIONS)
+        return self._query(
+            f"""SELECT o.affected_deal_id AS deal_id, oa.epic, oa.direction,
+                oa.size, o.date AS open_date, oa.level AS open_level,
+                c.date AS close_date, ca.size AS close_size,
+                ca.level AS close_level
+            FROM actions o
+            JOIN activities oa ON oa.account = o.account AND oa.date = o.date
+                AND oa.deal_id = o.deal_id AND oa.key = o.activity_key
+            LEFT JOIN actions c ON c.account = o.account
+                AND c.affected_deal_id = o.affected_deal_id
+                AND c.action_type IN ({close_types})
+            LEFT JOIN activities ca ON ca.account = c.account AND ca.date = c.date
+                AND ca.deal_id = c.deal_id AND ca.key = c.activity_key
+            WHERE {where} AND o.action_type IN ({open_types})
+            ORDER BY o.date, o.affected_deal_id, c.date""",
+            args,
+        )
+
+    def reset(self):
+        """Removes everything stored, for the current account"""
+        with self._lock, self._conn:
+            for table in ("transactions", "activities", "actions"):
+                self._conn.execute(
+                    f"DELETE FROM {table} WHERE account = ?", (self.account,)
+                )
+            self._reset_cursor()
@@ -0,0 +1,124 @@
+"""
+Splits large historical price requests into chunks that IG will accept
+"""
+
+import logging
+from datetime import datetime, timedelta, timezone
+
+from .conversions import RESOLUTION_SECONDS, conv_resol
+from .store import TIME_FORMAT, to_utc_string
+
+logger = logging.getLogger(__name__)
+
+# maximum number of bars requested in one go
+DEFAULT_MAX_POINTS = 5000
+
+
+def _parse(utc_string):
+    return datetime.strptime(utc_string, TIME_FORMAT).replace(tzinfo=timezone.utc)
+
+
+def resolution_seconds(resolution):
+    """
+    Returns the length of a bar, in seconds
+    :param resolution: IG resolution (eg 'MINUTE_5') or pandas style (eg '5Min')
+    :type resolution: str
+    :rtype: int
+    """
+    try:
+        return RESOLUTION_SECONDS[conv_resol(resolution)]
+    except KeyError:
+        raise ValueError(f"Unsupported resolution '{resolution}'")
+
+
+def plan_chunks(start_date, end_date, resolution, max_points=DEFAULT_MAX_POINTS):
+    """
+    Splits a date range into chunks of at most max_points bars each. The first
+    chunk starts on a bar boundary (for resolutions up to a day), and each
+    chunk ends on the first bar of the next, so that nothing is lost if IG
+    treats the end of a range as exclusive. Chunks are in date order
+
+    :param start_date: range start, UTC
+    :type start_date: datetime or str
+    :param end_date: range end, UTC
+    :type end_date: datetime or str
+    :param resolution: IG resolution (eg 'MINUTE_5') or pandas style (eg '5Min')
+    :type resolution: str
+    :param max_points: maximum number of bars in a chunk
+    :type max_points: int
+    :return: (start, end) of each chunk, in the v3 UTC format
+    :rtype: list of (str, str) tuples
+    """
+    if max_points < 2:
+        raise ValueError("max_points must be at least 2")
+    step = resolution_seconds(resolution)
+    start = _parse(to_utc_string(start_date))
+    end = _parse(to_utc_string(end_date))
+    if end < start:
+        raise ValueError(f"end date {end_date} is before start date {start_date}")
+    if step <= RESOLUTION_SECONDS["DAY"]:
+        start -= timedelta(seconds=int(start.timestamp()) % step)
+
+    chunk = timedelta(seconds=step * (max_points - 1))
+    chunks = []
+    cursor = start
+    while True:
+        chunk_end = min(cursor + chunk, end)
+        chunks.append((cursor.strftime(TIME_FORMAT), chunk_end.strftime(TIME_FORMAT)))
+        if chunk_end >= end:
+            break
+        cursor = chunk_end
+    return chunks
+
+
+def estimate_points(chunks, resolution):
+    """Returns the maximum number of bars the chunks can contain"""
+    step = resolution_seconds(resolution)
+    points = 0
+    for start, end in chunks:
+        delta = _parse(end) - _parse(start)
+        points += int(delta.total_seconds()) // step + 1
+    return points
+
+
+def stitch_chunks(chunks):
+    """
+    Joins the raw (v3) prices for consecutive chunks, dropping the bars that
+    appear in two chunks where they meet
+    :param chunks: raw prices for each chunk, in date order
+    :type chunks: list of list of dict
+    :rtype: list of dict
+    """
+    prices = []
+    last = None
+    for chunk in chunks:
+        for bar in chunk:
+            if last is None or bar["snapshotTimeUTC"] > last:
+                prices.append(bar)
+                last = bar["snapshotTimeUTC"]
+    return prices
+
+
+def split_range(start_date, end_date, parts):
+    """
+    Splits a date range into (up to) parts windows of equal length, to the
+    second. Each window ends where the next starts
+    :param start_date: range start
+    :type start_date: datetime or str
+    :param end_date: range end
+    :type end_date: datetime or str
+    :param parts: number of windows
+    :type parts: int
+    :return: (start, end) of each window, oldest first
+    :rtype: list of (str, str) tuples
+    """
+    start = _parse(to_utc_string(start_date))
+    end = _parse(to_utc_string(end_date))
+    seconds = int((end - start).total_seconds())
+    parts = max(1, min(parts, seconds))
+    edges = [start + timedelta(seconds=seconds * i // parts) for i in range(parts)]
+    edges.append(end)
+    return [
+        (edges[i].strftime(TIME_FORMAT), edges[i + 1].strftime(TIME_FORMAT))
+        for i in range(parts)
+    ]
@@ -0,0 +1,149 @@
+"""
+Local resampling of historical prices, so that coarser resolutions (5 minute,
+hourly, daily...) can be derived from finer bars already fetched, instead of
+spending historical data allowance on each resolution separately
+"""
+
+import logging
+
+from .utils import _HAS_PANDAS, conv_resol
+
+if _HAS_PANDAS:
+    import pandas as pd
+    from pandas.tseries.frequencies import to_offset
+
+logger = logging.getLogger(__name__)
+
+# IG resolution -> pandas resampling rule
+RESAMPLE_RULES = {
+    "SECOND": "1s",
+    "MINUTE": "1min",
+    "MINUTE_2": "2min",
+    "MINUTE_3": "3min",
+    "MINUTE_5": "5min",
+    "MINUTE_10": "10min",
+    "MINUTE_15": "15min",
+    "MINUTE_30": "30min",
+    "HOUR": "1h",
+    "HOUR_2": "2h",
+    "HOUR_3": "3h",
+    "HOUR_4": "4h",
+    "DAY": "1D",
+    "WEEK": "W-MON",
+    "MONTH": "MS",
+}
+
+# column name (lower case, without the price type) -> aggregation
+AGGREGATIONS = {
+    "open": "first",
+    "high": "max",
+    "low": "min",
+    "close": "last",
+    "volume": "sum",
+}
+
+
+def resample_rule(resolution):
+    """
+    Returns the pandas resampling rule for a resolution
+    :param resolution: IG resolution (eg 'MINUTE_5') or pandas style (eg '5Min')
+    :type resolution: str
+    :return: pandas offset alias
+    :rtype: str
+    """
+    try:
+        return RESAMPLE_RULES[conv_resol(resolution)]
+    except KeyError:
+        raise ValueError(f"Unsupported resolution '{resolution}'")
+
+
+def _nanos(rule):
+    # length of a fixed frequency, None for weeks and months
+    try:
+        return to_offset(rule).nanos
+    except (AttributeError, ValueError):
+        return None
+
+
+def check_resolutions(source, target):
+    """
+    Raises ValueError unless bars at the source resolution can be aggregated
+    into bars at the target resolution
+    """
+    source_nanos = _nanos(resample_rule(source))
+    target_nanos = _nanos(resample_rule(target))
+    if source_nanos is None:
+        # weekly and monthly bars can't be split up any further
+        raise ValueError(f"Can't resample from '{source}' to '{target}'")
+    if target_nanos is not None and (
+        target_nanos <= source_nanos or target_nanos % source_nanos != 0
+    ):
+        raise ValueError(f"Can't resample from '{source}' to '{target}'")
+
+
+def _aggregation(column):
+    # format_prices() and mid_prices() columns are eg ('bid', 'Open') and
+    # 'Open', flat_prices() columns are eg 'open.bid'
+    name = column[-1] if isinstance(column, tuple) else column.split(".")[0]
+    try:
+        return AGGREGATIONS[name.lower()]
+    except KeyError:
+        raise ValueError(f"Don't know how to resample column '{column}'")
+
+
+def resample_prices(prices, resolution, offset=None, origin="start_day"):
+    """
+    Aggregates historical prices to a coarser resolution. Opens are taken from
+    the first bar, closes from the last, highs and lows are the max and min,
+    and volumes are summed, separately for bid, ask and last traded.
+
+    Only bins containing at least one source bar are returned, so weekends,
+    holidays and breaks between sessions don't produce empty bars. Use offset
+    to line bins up with the market's session, eg offset='22h' for daily bars
+    starting at 22:00, like IG's FX days. Bars are labelled with the start of
+    their bin, and a bin at either end of the data may be incomplete
+
+    :param prices: prices as returned by format_prices(), flat_prices() or
+        mid_prices()
+    :type prices: pandas.DataFrame
+    :param resolution: target resolution, IG style (eg 'HOUR_4') or pandas
+        style (eg '4h')
+    :type resolution: str
+    :param offset: shift of the bin edges, from origin. Optional
+    :type offset: str or pandas.Timedelta
+    :param origin: timestamp the bins are aligned to, as for
+        pandas.DataFrame.resample()
+    :type origin: str or pandas.Timestamp
+    :return: resampled prices, with the same columns
+    :rtype: pandas.DataFrame
+    """
+    if not _HAS_PANDAS:
+        raise ImportError("resample_prices() requires pandas")
+
+    resampler = prices.resample(
+        resample_rule(resolution),
+        closed="left",
+        label="left",
+        offset=offset,
+        origin=origin,
+    )
+    columns = {}
+    for column in prices.columns:
+        columns.setdefault(_aggregation(column), []).append(column)
+
+    parts = []
+    for how, cols in columns.items():
+        if how == "sum":
+            parts.append(resampler[cols].sum(min_count=1))
+        else:
+            parts.append(getattr(resampler[cols], how)())
+    result = pd.concat(parts, axis=1)[prices.columns]
+
+    # spreads can't be aggregated directly, recalculate from bid and ask
+    if isinstance(prices.columns, pd.MultiIndex) and "spread" in prices.columns:
+        result["spread"] = result["ask"] - result["bid"]
+
+    counts = resampler.size()
+    result = result[counts > 0]
+    result.index.name = prices.index.name
+    return result
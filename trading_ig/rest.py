@@ -9,34 +9,69 @@ import json
 import logging
 import time
 from base64 import b64decode, b64encode
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from operator import itemgetter
 from urllib.parse import parse_qs, urlparse
 
 from Crypto.Cipher import PKCS1_v1_5
 from Crypto.PublicKey import RSA
 from requests import Session
 
+from .activity import activity_key
+from .conversions import parse_timestamps
+from .deals import DealTicket, deal_report
+from .planner import (
+    DEFAULT_MAX_POINTS,
+    estimate_points,
+    plan_chunks,
+    split_range,
+    stitch_chunks,
+)
+from .retry import RetryPolicy
+from .schemas import (
+    ACCOUNT_COLUMNS,
+    ACTIVITY_V1_COLUMNS,
+    NAVIGATION_MARKET_COLUMNS,
+    NAVIGATION_NODE_COLUMNS,
+    TRANSACTION_COLUMNS,
+    TRANSACTION_V1_COLUMNS,
+    cast_frame,
+    empty_frame,
+    nested_columns,
+)
+from .tabular import (
+    ACTIVITY_COLUMNS,
+    BACKENDS,
+    activity_columns,
+    expand_records,
+    get_backend,
+)
+from .tracing import NO_TRACE
 from .utils import (
     _HAS_MUNCH,
+    _HAS_NUMPY,
     _HAS_PANDAS,
-    DATE_FORMATS,
     api_limit_hit,
     conv_datetime,
     conv_resol,
     conv_to_ms,
+    map_concurrently,
+    price_arrays,
     token_invalid,
 )
 
 if _HAS_MUNCH:
     from .utils import munchify
 
-if _HAS_PANDAS:
-    from pandas import json_normalize
+if _HAS_NUMPY:
+    from .utils import np
 
+if _HAS_PANDAS:
     from .utils import pd
 
 from queue import Empty, Queue
-from threading import Thread
+from threading import Lock, Thread
 
 logger = logging.getLogger(__name__)
 
@@ -45,6 +80,11 @@ D_BASE_URL = {
     "demo": "https://demo-api.ig.com/gateway/deal",
 }
 
+OUTPUT_FORMATS = ["dict", "pandas", "numpy"]
+
+# threads resolving DealTickets, shared by all deals of an IGService
+CONFIRM_WORKERS = 8
+
 
 class ApiExceededException(Exception):
     """Raised when our code hits the IG endpoint too often"""
@@ -102,7 +142,9 @@ class IGSessionCRUD:
         url = self._url(endpoint)
         session = self._get_session(session)
         session.headers.update({"VERSION": version})
-        response = session.post(url, data=json.dumps(params))
+        response = session.post(
+            url, data=json.dumps(params), headers={"VERSION": version}
+        )
         logger.info(f"POST '{endpoint}', resp {response.status_code}")
         if response.status_code in [401, 403]:
             if api_limit_hit(response.text):
@@ -122,7 +164,7 @@ class IGSessionCRUD:
         url = self._url(endpoint)
         session = self._get_session(session)
         session.headers.update({"VERSION": version})
-        response = session.get(url, params=params)
+        response = session.get(url, params=params, headers={"VERSION": version})
         # handle 'read_session' with 'fetchSessionTokens=true'
         handle_session_tokens(response, self.session)
         logger.info(f"GET '{endpoint}', resp {response.status_code}")
@@ -133,7 +175,9 @@ class IGSessionCRUD:
         url = self._url(endpoint)
         session = self._get_session(session)
         session.headers.update({"VERSION": version})
-        response = session.put(url, data=json.dumps(params))
+        response = session.put(
+            url, data=json.dumps(params), headers={"VERSION": version}
+        )
         logger.info(f"PUT '{endpoint}', resp {response.status_code}")
         return response
 
@@ -142,11 +186,14 @@ class IGSessionCRUD:
         url = self._url(endpoint)
         session = self._get_session(session)
         session.headers.update({"VERSION": version})
-        session.headers.update({"_method": "DELETE"})
-        response = session.post(url, data=json.dumps(params))
+        # '_method' is sent with this request only, so that requests made
+        # concurrently on the same session are not turned into deletes
+        response = session.post(
+            url,
+            data=json.dumps(params),
+            headers={"VERSION": version, "_method": "DELETE"},
+        )
         logger.info(f"DELETE (POST) '{endpoint}', resp {response.status_code}")
-        if "_method" in session.headers:
-            del session.headers["_method"]
         return response
 
     def req(self, action, endpoint, params, session, version):
@@ -179,9 +226,26 @@ class IGService:
         return_munch=_HAS_MUNCH,
         retryer=None,
         use_rate_limiter=False,
+        output_format=None,
+        typed_columns=False,
+        retry_policy=None,
     ):
         """Constructor, calls the method required to connect to
-        the API (accepts acc_type = LIVE or DEMO)"""
+        the API (accepts acc_type = LIVE or DEMO)
+
+        output_format sets how tabular data is returned, one of OUTPUT_FORMATS, or
+        a tabular backend name. 'dict' returns the parsed JSON, 'pandas' returns
+        DataFrames, and 'numpy' returns historical prices as NumPy structured
+        arrays (other data as 'dict'). The backends 'arrow' and 'polars' return
+        pyarrow Tables and Polars DataFrames, built without pandas. If not set,
+        it is 'pandas' or 'dict' according to return_dataframe
+
+        With typed_columns=True, pandas results get the dtypes in schemas.DTYPES
+        (UTC datetimes, floats and categories) rather than object columns
+
+        retry_policy is the RetryPolicy used while waiting for a deal confirm or
+        an open position that isn't there yet. By default, the first retry
+        comes after 0.1s, and lookups give up after 5s"""
         self.API_KEY = api_key
         self.IG_USERNAME = username
         self.IG_PASSWORD = password
@@ -189,6 +253,7 @@ class IGService:
         self._retryer = retryer
         self._use_rate_limiter = use_rate_limiter
         self._bucket_threads_run = False
+        self._historical_allowance = None
         try:
             self.BASE_URL = D_BASE_URL[acc_type.lower()]
         except Exception:
@@ -196,8 +261,32 @@ class IGService:
                 f"Invalid account type '{acc_type}', please provide LIVE or DEMO"
             )
 
-        self.return_dataframe = return_dataframe
+        if output_format is None:
+            output_format = "pandas" if return_dataframe else "dict"
+        if output_format not in OUTPUT_FORMATS and output_format not in BACKENDS:
+            raise IGException(
+                f"Invalid output format '{output_format}', expected one of "
+                f"{OUTPUT_FORMATS + list(BACKENDS)}"
+            )
+        if output_format == "numpy" and not _HAS_NUMPY:
+            raise IGException("output format 'numpy' requires numpy")
+        self._backend = None
+        if output_format in BACKENDS:
+            self._backend = get_backend(output_format)
+        self.output_format = output_format
+        self.return_dataframe = output_format == "pandas"
         self.return_munch = return_munch
+        self.typed_columns = typed_columns
+        self.retry_policy = RetryPolicy() if retry_policy is None else retry_policy
+        # deal confirmations streamed by IGStreamService, if subscribed
+        self.confirms = None
+        self.confirm_timeout = 2.0
+        # pre-trade checks, set by validation.OrderValidator.attach()
+        self.validator = None
+        # deal latency tracing, set by tracing.LatencyTracer.attach()
+        self.tracer = None
+        self._executor = None
+        self._executor_lock = Lock()
 
         if session is None:
             self.session = Session()  # Requests Session (global)
@@ -359,6 +448,22 @@ class IGService:
 
         return result
 
+    def _read_with_retry(self, endpoint, params, session, version, deadline, message):
+        """Reads endpoint, retrying with retry_policy until the response is OK
+        or deadline seconds have passed. Returns the last response. Each
+        attempt takes the non-trading rate limiter"""
+
+        def attempt():
+            self.non_trading_rate_limit_pause_or_pass()
+            return self._req("read", endpoint, params, session, version)
+
+        return self.retry_policy.call(
+            attempt,
+            lambda response: response.status_code != 200,
+            deadline,
+            message,
+        )
+
     def _request(self, action, endpoint, params, session, version="1", check=True):
         """Creates a CRUD request and returns response"""
         session = self._get_session(session)
@@ -401,30 +506,47 @@ class IGService:
 
     @staticmethod
     def colname_unique(d_cols):
-        """Returns a set of column names (unique)"""
-        s = set()
-        for lst in d_cols.values():
-            s.update(lst)
-        return list(s)
+        """Returns a list of column names (unique)"""
+        return nested_columns(d_cols)
 
     @staticmethod
     def expand_columns(data, d_cols, flag_col_prefix=False, col_overlap_allowed=None):
-        """Expand columns"""
+        """Expand columns. Each nested column is read in a single pass, taking
+        all its fields at once, and the result is built as one DataFrame"""
         if col_overlap_allowed is None:
             col_overlap_allowed = []
+        columns = {col: data[col] for col in data.columns if col not in d_cols}
         for col_lev1, lst_col in d_cols.items():
-            ser = data[col_lev1]
-            del data[col_lev1]
+            colnames = []
             for col in lst_col:
-                if col not in data.columns or col in col_overlap_allowed:
-                    if flag_col_prefix:
-                        colname = col_lev1 + "_" + col
-                    else:
-                        colname = col
-                    data[colname] = ser.map(lambda x: x[col], na_action="ignore")
-                else:
+                if col in columns and col not in col_overlap_allowed:
                     raise (NotImplementedError(f"col overlap: {col}"))
-        return data
+                colnames.append(col_lev1 + "_" + col if flag_col_prefix else col)
+
+            # a missing nested dict (None or NaN) gives missing values
+            nested_values = data[col_lev1].tolist()
+            getter = itemgetter(*lst_col)
+            width = len(lst_col)
+            if width == 1:
+                rows = [
+                    (getter(nested) if isinstance(nested, dict) else nested,)
+                    for nested in nested_values
+                ]
+            else:
+                rows = [
+                    getter(nested) if isinstance(nested, dict) else (nested,) * width
+                    for nested in nested_values
+                ]
+            if rows:
+                expanded = pd.DataFrame.from_records(
+                    rows, columns=colnames, index=data.index
+                )
+            else:
+                expanded = pd.DataFrame(
+                    columns=colnames, index=data.index, dtype=object
+                )
+            columns.update(expanded.items())
+        return pd.DataFrame(columns, index=data.index)
 
     # -------- END ------- #
 
@@ -445,24 +567,9 @@ class IGService:
             data = self.expand_columns(data, d_cols, False)
 
             if len(data) == 0:
-                columns = [
-                    "accountAlias",
-                    "accountId",
-                    "accountName",
-                    "accountType",
-                    "balance",
-                    "available",
-                    "balance",
-                    "deposit",
-                    "profitLoss",
-                    "canTransferFrom",
-                    "canTransferTo",
-                    "currency",
-                    "preferred",
-                    "status",
-                ]
-                data = pd.DataFrame(columns=columns)
-                return data
+                return empty_frame(ACCOUNT_COLUMNS, self.typed_columns)
+            if self.typed_columns:
+                data = cast_frame(data)
 
         return data
 
@@ -522,27 +629,11 @@ class IGService:
             data = pd.DataFrame(data["activities"])
 
             if len(data) == 0:
-                columns = [
-                    "actionStatus",
-                    "activity",
-                    "activityHistoryId",
-                    "channel",
-                    "currency",
-                    "date",
-                    "dealId",
-                    "epic",
-                    "level",
-                    "limit",
-                    "marketName",
-                    "period",
-                    "result",
-                    "size",
-                    "stop",
-                    "stopType",
-                    "time",
-                ]
-                data = pd.DataFrame(columns=columns)
-                return data
+                return empty_frame(ACTIVITY_V1_COLUMNS, self.typed_columns)
+            if self.typed_columns:
+                data = cast_frame(data)
+        elif self._backend:
+            data = self._backend.from_records(data["activities"])
 
         return data
 
@@ -572,27 +663,11 @@ class IGService:
             data = pd.DataFrame(data["activities"])
 
             if len(data) == 0:
-                columns = [
-                    "actionStatus",
-                    "activity",
-                    "activityHistoryId",
-                    "channel",
-                    "currency",
-                    "date",
-                    "dealId",
-                    "epic",
-                    "level",
-                    "limit",
-                    "marketName",
-                    "period",
-                    "result",
-                    "size",
-                    "stop",
-                    "stopType",
-                    "time",
-                ]
-                data = pd.DataFrame(columns=columns)
-                return data
+                return empty_frame(ACTIVITY_V1_COLUMNS, self.typed_columns)
+            if self.typed_columns:
+                data = cast_frame(data)
+        elif self._backend:
+            data = self._backend.from_records(data["activities"])
 
         return data
 
@@ -603,12 +678,15 @@ class IGService:
         max_span_seconds: int | None = None,
         page_size: int = 20,
         session=None,
+        max_workers: int = 4,
     ):
         """
         Returns the account activity history (v2)
 
         If the result set spans multiple 'pages', this method will automatically get
-        all the results and bundle them into one object.
+        all the results and bundle them into one object. Once the first page has
+        given the number of pages, the rest are fetched concurrently, each waiting
+        for the non-trading rate limiter (if in use)
 
         :param from_date: start date and time. Optional
         :type from_date: datetime
@@ -624,10 +702,12 @@ class IGService:
         :type page_size: int
         :param session: session object. Optional
         :type session: Session
+        :param max_workers: maximum number of pages fetched at the same time.
+            Default 4. Optional
+        :type max_workers: int
         :return: results set
         :rtype: Pandas DataFrame if configured, otherwise a dict
         """
-        self.non_trading_rate_limit_pause_or_pass()
         version = "2"
         params = {}
         if from_date:
@@ -639,27 +719,26 @@ class IGService:
         params["pageSize"] = page_size
         endpoint = "/history/activity/"
         action = "read"
-        data = {}
-        activities = []
-        pagenumber = 1
-        more_results = True
 
-        while more_results:
-            params["pageNumber"] = pagenumber
-            response = self._req(action, endpoint, params, session, version)
-            data = self.parse_response(response.text)
-            activities.extend(data["activities"])
-            page_data = data["metadata"]["pageData"]
-            if page_data["totalPages"] == 0 or (
-                page_data["pageNumber"] == page_data["totalPages"]
-            ):
-                more_results = False
-            else:
-                pagenumber += 1
+        def fetch_page(pagenumber):
+            self.non_trading_rate_limit_pause_or_pass()
+            page_params = dict(params, pageNumber=pagenumber)
+            response = self._req(action, endpoint, page_params, session, version)
+            return self.parse_response(response.text)
+
+        data = fetch_page(1)
+        activities = list(data["activities"])
+        pages = range(2, data["metadata"]["pageData"]["totalPages"] + 1)
+        for page, ex in map_concurrently(fetch_page, pages, max_workers):
+            if ex is not None:
+                raise ex
+            activities.extend(page["activities"])
 
         data["activities"] = activities
         if _HAS_PANDAS and self.return_dataframe:
             data = pd.DataFrame(data["activities"])
+        elif self._backend:
+            data = self._backend.from_records(data["activities"])
 
         return data
 
@@ -672,6 +751,7 @@ class IGService:
         fiql_filter: str | None = None,
         page_size: int = 50,
         session=None,
+        max_workers: int = 1,
     ):
         """
         Returns the account activity history (v3)
@@ -679,6 +759,11 @@ class IGService:
         If the result set spans multiple 'pages', this method will automatically get
         all the results and bundle them into one object.
 
+        Pages are linked one to the next, so normally have to be fetched one at a
+        time. With max_workers > 1 and a from_date, the date range is instead split
+        into windows which are paged independently, in parallel, and split further
+        where activity is dense. See _fetch_account_activity_windows()
+
         :param from_date: start date and time. Optional
         :type from_date: datetime
         :param to_date: end date and time. A date without time refers to the end of
@@ -695,9 +780,53 @@ class IGService:
         :type page_size: int
         :param session: session object. Optional
         :type session: Session
+        :param max_workers: maximum number of windows fetched at the same time.
+            Default 1, follow the pages one at a time. Optional
+        :type max_workers: int
         :return: results set
         :rtype: Pandas DataFrame if configured, otherwise a dict
         """
+        if max_workers > 1 and from_date:
+            data = self._fetch_account_activity_windows(
+                from_date,
+                to_date,
+                detailed,
+                deal_id,
+                fiql_filter,
+                page_size,
+                session,
+                max_workers,
+            )
+        else:
+            data = self._fetch_account_activity_raw(
+                from_date, to_date, detailed, deal_id, fiql_filter, page_size, session
+            )
+        if _HAS_PANDAS and self.return_dataframe:
+            if detailed:
+                data = self.format_activities(data)
+            else:
+                data = pd.DataFrame(data["activities"])
+        elif self._backend:
+            if detailed:
+                columns = activity_columns(data["activities"], missing=None)
+                # activity fields first, then the action fields, as with
+                # format_activities()
+                order = ACTIVITY_COLUMNS + [
+                    col for col in columns if col not in ACTIVITY_COLUMNS
+                ]
+                data = self._backend.from_arrays(
+                    {col: np.asarray(columns[col], dtype=object) for col in order}
+                )
+            else:
+                data = self._backend.from_records(data["activities"])
+
+        return data
+
+    def _fetch_account_activity_raw(
+        self, from_date, to_date, detailed, deal_id, fiql_filter, page_size, session
+    ):
+        """Fetches every page of v3 account activity, returning the parsed
+        JSON, with the activities from all pages"""
         self.non_trading_rate_limit_pause_or_pass()
         version = "3"
         params = {}
@@ -727,82 +856,134 @@ class IGService:
             if paging["next"] is None:
                 more_results = False
             else:
-                parse_result = urlparse(paging["next"])
-                query = parse_qs(parse_result.query)
-                logger.debug(f"fetch_account_activity() next query: '{query}'")
-                if "from" in query:
-                    # from_str = query["from"][0]
-                    params["from"] = query["from"][0][:19]
-                else:
-                    del params["from"]
-                if "to" in query:
-                    # to_str = query["from"][0]
-                    params["to"] = query["from"][0][:19]
-                else:
-                    del params["to"]
+                query = self._next_activity_query(paging["next"])
+                for key in ("from", "to"):
+                    if key in query:
+                        params[key] = query[key]
+                    else:
+                        params.pop(key, None)
 
         data["activities"] = activities
-        if _HAS_PANDAS and self.return_dataframe:
-            if detailed:
-                data = self.format_activities(data)
-            else:
-                data = pd.DataFrame(data["activities"])
+        return data
+
+    @staticmethod
+    def _next_activity_query(next_link):
+        """Returns the 'from' and 'to' of a v3 activity paging.next link"""
+        query = parse_qs(urlparse(next_link).query)
+        logger.debug(f"fetch_account_activity() next query: '{query}'")
+        return {key: query[key][0][:19] for key in ("from", "to") if key in query}
+
+    def _fetch_account_activity_windows(
+        self,
+        from_date,
+        to_date,
+        detailed,
+        deal_id,
+        fiql_filter,
+        page_size,
+        session,
+        max_workers,
+    ):
+        """
+        Fetches v3 account activity by time window, max_workers windows at a
+        time. The range starts off split into max_workers equal windows. The
+        first page of each is fetched, and if a window has more pages, what is
+        left of it is split in two for the next round - so busy periods end up
+        split more finely than quiet ones. Activities are de-duplicated on
+        their content (see activity_key()), newest first, as IG returns them
+        """
+        version = "3"
+        endpoint = "/history/activity/"
+        action = "read"
+        base_params = {"pageSize": page_size}
+        if detailed:
+            base_params["detailed"] = "true"
+        if deal_id:
+            base_params["dealId"] = deal_id
+        if fiql_filter:
+            base_params["filter"] = fiql_filter
+        if to_date is None:
+            to_date = datetime.now(timezone.utc)
+
+        def fetch_window(window):
+            start, end, follow = window
+            params = dict(base_params, **{"from": start, "to": end})
+            activities = []
+            while True:
+                self.non_trading_rate_limit_pause_or_pass()
+                response = self._req(action, endpoint, params, session, version)
+                data = self.parse_response(response.text)
+                activities.extend(data["activities"])
+                next_link = data["metadata"]["paging"]["next"]
+                if not follow or next_link is None:
+                    break
+                params.update(self._next_activity_query(next_link))
+            data["activities"] = activities
+            return data
+
+        data = {}
+        activities = {}
+        windows = [
+            (start, end, False)
+            for start, end in split_range(
+                from_date.strftime("%Y-%m-%dT%H:%M:%S"),
+                to_date.strftime("%Y-%m-%dT%H:%M:%S"),
+                max_workers,
+            )
+        ]
+        while windows:
+            results = map_concurrently(fetch_window, windows, max_workers)
+            next_windows = []
+            for window, (data, ex) in zip(windows, results):
+                if ex is not None:
+                    raise ex
+                for activity in data["activities"]:
+                    activities[activity_key(activity)] = activity
+                next_link = data["metadata"]["paging"]["next"]
+                if next_link is None or window[2]:
+                    continue
+                query = self._next_activity_query(next_link)
+                rest = (query.get("from", window[0]), query.get("to", window[1]))
+                if rest == window[:2]:
+                    # no narrower, eg too much activity in one second, so
+                    # follow the pages instead
+                    next_windows.append(rest + (True,))
+                else:
+                    next_windows.extend(
+                        (start, end, False) for start, end in split_range(*rest, 2)
+                    )
+            logger.debug(
+                f"fetch_account_activity() fetched {len(windows)} window(s), "
+                f"{len(next_windows)} to follow"
+            )
+            windows = next_windows
 
+        data["activities"] = sorted(
+            activities.values(), key=lambda activity: activity["date"], reverse=True
+        )
         return data
 
     @staticmethod
     def format_activities(raw_json):
-        df = pd.json_normalize(
-            raw_json["activities"],
-            record_path=["details", ["actions"]],
-            meta=[
-                "date",
-                "epic",
-                "period",
-                "dealId",
-                "channel",
-                "type",
-                "status",
-                "description",
-                ["details", "marketName"],
-                ["details", "goodTillDate"],
-                ["details", "currency"],
-                ["details", "size"],
-                ["details", "direction"],
-                ["details", "level"],
-                ["details", "stopLevel"],
-                ["details", "stopDistance"],
-                ["details", "guaranteedStop"],
-                ["details", "trailingStopDistance"],
-                ["details", "trailingStep"],
-                ["details", "limitLevel"],
-                ["details", "limitDistance"],
-            ],
-        )
+        """
+        Format detailed (v3) activities as a DataFrame, one row per action.
+        Columns are the activity fields, then the details fields, then the
+        action fields (actionType, affectedDealId). Activity and details fields
+        have object dtype, as with pandas.json_normalize()
+
+        :param raw_json: parsed JSON, with 'activities' element
+        :type raw_json: dict
+        :return: activities
+        :rtype: pandas.DataFrame
+        """
+        if len(raw_json["activities"]) == 0:
+            return pd.DataFrame(columns=[])
 
-        df = df.rename(
-            columns={
-                "details.marketName": "marketName",
-                "details.goodTillDate": "goodTillDate",
-                "details.currency": "currency",
-                "details.size": "size",
-                "details.direction": "direction",
-                "details.level": "level",
-                "details.stopLevel": "stopLevel",
-                "details.stopDistance": "stopDistance",
-                "details.guaranteedStop": "guaranteedStop",
-                "details.trailingStopDistance": "trailingStopDistance",
-                "details.trailingStep": "trailingStep",
-                "details.limitLevel": "limitLevel",
-                "details.limitDistance": "limitDistance",
-            }
-        )
+        df = pd.DataFrame(activity_columns(raw_json["activities"]))
 
         cols = df.columns.tolist()
         cols = cols[2:] + cols[:2]
-        data = df[cols]
-
-        return data
+        return df[cols]
 
     def fetch_transaction_history_by_type_and_period(
         self, milliseconds, trans_type, session=None
@@ -824,21 +1005,11 @@ class IGService:
             data = pd.DataFrame(data["transactions"])
 
             if len(data) == 0:
-                columns = [
-                    "cashTransaction",
-                    "closeLevel",
-                    "currency",
-                    "date",
-                    "instrumentName",
-                    "openLevel",
-                    "period",
-                    "profitAndLoss",
-                    "reference",
-                    "size",
-                    "transactionType",
-                ]
-                data = pd.DataFrame(columns=columns)
-                return data
+                return empty_frame(TRANSACTION_V1_COLUMNS, self.typed_columns)
+            if self.typed_columns:
+                data = cast_frame(data)
+        elif self._backend:
+            data = self._backend.from_records(data["transactions"])
 
         return data
 
@@ -851,11 +1022,57 @@ class IGService:
         page_size=None,
         page_number=None,
         session=None,
+        all_pages=False,
+        max_workers=1,
     ):
         """Returns the transaction history for the specified transaction
-        type and period"""
-        self.non_trading_rate_limit_pause_or_pass()
-        version = "2"
+        type and period
+
+        With all_pages=True, every page is fetched (page_number is ignored) and
+        bundled into one result, with pages after the first fetched max_workers
+        at a time. Numbers and dates are then typed, see typed_transactions()
+        """
+        params = self._transaction_params(
+            trans_type, from_date, to_date, max_span_seconds, page_size, page_number
+        )
+        if all_pages:
+            pages = list(self._transaction_pages(params, session, max_workers))
+            data = pages[0]
+            data["transactions"] = [
+                transaction for page in pages for transaction in page["transactions"]
+            ]
+        else:
+            self.non_trading_rate_limit_pause_or_pass()
+            data = self._fetch_transaction_page(params, session)
+        return self._format_transactions(data, typed=all_pages)
+
+    def iter_transaction_history(
+        self,
+        trans_type=None,
+        from_date=None,
+        to_date=None,
+        max_span_seconds=None,
+        page_size=None,
+        session=None,
+    ):
+        """
+        Fetches the transaction history one page at a time, yielding each
+        page as it arrives. Takes the same parameters as
+        fetch_transaction_history(), and as with all_pages=True, numbers and
+        dates are typed
+
+        :return: generator of Pandas DataFrames if configured, otherwise of dict
+        """
+        params = self._transaction_params(
+            trans_type, from_date, to_date, max_span_seconds, page_size, None
+        )
+        for data in self._transaction_pages(params, session):
+            yield self._format_transactions(data, typed=True)
+
+    @staticmethod
+    def _transaction_params(
+        trans_type, from_date, to_date, max_span_seconds, page_size, page_number
+    ):
         params = {}
         if trans_type:
             params["type"] = trans_type
@@ -873,155 +1090,243 @@ class IGService:
             params["pageSize"] = page_size
         if page_number:
             params["pageNumber"] = page_number
+        return params
 
+    def _fetch_transaction_page(self, params, session):
+        version = "2"
         endpoint = "/history/transactions"
         action = "read"
-
         response = self._req(action, endpoint, params, session, version)
-        data = self.parse_response(response.text)
+        return self.parse_response(response.text)
+
+    def _transaction_pages(self, params, session, max_workers=1):
+        """Yields the parsed response for each page of transactions, in order.
+        Pages after the first are fetched max_workers at a time"""
+
+        def fetch_page(pagenumber):
+            self.non_trading_rate_limit_pause_or_pass()
+            page_params = dict(params, pageNumber=pagenumber)
+            return self._fetch_transaction_page(page_params, session)
+
+        data = fetch_page(1)
+        yield data
+        total_pages = data["metadata"]["pageData"]["totalPages"]
+        pages = range(2, total_pages + 1)
+        if max_workers > 1:
+            for page, ex in map_concurrently(fetch_page, pages, max_workers):
+                if ex is not None:
+                    raise ex
+                yield page
+        else:
+            for pagenumber in pages:
+                yield fetch_page(pagenumber)
+
+    def _format_transactions(self, data, typed=False):
         if self.return_dataframe:
             data = pd.DataFrame(data["transactions"])
 
             if len(data) == 0:
-                columns = [
-                    "cashTransaction",
-                    "closeLevel",
-                    "currency",
-                    "date",
-                    "dateUtc",
-                    "instrumentName",
-                    "openLevel",
-                    "period",
-                    "profitAndLoss",
-                    "reference",
-                    "size",
-                    "transactionType",
-                ]
-                data = pd.DataFrame(columns=columns)
-                return data
+                return empty_frame(TRANSACTION_COLUMNS, typed or self.typed_columns)
+            if typed or self.typed_columns:
+                data = cast_frame(data)
+        elif self._backend:
+            data = self._backend.from_records(data["transactions"])
 
         return data
 
+    @staticmethod
+    def typed_transactions(df):
+        """
+        Converts the text columns of a transactions DataFrame: levels, size
+        and profit and loss (without the currency symbol, which is in the
+        'currency' column) to float, and the UTC dates to datetime. See
+        schemas.cast_frame()
+
+        :param df: transactions, as returned by fetch_transaction_history()
+        :type df: pandas.DataFrame
+        :return: transactions with typed columns
+        :rtype: pandas.DataFrame
+        """
+        return cast_frame(df)
+
     # -------- END -------- #
 
     # -------- DEALING -------- #
 
-    def fetch_deal_by_deal_reference(self, deal_reference, session=None):
-        """Returns a deal confirmation for the given deal reference"""
-        self.non_trading_rate_limit_pause_or_pass()
+    def fetch_deal_by_deal_reference(self, deal_reference, session=None, deadline=None):
+        """Returns a deal confirmation for the given deal reference. If
+        IGStreamService.subscribe_trade_confirms() has been called, the confirm
+        is taken from the TRADE stream, and /confirms is only polled if it
+        doesn't arrive within confirm_timeout seconds. /confirms is polled with
+        retry_policy, for up to deadline seconds (the policy's, if not given)"""
+        if self.confirms is not None:
+            confirm = self.confirms.get(deal_reference, self.confirm_timeout)
+            if confirm is not None:
+                if self.tracer is not None:
+                    self.tracer.confirmed(deal_reference, confirm, "stream")
+                return confirm
+            logger.info(f"Deal reference {deal_reference} not streamed, polling.")
         version = "1"
         params = {}
         url_params = {"deal_reference": deal_reference}
         endpoint = "/confirms/{deal_reference}".format(**url_params)
-        action = "read"
-        for i in range(5):
-            response = self._req(action, endpoint, params, session, version)
-            if response.status_code != 200:
-                logger.info(f"Deal reference {deal_reference} not found, retrying.")
-                time.sleep(1)
-            else:
-                break
+        response = self._read_with_retry(
+            endpoint,
+            params,
+            session,
+            version,
+            deadline,
+            f"Deal reference {deal_reference} not found, retrying.",
+        )
         data = self.parse_response(response.text)
+        if self.tracer is not None:
+            self.tracer.confirmed(deal_reference, data, "rest")
         return data
 
-    def fetch_open_position_by_deal_id(self, deal_id, session=None):
-        """Return the open position by deal id for the active account"""
-        self.non_trading_rate_limit_pause_or_pass()
+    def _trace(self, method, epic=None, order_type=None):
+        """Starts timing a dealing call, if a LatencyTracer is attached"""
+        if self.tracer is None:
+            return NO_TRACE
+        return self.tracer.start(method, epic, order_type)
+
+    def _deal_confirm(self, response, block=True, trace=NO_TRACE):
+        """Returns the confirmation for a dealing response, or a DealTicket
+        that is resolved in the background"""
+        if response.status_code != 200:
+            raise IGException(response.text)
+        deal_reference = json.loads(response.text)["dealReference"]
+        trace.referenced(deal_reference)
+        if block:
+            return self.fetch_deal_by_deal_reference(deal_reference)
+        ticket = DealTicket(deal_reference)
+        self._confirm_executor().submit(
+            ticket.resolve, self.fetch_deal_by_deal_reference
+        )
+        return ticket
+
+    def _confirm_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=CONFIRM_WORKERS, thread_name_prefix="confirms"
+                )
+            return self._executor
+
+    def fetch_open_position_by_deal_id(self, deal_id, session=None, deadline=None):
+        """Return the open position by deal id for the active account. A
+        position that isn't found is retried with retry_policy, for up to
+        deadline seconds (the policy's, if not given)"""
         version = "2"
         params = {}
         url_params = {"deal_id": deal_id}
         endpoint = "/positions/{deal_id}".format(**url_params)
-        action = "read"
-        for i in range(5):
-            response = self._req(action, endpoint, params, session, version)
-            if response.status_code != 200:
-                logger.info(f"Deal id {deal_id} not found, retrying.")
-                time.sleep(1)
-            else:
-                break
+        response = self._read_with_retry(
+            endpoint,
+            params,
+            session,
+            version,
+            deadline,
+            f"Deal id {deal_id} not found, retrying.",
+        )
         data = self.parse_response(response.text)
         return data
 
-    def fetch_open_positions(self, session=None, version="2"):
+    @staticmethod
+    def _position_columns(version):
+        """Nested position columns to expand, for API version 1 or 2"""
+        cols = {
+            "position": [
+                "contractSize",
+                "createdDate",
+                "createdDateUTC",
+                "dealId",
+                "dealReference",
+                "size",
+                "direction",
+                "limitLevel",
+                "level",
+                "currency",
+                "controlledRisk",
+                "stopLevel",
+                "trailingStep",
+                "trailingStopDistance",
+                "limitedRiskPremium",
+            ],
+            "market": [
+                "instrumentName",
+                "expiry",
+                "epic",
+                "instrumentType",
+                "lotSize",
+                "high",
+                "low",
+                "percentageChange",
+                "netChange",
+                "bid",
+                "offer",
+                "updateTime",
+                "updateTimeUTC",
+                "delayTime",
+                "streamingPricesAvailable",
+                "marketStatus",
+                "scalingFactor",
+            ],
+        }
+
+        if version == "1":
+            cols["position"].remove("createdDateUTC")
+            cols["position"].remove("dealReference")
+            cols["position"].remove("size")
+            cols["position"].insert(3, "dealSize")
+            cols["position"].remove("level")
+            cols["position"].insert(6, "openLevel")
+            cols["market"].remove("updateTimeUTC")
+
+        return cols
+
+    def _fetch_open_positions_raw(self, session=None, version="2", deadline=None):
+        params = {}
+        endpoint = "/positions"
+        response = self._read_with_retry(
+            endpoint,
+            params,
+            session,
+            version,
+            deadline,
+            "Error fetching open positions, retrying.",
+        )
+        return self.parse_response(response.text)
+
+    def fetch_open_positions(self, session=None, version="2", deadline=None):
         """
         Returns all open positions for the active account. Supports both v1 and v2
         :param session: session object, otional
         :type session: Session
         :param version: API version, 1 or 2
         :type version: str
+        :param deadline: seconds to keep retrying a failed request for, optional
+        :type deadline: float
         :return: table of position data, one per row
         :rtype: pd.Dataframe
         """
-        self.non_trading_rate_limit_pause_or_pass()
-        params = {}
-        endpoint = "/positions"
-        action = "read"
-        for i in range(5):
-            response = self._req(action, endpoint, params, session, version)
-            if response.status_code != 200:
-                logger.info("Error fetching open positions, retrying.")
-                time.sleep(1)
-            else:
-                break
-        data = self.parse_response(response.text)
+        data = self._fetch_open_positions_raw(session, version, deadline)
 
         if self.return_dataframe:
             lst = data["positions"]
             data = pd.DataFrame(lst)
 
-            cols = {
-                "position": [
-                    "contractSize",
-                    "createdDate",
-                    "createdDateUTC",
-                    "dealId",
-                    "dealReference",
-                    "size",
-                    "direction",
-                    "limitLevel",
-                    "level",
-                    "currency",
-                    "controlledRisk",
-                    "stopLevel",
-                    "trailingStep",
-                    "trailingStopDistance",
-                    "limitedRiskPremium",
-                ],
-                "market": [
-                    "instrumentName",
-                    "expiry",
-                    "epic",
-                    "instrumentType",
-                    "lotSize",
-                    "high",
-                    "low",
-                    "percentageChange",
-                    "netChange",
-                    "bid",
-                    "offer",
-                    "updateTime",
-                    "updateTimeUTC",
-                    "delayTime",
-                    "streamingPricesAvailable",
-                    "marketStatus",
-                    "scalingFactor",
-                ],
-            }
-
-            if version == "1":
-                cols["position"].remove("createdDateUTC")
-                cols["position"].remove("dealReference")
-                cols["position"].remove("size")
-                cols["position"].insert(3, "dealSize")
-                cols["position"].remove("level")
-                cols["position"].insert(6, "openLevel")
-                cols["market"].remove("updateTimeUTC")
+            cols = self._position_columns(version)
 
             if len(data) == 0:
-                data = pd.DataFrame(columns=self.colname_unique(cols))
-                return data
+                return empty_frame(nested_columns(cols), self.typed_columns)
 
             data = self.expand_columns(data, cols)
+            if self.typed_columns:
+                data = cast_frame(data)
+        elif self._backend:
+            data = self._backend.from_records(
+                *expand_records(data["positions"], self._position_columns(version))
+            )
 
         return data
 
@@ -1037,9 +1342,13 @@ class IGService:
         size,
         session=None,
         time_in_force=None,
+        block=True,
     ):
-        """Closes one or more OTC positions"""
+        """Closes one or more OTC positions. Returns the deal confirmation, or with
+        block=False, a DealTicket for it"""
+        trace = self._trace("close_open_position", epic, order_type)
         self.trading_rate_limit_pause_or_pass()
+        trace.mark("admitted")
         version = "1"
         params = {
             "dealId": deal_id,
@@ -1055,13 +1364,9 @@ class IGService:
             params["timeInForce"] = time_in_force
         endpoint = "/positions/otc"
         action = "delete"
+        trace.mark("sent")
         response = self._req(action, endpoint, params, session, version)
-
-        if response.status_code == 200:
-            deal_reference = json.loads(response.text)["dealReference"]
-            return self.fetch_deal_by_deal_reference(deal_reference)
-        else:
-            raise IGException(response.text)
+        return self._deal_confirm(response, block, trace)
 
     def create_open_position(
         self,
@@ -1083,9 +1388,30 @@ class IGService:
         trailing_stop_increment,
         session=None,
         time_in_force=None,
+        block=True,
     ):
-        """Creates an OTC position"""
+        """Creates an OTC position. Returns the deal confirmation, or with
+        block=False, a DealTicket for it. If an OrderValidator is attached, an
+        order that breaks the market's dealing rules raises
+        OrderValidationError before anything is sent"""
+        if self.validator is not None:
+            self.validator.validate_open_position(
+                epic,
+                direction=direction,
+                size=size,
+                order_type=order_type,
+                level=level,
+                stop_distance=stop_distance,
+                stop_level=stop_level,
+                limit_distance=limit_distance,
+                limit_level=limit_level,
+                guaranteed_stop=guaranteed_stop,
+                trailing_stop=trailing_stop,
+                trailing_stop_increment=trailing_stop_increment,
+            )
+        trace = self._trace("create_open_position", epic, order_type)
         self.trading_rate_limit_pause_or_pass()
+        trace.mark("admitted")
         version = "2"
         params = {
             "currencyCode": currency_code,
@@ -1111,13 +1437,9 @@ class IGService:
         endpoint = "/positions/otc"
         action = "create"
 
+        trace.mark("sent")
         response = self._req(action, endpoint, params, session, version)
-
-        if response.status_code == 200:
-            deal_reference = json.loads(response.text)["dealReference"]
-            return self.fetch_deal_by_deal_reference(deal_reference)
-        else:
-            raise IGException(response.text)
+        return self._deal_confirm(response, block, trace)
 
     def update_open_position(
         self,
@@ -1130,9 +1452,13 @@ class IGService:
         trailing_stop_increment=None,
         session=None,
         version="2",
+        block=True,
     ):
-        """Updates an OTC position"""
+        """Updates an OTC position. Returns the deal confirmation, or with
+        block=False, a DealTicket for it"""
+        trace = self._trace("update_open_position")
         self.trading_rate_limit_pause_or_pass()
+        trace.mark("admitted")
         params = {}
         if limit_level is not None:
             params["limitLevel"] = limit_level
@@ -1150,101 +1476,117 @@ class IGService:
         url_params = {"deal_id": deal_id}
         endpoint = "/positions/otc/{deal_id}".format(**url_params)
         action = "update"
+        trace.mark("sent")
         response = self._req(action, endpoint, params, session, version)
+        return self._deal_confirm(response, block, trace)
 
-        if response.status_code == 200:
-            deal_reference = json.loads(response.text)["dealReference"]
-            return self.fetch_deal_by_deal_reference(deal_reference)
+    @staticmethod
+    def _working_order_columns(version):
+        """Nested working order columns to expand, for API version 1 or 2"""
+        col_names_v1 = [
+            "size",
+            "trailingStopDistance",
+            "direction",
+            "level",
+            "requestType",
+            "currencyCode",
+            "contingentLimit",
+            "trailingTriggerIncrement",
+            "dealId",
+            "contingentStop",
+            "goodTill",
+            "controlledRisk",
+            "trailingStopIncrement",
+            "createdDate",
+            "epic",
+            "trailingTriggerDistance",
+            "dma",
+        ]
+        col_names_v2 = [
+            "createdDate",
+            "currencyCode",
+            "dealId",
+            "direction",
+            "dma",
+            "epic",
+            "goodTillDate",
+            "goodTillDateISO",
+            "guaranteedStop",
+            "limitDistance",
+            "orderLevel",
+            "orderSize",
+            "orderType",
+            "stopDistance",
+            "timeInForce",
+        ]
+
+        d_cols = {
+            "marketData": [
+                "instrumentName",
+                "exchangeId",
+                "streamingPricesAvailable",
+                "offer",
+                "low",
+                "bid",
+                "updateTime",
+                "expiry",
+                "high",
+                "marketStatus",
+                "delayTime",
+                "lotSize",
+                "percentageChange",
+                "epic",
+                "netChange",
+                "instrumentType",
+                "scalingFactor",
+            ]
+        }
+
+        if version == "1":
+            d_cols["workingOrderData"] = col_names_v1
         else:
-            raise IGException(response.text)
+            d_cols["workingOrderData"] = col_names_v2
 
-    def fetch_working_orders(self, session=None, version="2"):
-        """Returns all open working orders for the active account"""
+        return d_cols
+
+    def _fetch_working_orders_raw(self, session=None, version="2"):
         self.non_trading_rate_limit_pause_or_pass()  # maybe considered trading request
         params = {}
         endpoint = "/workingorders"
         action = "read"
         response = self._req(action, endpoint, params, session, version)
-        data = self.parse_response(response.text)
+        return self.parse_response(response.text)
+
+    def fetch_working_orders(self, session=None, version="2"):
+        """Returns all open working orders for the active account"""
+        data = self._fetch_working_orders_raw(session, version)
         if self.return_dataframe:
             lst = data["workingOrders"]
             data = pd.DataFrame(lst)
 
-            col_names_v1 = [
-                "size",
-                "trailingStopDistance",
-                "direction",
-                "level",
-                "requestType",
-                "currencyCode",
-                "contingentLimit",
-                "trailingTriggerIncrement",
-                "dealId",
-                "contingentStop",
-                "goodTill",
-                "controlledRisk",
-                "trailingStopIncrement",
-                "createdDate",
-                "epic",
-                "trailingTriggerDistance",
-                "dma",
-            ]
-            col_names_v2 = [
-                "createdDate",
-                "currencyCode",
-                "dealId",
-                "direction",
-                "dma",
-                "epic",
-                "goodTillDate",
-                "goodTillDateISO",
-                "guaranteedStop",
-                "limitDistance",
-                "orderLevel",
-                "orderSize",
-                "orderType",
-                "stopDistance",
-                "timeInForce",
-            ]
-
-            d_cols = {
-                "marketData": [
-                    "instrumentName",
-                    "exchangeId",
-                    "streamingPricesAvailable",
-                    "offer",
-                    "low",
-                    "bid",
-                    "updateTime",
-                    "expiry",
-                    "high",
-                    "marketStatus",
-                    "delayTime",
-                    "lotSize",
-                    "percentageChange",
-                    "epic",
-                    "netChange",
-                    "instrumentType",
-                    "scalingFactor",
-                ]
-            }
-
-            if version == "1":
-                d_cols["workingOrderData"] = col_names_v1
-            else:
-                d_cols["workingOrderData"] = col_names_v2
+            d_cols = self._working_order_columns(version)
 
             if len(data) == 0:
-                data = pd.DataFrame(columns=self.colname_unique(d_cols))
-                return data
+                return empty_frame(nested_columns(d_cols), self.typed_columns)
 
             col_overlap_allowed = ["epic"]
 
             data = self.expand_columns(data, d_cols, False, col_overlap_allowed)
+            if self.typed_columns:
+                data = cast_frame(data)
 
             # d = data.to_dict()
             # data = pd.concat(list(map(pd.DataFrame, d.values())),
             #                  keys=list(d.keys())).T
+        elif self._backend:
+            data = self._backend.from_records(
+                *expand_records(
+                    data["workingOrders"],
+                    self._working_order_columns(version),
+                    False,
+                    ["epic"],
+                )
+            )
 
         return data
 
@@ -1267,9 +1609,28 @@ class IGService:
         deal_reference=None,
         force_open=False,
         session=None,
+        block=True,
     ):
-        """Creates an OTC working order"""
+        """Creates an OTC working order. Returns the deal confirmation, or with
+        block=False, a DealTicket for it. If an OrderValidator is attached, an
+        order that breaks the market's dealing rules raises
+        OrderValidationError before anything is sent"""
+        if self.validator is not None:
+            self.validator.validate_working_order(
+                epic,
+                direction=direction,
+                size=size,
+                level=level,
+                order_type=order_type,
+                stop_distance=stop_distance,
+                stop_level=stop_level,
+                limit_distance=limit_distance,
+                limit_level=limit_level,
+                guaranteed_stop=guaranteed_stop,
+            )
+        trace = self._trace("create_working_order", epic, order_type)
         self.trading_rate_limit_pause_or_pass()
+        trace.mark("admitted")
         version = "2"
         if good_till_date is not None and type(good_till_date) is not int:
             good_till_date = conv_datetime(good_till_date, version)
@@ -1304,29 +1665,24 @@ class IGService:
         endpoint = "/workingorders/otc"
         action = "create"
 
+        trace.mark("sent")
         response = self._req(action, endpoint, params, session, version)
+        return self._deal_confirm(response, block, trace)
 
-        if response.status_code == 200:
-            deal_reference = json.loads(response.text)["dealReference"]
-            return self.fetch_deal_by_deal_reference(deal_reference)
-        else:
-            raise IGException(response.text)
-
-    def delete_working_order(self, deal_id, session=None):
-        """Deletes an OTC working order"""
+    def delete_working_order(self, deal_id, session=None, block=True):
+        """Deletes an OTC working order. Returns the deal confirmation, or with
+        block=False, a DealTicket for it"""
+        trace = self._trace("delete_working_order")
         self.trading_rate_limit_pause_or_pass()
+        trace.mark("admitted")
         version = "2"
         params = {}
         url_params = {"deal_id": deal_id}
         endpoint = "/workingorders/otc/{deal_id}".format(**url_params)
         action = "delete"
+        trace.mark("sent")
         response = self._req(action, endpoint, params, session, version)
-
-        if response.status_code == 200:
-            deal_reference = json.loads(response.text)["dealReference"]
-            return self.fetch_deal_by_deal_reference(deal_reference)
-        else:
-            raise IGException(response.text)
+        return self._deal_confirm(response, block, trace)
 
     def update_working_order(
         self,
@@ -1341,9 +1697,13 @@ class IGService:
         order_type,
         deal_id,
         session=None,
+        block=True,
     ):
-        """Updates an OTC working order"""
+        """Updates an OTC working order. Returns the deal confirmation, or with
+        block=False, a DealTicket for it"""
+        trace = self._trace("update_working_order", None, order_type)
         self.trading_rate_limit_pause_or_pass()
+        trace.mark("admitted")
         version = "2"
         if good_till_date is not None and type(good_till_date) is not int:
             good_till_date = conv_datetime(good_till_date, version)
@@ -1361,13 +1721,9 @@ class IGService:
         url_params = {"deal_id": deal_id}
         endpoint = "/workingorders/otc/{deal_id}".format(**url_params)
         action = "update"
+        trace.mark("sent")
         response = self._req(action, endpoint, params, session, version)
-
-        if response.status_code == 200:
-            deal_reference = json.loads(response.text)["dealReference"]
-            return self.fetch_deal_by_deal_reference(deal_reference)
-        else:
-            raise IGException(response.text)
+        return self._deal_confirm(response, block, trace)
 
     def fetch_repeat_dealing_window(self, epic=None, session=None):
         """
@@ -1379,23 +1735,110 @@ class IGService:
         :return: repeat dealing windows for recently traded epics
         :rtype: dict
         """
-        self.non_trading_rate_limit_pause_or_pass()
         version = "1"
         params = {}
         if epic is not None:
             params["epic"] = epic
         endpoint = "/repeat-dealing-window"
-        action = "read"
-        for i in range(5):
-            response = self._req(action, endpoint, params, session, version)
-            if response.status_code != 200:
-                logger.info("Error fetching repeat dealing window, retrying.")
-                time.sleep(1)
-            else:
-                break
+        response = self._read_with_retry(
+            endpoint,
+            params,
+            session,
+            version,
+            None,
+            "Error fetching repeat dealing window, retrying.",
+        )
         data = self.parse_response(response.text)
         return data
 
+    def close_all_positions(
+        self, filter=None, order_type="MARKET", max_workers=4, session=None
+    ):
+        """
+        Closes open positions, all at once. The closing requests are sent
+        max_workers at a time (each still waits for the trading rate limiter,
+        if used), and confirms are fetched as soon as each deal reference is
+        known, rather than after every request has been sent
+
+        :param filter: function taking the raw (v2) position, eg
+            lambda p: p["market"]["epic"] == epic, and returning True if it
+            should be closed. Optional, default all positions
+        :type filter: function
+        :param order_type: order type of the closing deals
+        :type order_type: str
+        :param max_workers: maximum number of requests in flight
+        :type max_workers: int
+        :param session: session object. Optional
+        :type session: Session
+        :return: the outcome of each closing deal
+        :rtype: DealReport
+        """
+        positions = self._fetch_open_positions_raw(session)["positions"]
+        requests = [
+            {
+                "deal_id": p["position"]["dealId"],
+                "direction": "SELL" if p["position"]["direction"] == "BUY" else "BUY",
+                "epic": None,
+                "expiry": None,
+                "level": None,
+                "order_type": order_type,
+                "quote_id": None,
+                "size": p["position"]["size"],
+            }
+            for p in positions
+            if filter is None or filter(p)
+        ]
+        return self.submit_orders(requests, "close_open_position", max_workers, session)
+
+    def cancel_all_working_orders(self, filter=None, max_workers=4, session=None):
+        """
+        Deletes working orders, all at once, as close_all_positions()
+
+        :param filter: function taking the raw (v2) working order, eg
+            lambda o: o["marketData"]["epic"] == epic, and returning True if it
+            should be deleted. Optional, default all working orders
+        :type filter: function
+        :return: the outcome of each deletion
+        :rtype: DealReport
+        """
+        orders = self._fetch_working_orders_raw(session)["workingOrders"]
+        requests = [
+            {"deal_id": o["workingOrderData"]["dealId"]}
+            for o in orders
+            if filter is None or filter(o)
+        ]
+        return self.submit_orders(
+            requests, "delete_working_order", max_workers, session
+        )
+
+    def submit_orders(
+        self, orders, method="create_open_position", max_workers=4, session=None
+    ):
+        """
+        Submits a batch of deals, with confirms pipelined as for
+        close_all_positions()
+
+        :param orders: keyword arguments for each call of method
+        :type orders: list of dict
+        :param method: name of the dealing method, eg 'create_working_order'
+        :type method: str
+        :param max_workers: maximum number of requests in flight
+        :type max_workers: int
+        :param session: session object. Optional
+        :type session: Session
+        :return: the outcome of each deal, in the same order as orders
+        :rtype: DealReport
+        """
+        deal = getattr(self, method)
+
+        def submit(kwargs):
+            return deal(**kwargs, session=session, block=False)
+
+        tickets = map_concurrently(submit, orders, max_workers)
+        report = deal_report(orders, tickets)
+        logger.info(f"{method}: {report}")
+        return report
+
     # -------- END -------- #
 
     # -------- MARKETS -------- #
@@ -1445,32 +1888,16 @@ class IGService:
         response = self._req(action, endpoint, params, session, version)
         data = self.parse_response(response.text)
         if self.return_dataframe:
-            data["markets"] = pd.DataFrame(data["markets"])
-            if len(data["markets"]) == 0:
-                columns = [
-                    "bid",
-                    "delayTime",
-                    "epic",
-                    "expiry",
-                    "high",
-                    "instrumentName",
-                    "instrumentType",
-                    "lotSize",
-                    "low",
-                    "marketStatus",
-                    "netChange",
-                    "offer",
-                    "otcTradeable",
-                    "percentageChange",
-                    "scalingFactor",
-                    "streamingPricesAvailable",
-                    "updateTime",
-                ]
-                data["markets"] = pd.DataFrame(columns=columns)
-            data["nodes"] = pd.DataFrame(data["nodes"])
-            if len(data["nodes"]) == 0:
-                columns = ["id", "name"]
-                data["nodes"] = pd.DataFrame(columns=columns)
+            for key, columns in (
+                ("markets", NAVIGATION_MARKET_COLUMNS),
+                ("nodes", NAVIGATION_NODE_COLUMNS),
+            ):
+                if len(data[key]) == 0:
+                    data[key] = empty_frame(columns, self.typed_columns)
+                else:
+                    data[key] = pd.DataFrame(data[key])
+                    if self.typed_columns:
+                        data[key] = cast_frame(data[key])
         # if self.return_munch:
         #     # ToFix: ValueError: The truth value of a DataFrame is ambiguous.
         #     # Use a.empty, a.bool(), a.item(), a.any() or a.all().
@@ -1548,6 +1975,8 @@ class IGService:
         data = self.parse_response(response.text)
         if self.return_dataframe:
             data = pd.DataFrame(data["markets"])
+        elif self._backend:
+            data = self._backend.from_records(data["markets"])
         return data
 
     def search_markets_v2(self, epics, session=None):
@@ -1583,63 +2012,28 @@ class IGService:
         if len(prices) == 0:
             raise (Exception("Historical price data not found"))
 
-        def cols(typ):
-            return {
-                f"openPrice.{typ}": "Open",
-                f"highPrice.{typ}": "High",
-                f"lowPrice.{typ}": "Low",
-                f"closePrice.{typ}": "Close",
-                "lastTradedVolume": "Volume",
-            }
-
         last = prices[0]["lastTradedVolume"] or prices[0]["closePrice"]["lastTraded"]
-        df = json_normalize(prices)
-        df = df.set_index("snapshotTime")
-        df.index = pd.to_datetime(df.index, format=DATE_FORMATS[int(version)])
-        df.index.name = "DateTime"
-
-        df_ask = df[
-            ["openPrice.ask", "highPrice.ask", "lowPrice.ask", "closePrice.ask"]
-        ]
-        df_ask = df_ask.rename(columns=cols("ask"))
-
-        df_bid = df[
-            ["openPrice.bid", "highPrice.bid", "lowPrice.bid", "closePrice.bid"]
-        ]
-        df_bid = df_bid.rename(columns=cols("bid"))
-
-        if flag_calc_spread:
-            df_spread = df_ask - df_bid
+        times, values, volumes = price_arrays(prices)
+        index = self._price_index(times)
 
-        if last:
-            df_last = df[
-                [
-                    "openPrice.lastTraded",
-                    "highPrice.lastTraded",
-                    "lowPrice.lastTraded",
-                    "closePrice.lastTraded",
-                    "lastTradedVolume",
-                ]
-            ]
-            df_last = df_last.rename(columns=cols("lastTraded"))
-
-        data = [df_bid, df_ask]
+        names = ["Open", "High", "Low", "Close"]
         keys = ["bid", "ask"]
+        blocks = [values[:, 0], values[:, 1]]
         if flag_calc_spread:
-            data.append(df_spread)
             keys.append("spread")
-
+            blocks.append(values[:, 1] - values[:, 0])
         if last:
-            data.append(df_last)
             keys.append("last")
+            blocks.append(values[:, 2])
 
-        df2 = pd.concat(data, axis=1, keys=keys)
-
-        # force all object columns to be numeric, NaN if error
-        for col in df2.select_dtypes(include=["object"]).columns:
-            df2[col] = pd.to_numeric(df2[col], errors="coerce")
+        data = {}
+        for key, block in zip(keys, blocks):
+            for i, name in enumerate(names):
+                data[(key, name)] = block[:, i]
+            if key == "last":
+                data[(key, "Volume")] = volumes
 
-        return df2
+        return pd.DataFrame(data, index=index)
 
     def flat_prices(self, prices, version):
         """
@@ -1659,38 +2053,13 @@ class IGService:
         if len(prices) == 0:
             raise (Exception("Historical price data not found"))
 
-        df = json_normalize(prices)
-        if version == "3":
-            df = df.set_index("snapshotTimeUTC")
-            df = df.drop(columns=["snapshotTime"])
-            date_format = "%Y-%m-%dT%H:%M:%S"
-        else:
-            df = df.set_index("snapshotTime")
-            date_format = DATE_FORMATS[int(version)]
-        df.index = pd.to_datetime(df.index, format=date_format)
-        df.index.name = "DateTime"
-        df = df.drop(
-            columns=[
-                "openPrice.lastTraded",
-                "closePrice.lastTraded",
-                "highPrice.lastTraded",
-                "lowPrice.lastTraded",
-            ]
-        )
-        df = df.rename(
-            columns={
-                "openPrice.bid": "open.bid",
-                "openPrice.ask": "open.ask",
-                "closePrice.bid": "close.bid",
-                "closePrice.ask": "close.ask",
-                "highPrice.bid": "high.bid",
-                "highPrice.ask": "high.ask",
-                "lowPrice.bid": "low.bid",
-                "lowPrice.ask": "low.ask",
-                "lastTradedVolume": "volume",
-            }
-        )
-        return df
+        times, values, volumes = self._flat_price_arrays(prices, version)
+        data = {"volume": volumes}
+        for field, i in (("open", 0), ("close", 3), ("high", 1), ("low", 2)):
+            data[f"{field}.bid"] = values[:, 0, i]
+            data[f"{field}.ask"] = values[:, 1, i]
+
+        return pd.DataFrame(data, index=self._price_index(times))
 
     def mid_prices(self, prices, version):
         """
@@ -1711,41 +2080,112 @@ class IGService:
         if len(prices) == 0:
             raise (Exception("Historical price data not found"))
 
-        df = json_normalize(prices)
-        if version == "3":
-            df = df.set_index("snapshotTimeUTC")
-            df = df.drop(columns=["snapshotTime"])
-            date_format = "%Y-%m-%dT%H:%M:%S"
-        else:
-            df = df.set_index("snapshotTime")
-            date_format = DATE_FORMATS[int(version)]
-        df.index = pd.to_datetime(df.index, format=date_format)
-        df.index.name = "DateTime"
-
-        df["Open"] = df[["openPrice.bid", "openPrice.ask"]].mean(axis=1)
-        df["High"] = df[["highPrice.bid", "highPrice.ask"]].mean(axis=1)
-        df["Low"] = df[["lowPrice.bid", "lowPrice.ask"]].mean(axis=1)
-        df["Close"] = df[["closePrice.bid", "closePrice.ask"]].mean(axis=1)
-
-        df = df.drop(
-            columns=[
-                "openPrice.lastTraded",
-                "closePrice.lastTraded",
-                "highPrice.lastTraded",
-                "lowPrice.lastTraded",
-                "openPrice.bid",
-                "openPrice.ask",
-                "closePrice.bid",
-                "closePrice.ask",
-                "highPrice.bid",
-                "highPrice.ask",
-                "lowPrice.bid",
-                "lowPrice.ask",
-            ]
+        times, values, volumes = self._flat_price_arrays(prices, version)
+        # like DataFrame.mean(), use whichever of bid and ask is present
+        bid, ask = values[:, 0], values[:, 1]
+        mid = np.where(
+            np.isnan(bid), ask, np.where(np.isnan(ask), bid, (bid + ask) / 2)
+        )
+
+        data = {"Volume": volumes}
+        for i, name in enumerate(["Open", "High", "Low", "Close"]):
+            data[name] = mid[:, i]
+
+        return pd.DataFrame(data, index=self._price_index(times))
+
+    def structured_prices(self, prices, version, price_dtype=None):
+        """
+        Format price data as a NumPy structured array, one record per bar, with
+        fields 'time' (datetime64[s]), bid and ask OHLC ('bid_open', 'bid_high',
+        ... 'ask_close') and 'volume' (int64, -1 if missing). pandas is not
+        needed. Times are UTC for v3, otherwise as returned by IG. This is the
+        default formatter when the output format is 'numpy'
+
+        param prices: raw price data
+        :type prices: list of dict
+        :param version: API endpoint version
+        :type version: str
+        :param price_dtype: dtype for prices. Optional, default float64. Use
+            float32 to halve the size of each record
+        :type price_dtype: numpy.dtype
+        :return: prices as a structured array
+        :rtype: numpy.ndarray
+        """
+
+        if len(prices) == 0:
+            raise (Exception("Historical price data not found"))
+
+        columns = self._price_columns(prices, version, price_dtype)
+        volumes = columns["volume"]
+        if volumes.dtype.kind == "f":
+            columns["volume"] = np.where(np.isnan(volumes), -1, volumes).astype(
+                np.int64
+            )
+
+        records = np.empty(
+            len(prices), dtype=[(name, col.dtype) for name, col in columns.items()]
         )
-        df = df.rename(columns={"lastTradedVolume": "Volume"})
+        for name, col in columns.items():
+            records[name] = col
+        return records
+
+    def table_prices(self, prices, version):
+        """
+        Format price data with the tabular backend set by the output format,
+        eg as a pyarrow Table or Polars DataFrame. Columns are as for
+        structured_prices(), except that missing volumes are null/NaN. This is
+        the default formatter when the output format is a backend name
+
+        param prices: raw price data
+        :type prices: list of dict
+        :param version: API endpoint version
+        :type version: str
+        :return: prices as a table
+        """
 
-        return df
+        if len(prices) == 0:
+            raise (Exception("Historical price data not found"))
+
+        return self._backend.from_arrays(self._price_columns(prices, version))
+
+    @staticmethod
+    def _price_columns(prices, version, price_dtype=None):
+        """Returns a dict of NumPy arrays, one per price column"""
+        if price_dtype is None:
+            price_dtype = np.float64
+        time_key = "snapshotTimeUTC" if version == "3" else "snapshotTime"
+        times, values, volumes = price_arrays(prices, time_key)
+
+        columns = {"time": parse_timestamps(times)}
+        for i, typ in enumerate(("bid", "ask")):
+            for j, name in enumerate(("open", "high", "low", "close")):
+                columns[f"{typ}_{name}"] = values[:, i, j].astype(price_dtype)
+        columns["volume"] = volumes
+        return columns
+
+    def _format_price_data(self, prices, version, format=None):
+        """Applies format to raw price data, according to the output format"""
+        if self.output_format == "dict":
+            return prices
+        if format is None:
+            if self.output_format == "numpy":
+                format = self.structured_prices
+            elif self._backend:
+                format = self.table_prices
+            else:
+                format = self.format_prices
+        return format(prices, version)
+
+    @staticmethod
+    def _flat_price_arrays(prices, version):
+        time_key = "snapshotTimeUTC" if version == "3" else "snapshotTime"
+        return price_arrays(prices, time_key)
+
+    @staticmethod
+    def _price_index(times):
+        # nanoseconds, as pandas.to_datetime() would give
+        times = parse_timestamps(times).astype("datetime64[ns]")
+        return pd.DatetimeIndex(times, name="DateTime")
 
     def fetch_historical_prices_by_epic(
         self,
@@ -1791,9 +2231,87 @@ class IGService:
         :raises Exception: raises an exception if any error is encountered
         """
 
+        version = "3"
+        prices = []
+        for data in self._historical_price_pages(
+            epic, resolution, start_date, end_date, numpoints, pagesize, session, wait
+        ):
+            prices.extend(data["prices"])
+
+        data["prices"] = prices
+
+        data["prices"] = self._format_price_data(data["prices"], version, format)
+        self.log_allowance(data["metadata"])
+        return data
+
+    def iter_historical_prices(
+        self,
+        epic,
+        resolution=None,
+        start_date=None,
+        end_date=None,
+        numpoints=None,
+        pagesize=20,
+        session=None,
+        format=None,
+        wait=1,
+    ):
+        """
+        Fetches historical prices for the given epic, one page at a time.
+
+        Takes the same parameters as fetch_historical_prices_by_epic(), but
+        instead of collecting every page before formatting, each page is
+        formatted and yielded as soon as it arrives. Only one page is held in
+        memory at a time, so large ranges can be written to disk, or fed into
+        calculations, as they are downloaded.
+
+        :param epic: (str) The epic key for which historical prices are being
+            requested
+        :param resolution: (str, optional) timescale resolution, see
+            fetch_historical_prices_by_epic()
+        :param start_date: (datetime, optional) date range start
+        :param end_date: (datetime, optional) date range end
+        :param numpoints: (int, optional) number of data points
+        :param pagesize: (int, optional) number of data points per page.
+            Default is 20
+        :param session: (Session, optional) session object
+        :param format: (function, optional) function to convert the raw
+            JSON data for each page. Use ``lambda prices, version: prices`` to
+            get the raw pages
+        :param wait: (int, optional) how many seconds to wait between successive
+            calls. Default is 1
+        :returns: generator of Pandas DataFrames if configured, otherwise of
+            lists of dict
+        :raises Exception: raises an exception if any error is encountered
+        """
+        version = "3"
+        data = None
+        try:
+            for data in self._historical_price_pages(
+                epic,
+                resolution,
+                start_date,
+                end_date,
+                numpoints,
+                pagesize,
+                session,
+                wait,
+            ):
+                if len(data["prices"]) == 0:
+                    continue
+                yield self._format_price_data(data["prices"], version, format)
+        finally:
+            # also when the caller stops early, for the pages already fetched
+            if data is not None:
+                self.log_allowance(data["metadata"])
+
+    def _historical_price_pages(
+        self, epic, resolution, start_date, end_date, numpoints, pagesize, session, wait
+    ):
+        """Yields the parsed response for each page of the v3 /prices endpoint"""
         version = "3"
         params = {}
-        if resolution and self.return_dataframe:
+        if resolution:
             params["resolution"] = conv_resol(resolution)
         if start_date:
             params["from"] = start_date
@@ -1805,15 +2323,15 @@ class IGService:
         url_params = {"epic": epic}
         endpoint = "/prices/{epic}".format(**url_params)
         action = "read"
-        prices = []
         pagenumber = 1
         more_results = True
 
         while more_results:
             params["pageNumber"] = pagenumber
+            # every page counts, eg when several epics are paged at once
+            self.non_trading_rate_limit_pause_or_pass()
             response = self._req(action, endpoint, params, session, version)
             data = self.parse_response(response.text)
-            prices.extend(data["prices"])
             page_data = data["metadata"]["pageData"]
             if page_data["totalPages"] == 0 or (
                 page_data["pageNumber"] == page_data["totalPages"]
@@ -1821,16 +2339,9 @@ class IGService:
                 more_results = False
             else:
                 pagenumber += 1
-            time.sleep(wait)
-
-        data["prices"] = prices
-
-        if format is None:
-            format = self.format_prices
-        if self.return_dataframe:
-            data["prices"] = format(data["prices"], version)
-        self.log_allowance(data["metadata"])
-        return data
+            yield data
+            if more_results:
+                time.sleep(wait)
 
     def fetch_historical_prices_by_epic_and_num_points(
         self, epic, resolution, numpoints, session=None, format=None
@@ -1838,18 +2349,14 @@ class IGService:
         """Returns a list of historical prices for the given epic, resolution,
         number of points"""
         version = "2"
-        if self.return_dataframe:
-            resolution = conv_resol(resolution)
+        resolution = conv_resol(resolution)
         params = {}
         url_params = {"epic": epic, "resolution": resolution, "numpoints": numpoints}
         endpoint = "/prices/{epic}/{resolution}/{numpoints}".format(**url_params)
         action = "read"
         response = self._req(action, endpoint, params, session, version)
         data = self.parse_response(response.text)
-        if format is None:
-            format = self.format_prices
-        if self.return_dataframe:
-            data["prices"] = format(data["prices"], version)
+        data["prices"] = self._format_price_data(data["prices"], version, format)
         return data
 
     def fetch_historical_prices_by_epic_and_date_range(
@@ -1887,8 +2394,7 @@ class IGService:
         :return: historic data
         :rtype: dict, with 'prices' element as pandas.Dataframe
         """
-        if self.return_dataframe:
-            resolution = conv_resol(resolution)
+        resolution = conv_resol(resolution)
         params = {}
         if version == "1":
             start_date = conv_datetime(start_date, version)
@@ -1910,18 +2416,189 @@ class IGService:
         response = self._req(action, endpoint, params, session, version)
         del self.session.headers["VERSION"]
         data = self.parse_response(response.text)
-        if format is None:
-            format = self.format_prices
-        if self.return_dataframe:
-            data["prices"] = format(data["prices"], version)
+        data["prices"] = self._format_price_data(data["prices"], version, format)
         return data
 
+    def fetch_historical_prices_multi(
+        self,
+        epics,
+        resolution=None,
+        start_date=None,
+        end_date=None,
+        numpoints=None,
+        pagesize=20,
+        session=None,
+        format=None,
+        wait=1,
+        max_workers=4,
+        panel=False,
+    ):
+        """
+        Fetches historical prices for many epics concurrently, with
+        fetch_historical_prices_by_epic(). Each fetch waits for the non-trading
+        rate limiter (if in use), and no new fetches are started once the
+        historical data allowance has run out.
+
+        :param epics: (list) the epics for which historical prices are being
+            requested
+        :param resolution: (str, optional) timescale resolution, see
+            fetch_historical_prices_by_epic()
+        :param start_date: (datetime, optional) date range start
+        :param end_date: (datetime, optional) date range end
+        :param numpoints: (int, optional) number of data points
+        :param pagesize: (int, optional) number of data points per page
+        :param session: (Session, optional) session object
+        :param format: (function, optional) function to convert the raw
+            JSON response
+        :param wait: (int, optional) how many seconds to wait between successive
+            calls in a multi-page scenario, per epic. Default is 1
+        :param max_workers: (int, optional) maximum number of epics fetched at
+            the same time. Default is 4
+        :param panel: (bool, optional) if True, and dataframes are configured,
+            return a single DataFrame with the epic as the top level of the
+            column index. Default is False
+        :returns: dict, with 'prices' element containing the prices for each epic
+            that was fetched successfully, and 'errors' element containing the
+            exception for each epic that failed. If dataframes are configured,
+            the price frames are aligned on a common DatetimeIndex
+        """
+
+        def fetch(epic):
+            self._check_historical_allowance()
+            return self.fetch_historical_prices_by_epic(
+                epic,
+                resolution=resolution,
+                start_date=start_date,
+                end_date=end_date,
+                numpoints=numpoints,
+                pagesize=pagesize,
+                session=session,
+                format=format,
+                wait=wait,
+            )
+
+        prices = {}
+        errors = {}
+        for epic, (data, ex) in zip(epics, map_concurrently(fetch, epics, max_workers)):
+            if ex is None:
+                prices[epic] = data["prices"]
+            else:
+                logger.warning(f"Failed to fetch historical prices for {epic}: {ex}")
+                errors[epic] = ex
+
+        if self.return_dataframe and prices:
+            frames = list(prices.values())
+            index = frames[0].index
+            for frame in frames[1:]:
+                index = index.union(frame.index)
+            prices = {epic: df.reindex(index) for epic, df in prices.items()}
+            if panel:
+                prices = pd.concat(prices, axis=1)
+
+        return {"prices": prices, "errors": errors}
+
+    def fetch_historical_prices_by_epic_in_chunks(
+        self,
+        epic,
+        resolution,
+        start_date,
+        end_date,
+        max_points=DEFAULT_MAX_POINTS,
+        pagesize=None,
+        session=None,
+        format=None,
+        wait=1,
+        max_workers=4,
+    ):
+        """
+        Fetches historical prices for a date range of any size. The range is
+        split into chunks of at most max_points bars (see
+        trading_ig.planner.plan_chunks()), which are fetched concurrently with
+        fetch_historical_prices_by_epic(), then joined back together, with the
+        bars duplicated where chunks meet removed.
+
+        Before anything is fetched, the number of bars is estimated, and if
+        it's more than the remaining historical data allowance (as of the last
+        price request), ApiExceededException is raised. Chunks are started in
+        date order, and no new chunks are started once the allowance has run
+        out.
+
+        :param epic: (str) The epic key for which historical prices are being
+            requested
+        :param resolution: (str) timescale resolution, see
+            fetch_historical_prices_by_epic()
+        :param start_date: (datetime or str) date range start, UTC
+        :param end_date: (datetime or str) date range end, UTC
+        :param max_points: (int, optional) maximum number of bars per chunk.
+            Default is DEFAULT_MAX_POINTS
+        :param pagesize: (int, optional) number of data points per page.
+            Default is max_points, so each chunk is a single request
+        :param session: (Session, optional) session object
+        :param format: (function, optional) function to convert the raw
+            JSON response
+        :param wait: (int, optional) how many seconds to wait between successive
+            pages of a chunk. Default is 1
+        :param max_workers: (int, optional) maximum number of chunks fetched at
+            the same time. Default is 4
+        :returns: dict, with 'prices' element formatted as configured, and
+            'metadata' element including the 'chunks' fetched
+        :raises Exception: the first exception raised fetching any chunk
+        """
+        version = "3"
+        if pagesize is None:
+            pagesize = max_points
+        chunks = plan_chunks(start_date, end_date, resolution, max_points)
+        self._check_historical_allowance(estimate_points(chunks, resolution))
+        logger.info(
+            f"Fetching {epic} {start_date} -> {end_date} in {len(chunks)} chunk(s)"
+        )
+
+        def fetch(chunk):
+            self._check_historical_allowance()
+            return self.fetch_historical_prices_by_epic(
+                epic,
+                resolution=resolution,
+                start_date=chunk[0],
+                end_date=chunk[1],
+                pagesize=pagesize,
+                session=session,
+                format=lambda prices, version: prices,
+                wait=wait,
+            )
+
+        results = map_concurrently(fetch, chunks, max_workers)
+        for chunk, (_, ex) in zip(chunks, results):
+            if ex is not None:
+                logger.warning(f"Failed to fetch {epic} {chunk[0]} -> {chunk[1]}")
+                raise ex
+
+        prices = stitch_chunks([data["prices"] for data, _ in results])
+        metadata = dict(results[-1][0]["metadata"])
+        metadata["chunks"] = chunks
+        return {
+            "prices": self._format_price_data(prices, version, format),
+            "metadata": metadata,
+        }
+
+    def _check_historical_allowance(self, points=1):
+        """Raises ApiExceededException if the historical data allowance, as of
+        the last price request, won't cover the given number of points"""
+        if self._historical_allowance is None:
+            return
+        remaining, expiry = self._historical_allowance
+        if remaining < points and datetime.now(timezone.utc) < expiry:
+            raise ApiExceededException(
+                f"Historical price data allowance ({remaining}) too low for "
+                f"{points} points, resets at {expiry}"
+            )
+
     def log_allowance(self, data):
         remaining_allowance = data["allowance"]["remainingAllowance"]
         allowance_expiry_secs = data["allowance"]["allowanceExpiry"]
         allowance_expiry = datetime.now(timezone.utc) + timedelta(
             seconds=allowance_expiry_secs
         )
+        self._historical_allowance = (remaining_allowance, allowance_expiry)
         logger.info(
             f"Historic price data allowance: {remaining_allowance} "
             f"remaining until {allowance_expiry}"
@@ -2018,6 +2695,10 @@ class IGService:
         self._req(action, endpoint, params, session, version)
         self.session.close()
         self._exit_bucket_threads()
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
 
     def get_encryption_key(self, session=None):
         """Get encryption key to encrypt the password"""
@@ -0,0 +1,91 @@
+"""
+Backoff for requests that are expected to succeed shortly, like fetching the
+confirm of a deal that has just been placed. Unlike a tenacity retryer (see
+IGService(retryer=...)), which handles rate limits and API errors for every
+request, a RetryPolicy waits on a result that isn't ready yet: the first
+retry comes quickly, waits grow from there, and it gives up at a deadline
+"""
+
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class RetryPolicy:
+    """
+    Retries with exponential backoff and jitter, until a deadline
+
+        policy = RetryPolicy(initial=0.05, deadline=3)
+        response = policy.call(fetch, lambda r: r.status_code != 200)
+
+    :param initial: seconds to wait before the first retry
+    :type initial: float
+    :param multiplier: how much the wait grows after each retry
+    :type multiplier: float
+    :param max_delay: the longest wait between two attempts, in seconds
+    :type max_delay: float
+    :param jitter: the fraction of each wait that is random, so that
+        concurrent lookups don't retry in step. 0 for fixed waits
+    :type jitter: float
+    :param deadline: seconds after the first attempt to stop retrying
+    :type deadline: float
+    """
+
+    def __init__(
+        self, initial=0.1, multiplier=2.0, max_delay=1.0, jitter=0.2, deadline=5.0
+    ):
+        if initial <= 0 or multiplier < 1 or not 0 <= jitter <= 1:
+            raise ValueError(
+                "RetryPolicy needs initial > 0, multiplier >= 1 and 0 <= jitter <= 1"
+            )
+        self.initial = initial
+        self.multiplier = multiplier
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.deadline = deadline
+
+    def __repr__(self):
+        return (
+            f"RetryPolicy(initial={self.initial}, multiplier={self.multiplier}, "
+            f"max_delay={self.max_delay}, jitter={self.jitter}, "
+            f"deadline={self.deadline})"
+        )
+
+    def delays(self):
+        """Yields the nominal wait before each retry, without jitter"""
+        delay = self.initial
+        while True:
+            yield min(delay, self.max_delay)
+            delay *= self.multiplier
+
+    def call(self, attempt, retry_if, deadline=None, message=None):
+        """
+        Calls attempt() until retry_if(result) is false or the deadline has
+        passed, and returns the last result
+        :param attempt: makes one attempt
+        :type attempt: callable
+        :param retry_if: whether a result calls for another attempt
+        :type retry_if: callable
+        :param deadline: seconds to keep retrying for, instead of the policy's
+        :type deadline: float
+        :param message: logged before each retry
+        :type message: str
+        """
+        if deadline is None:
+            deadline = self.deadline
+        end = time.monotonic() + deadline
+        result = attempt()
+        for delay in self.delays():
+            if not retry_if(result):
+                break
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            if message is not None:
+                logger.info(message)
+            delay *= 1 - self.jitter * random.random()
+            time.sleep(min(delay, remaining))
+            result = attempt()
+        return result
@@ -0,0 +1,204 @@
+"""
+Column names and dtypes of the DataFrames returned by IGService. Empty results
+get their columns from here, and, with IGService(typed_columns=True), results
+are cast to these dtypes in one go instead of being left as object columns
+"""
+
+import re
+
+from .utils import _HAS_PANDAS
+
+if _HAS_PANDAS:
+    import pandas as pd
+
+DATETIME = "datetime64[ns, UTC]"
+FLOAT = "float64"
+CATEGORY = "category"
+# text like '£-1.23', cast to FLOAT once the currency symbol is stripped
+AMOUNT = "amount"
+
+# column -> dtype, for every endpoint. Columns not listed are left alone, so
+# dates without a timezone (eg 'createdDate') and times of day (eg
+# 'updateTimeUTC') stay as text
+DTYPES = {
+    # dates
+    "createdDateUTC": DATETIME,
+    "dateUtc": DATETIME,
+    "openDateUtc": DATETIME,
+    # numbers
+    "bid": FLOAT,
+    "closeLevel": FLOAT,
+    "contractSize": FLOAT,
+    "dealSize": FLOAT,
+    "high": FLOAT,
+    "level": FLOAT,
+    "limit": FLOAT,
+    "limitDistance": FLOAT,
+    "limitLevel": FLOAT,
+    "limitedRiskPremium": FLOAT,
+    "lotSize": FLOAT,
+    "low": FLOAT,
+    "netChange": FLOAT,
+    "offer": FLOAT,
+    "openLevel": FLOAT,
+    "orderLevel": FLOAT,
+    "orderSize": FLOAT,
+    "percentageChange": FLOAT,
+    "scalingFactor": FLOAT,
+    "size": FLOAT,
+    "stop": FLOAT,
+    "stopDistance": FLOAT,
+    "stopLevel": FLOAT,
+    "trailingStep": FLOAT,
+    "trailingStopDistance": FLOAT,
+    "profitAndLoss": AMOUNT,
+    # low cardinality text
+    "currency": CATEGORY,
+    "currencyCode": CATEGORY,
+    "direction": CATEGORY,
+    "epic": CATEGORY,
+    "instrumentType": CATEGORY,
+    "marketStatus": CATEGORY,
+    "transactionType": CATEGORY,
+}
+
+ACCOUNT_COLUMNS = [
+    "accountAlias",
+    "accountId",
+    "accountName",
+    "accountType",
+    "balance",
+    "available",
+    "balance",
+    "deposit",
+    "profitLoss",
+    "canTransferFrom",
+    "canTransferTo",
+    "currency",
+    "preferred",
+    "status",
+]
+
+ACTIVITY_V1_COLUMNS = [
+    "actionStatus",
+    "activity",
+    "activityHistoryId",
+    "channel",
+    "currency",
+    "date",
+    "dealId",
+    "epic",
+    "level",
+    "limit",
+    "marketName",
+    "period",
+    "result",
+    "size",
+    "stop",
+    "stopType",
+    "time",
+]
+
+TRANSACTION_V1_COLUMNS = [
+    "cashTransaction",
+    "closeLevel",
+    "currency",
+    "date",
+    "instrumentName",
+    "openLevel",
+    "period",
+    "profitAndLoss",
+    "reference",
+    "size",
+    "transactionType",
+]
+
+TRANSACTION_COLUMNS = [
+    "cashTransaction",
+    "closeLevel",
+    "currency",
+    "date",
+    "dateUtc",
+    "instrumentName",
+    "openLevel",
+    "period",
+    "profitAndLoss",
+    "reference",
+    "size",
+    "transactionType",
+]
+
+NAVIGATION_MARKET_COLUMNS = [
+    "bid",
+    "delayTime",
+    "epic",
+    "expiry",
+    "high",
+    "instrumentName",
+    "instrumentType",
+    "lotSize",
+    "low",
+    "marketStatus",
+    "netChange",
+    "offer",
+    "otcTradeable",
+    "percentageChange",
+    "scalingFactor",
+    "streamingPricesAvailable",
+    "updateTime",
+]
+
+NAVIGATION_NODE_COLUMNS = ["id", "name"]
+
+# what to strip from an amount, eg '£-1.23', to parse it
+_NOT_AMOUNT = re.compile(r"[^0-9.\-]")
+
+
+def nested_columns(d_cols):
+    """Returns the column names of expanded nested data, in order, each once"""
+    return list(dict.fromkeys(col for cols in d_cols.values() for col in cols))
+
+
+def empty_frame(columns, typed=False):
+    """
+    Returns a DataFrame with no rows
+    :param columns: column names
+    :type columns: list of str
+    :param typed: give the columns their dtypes from DTYPES, otherwise object
+    :type typed: bool
+    :rtype: pandas.DataFrame
+    """
+    data = pd.DataFrame(columns=columns)
+    if typed:
+        data = cast_frame(data)
+    return data
+
+
+def cast_frame(data):
+    """
+    Casts the columns of a DataFrame listed in DTYPES. Text numbers (eg '+1',
+    '-' for none) and amounts are parsed first, then everything is cast with
+    a single astype(). data itself is left unchanged
+    :param data: data, as returned by IGService
+    :type data: pandas.DataFrame
+    :return: a copy of data, with typed columns
+    :rtype: pandas.DataFrame
+    """
+    parsed = {}
+    dtypes = {}
+    for col in data.columns:
+        dtype = DTYPES.get(col)
+        if dtype is None:
+            continue
+        if dtype == AMOUNT:
+            amounts = data[col].astype(str).str.replace(_NOT_AMOUNT, "", regex=True)
+            parsed[col] = pd.to_numeric(amounts, errors="coerce")
+            dtype = FLOAT
+        elif dtype == FLOAT and data[col].dtype == object:
+            parsed[col] = pd.to_numeric(data[col], errors="coerce")
+        elif dtype == DATETIME:
+            parsed[col] = pd.to_datetime(
+                data[col], utc=True, format="ISO8601", errors="coerce"
+            )
+        dtypes[col] = dtype
+    return data.assign(**parsed).astype(dtypes)
@@ -0,0 +1,366 @@
+"""
+Local persistent store for historical price data
+"""
+
+import logging
+import sqlite3
+from datetime import datetime, timezone
+from threading import Lock
+
+from .resample import check_resolutions, resample_prices
+from .utils import conv_resol
+
+logger = logging.getLogger(__name__)
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+# (raw price field, price type) pairs, in the order they are stored
+BAR_FIELDS = [
+    (field, typ)
+    for field in ("openPrice", "closePrice", "highPrice", "lowPrice")
+    for typ in ("bid", "ask", "lastTraded")
+]
+BAR_COLUMNS = [f"{field}_{typ}" for field, typ in BAR_FIELDS]
+
+
+def to_utc_string(dt):
+    """Converts a datetime, or a string like 2020-09-01T00:00:00, to a string
+    in the v3 UTC format. Naive datetimes are assumed to be UTC"""
+    if isinstance(dt, str):
+        dt = datetime.fromisoformat(dt)
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return dt.strftime(TIME_FORMAT)
+
+
+def missing_ranges(start, end, covered):
+    """
+    Returns the parts of the range start -> end that are not in covered
+    :param start: range start
+    :type start: str
+    :param end: range end
+    :type end: str
+    :param covered: ranges already covered, sorted by start and not overlapping
+    :type covered: list of (str, str) tuples
+    :return: the missing sub ranges
+    :rtype: list of (str, str) tuples
+    """
+    gaps = []
+    cursor = start
+    for cov_start, cov_end in covered:
+        if cov_end < cursor:
+            continue
+        if cov_start > end:
+            break
+        if cov_start > cursor:
+            gaps.append((cursor, cov_start))
+        cursor = max(cursor, cov_end)
+        if cursor >= end:
+            break
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+def merge_ranges(ranges):
+    """Merges overlapping or touching ranges"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class PriceStore:
+    """
+    A local store of historical price bars, keyed by epic and resolution, which
+    sits in front of IGService.fetch_historical_prices_by_epic(). Bars are
+    persisted in SQLite, along with the time ranges already fetched. When a
+    range is requested, anything already covered is served from disk, and only
+    the missing sub-ranges are requested from IG - so repeat requests cost
+    nothing from the historical data allowance.
+
+    Dates are compared with the 'snapshotTimeUTC' of each bar, so the range
+    should be given in UTC
+    """
+
+    def __init__(self, ig_service, path="prices.sqlite"):
+        """
+        :param ig_service: service used to fetch any missing data
+        :type ig_service: IGService
+        :param path: SQLite database file. Use ':memory:' for a temporary store
+        :type path: str
+        """
+        self.ig_service = ig_service
+        self.path = path
+        self._lock = Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._create_tables()
+
+    def _create_tables(self):
+        bar_cols = ", ".join(f"{col} REAL" for col in BAR_COLUMNS)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"""CREATE TABLE IF NOT EXISTS bars (
+                    epic TEXT NOT NULL,
+                    resolution TEXT NOT NULL,
+                    time TEXT NOT NULL,
+                    snapshot_time TEXT NOT NULL,
+                    {bar_cols},
+                    volume REAL,
+                    PRIMARY KEY (epic, resolution, time)
+                ) WITHOUT ROWID"""
+            )
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS coverage (
+                    epic TEXT NOT NULL,
+                    resolution TEXT NOT NULL,
+                    start TEXT NOT NULL,
+                    end TEXT NOT NULL
+                )"""
+            )
+            self._conn.execute(
+                """CREATE INDEX IF NOT EXISTS coverage_key
+                    ON coverage (epic, resolution, start)"""
+            )
+
+    def close(self):
+        self._conn.close()
+
+    def _resolution_key(self, resolution):
+        # IG's name, as sent by the fetch methods, whatever the output format
+        return conv_resol(resolution)
+
+    def coverage(self, epic, resolution):
+        """
+        Returns the time ranges already stored for an epic and resolution
+        :param epic: IG epic
+        :type epic: str
+        :param resolution: resolution, as passed to the fetch methods
+        :type resolution: str
+        :return: list of (start, end) tuples
+        :rtype: list
+        """
+        key = self._resolution_key(resolution)
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT start, end FROM coverage
+                    WHERE epic = ? AND resolution = ? ORDER BY start""",
+                (epic, key),
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def fetch(self, epic, resolution, start_date, end_date, pagesize=None, format=None):
+        """
+        Returns historical prices for the given epic, resolution and date range,
+        using stored data where possible and fetching just the missing parts
+        from IG
+
+        :param epic: IG epic
+        :type epic: str
+        :param resolution: timescale resolution, as for
+            IGService.fetch_historical_prices_by_epic()
+        :type resolution: str
+        :param start_date: range start, UTC
+        :type start_date: datetime or str
+        :param end_date: range end, UTC
+        :type end_date: datetime or str
+        :param pagesize: page size for any requests to IG. Optional
+        :type pagesize: int
+        :param format: function to convert the raw price data. Optional,
+            default according to the output format of the IGService
+        :type format: function
+        :return: prices, plus metadata about what was fetched
+        :rtype: dict, with 'prices' element formatted as configured
+        """
+        start = to_utc_string(start_date)
+        end = to_utc_string(end_date)
+        key = self._resolution_key(resolution)
+
+        gaps = missing_ranges(start, end, self.coverage(epic, resolution))
+        fetched = 0
+        for gap_start, gap_end in gaps:
+            fetched += self._fetch_range(
+                epic, resolution, key, gap_start, gap_end, pagesize
+            )
+
+        prices = self.read(epic, resolution, start, end)
+        metadata = {"fetchedRanges": gaps, "fetchedBars": fetched}
+        logger.info(
+            f"PriceStore {epic} {key} {start} -> {end}: {len(prices)} bars, "
+            f"{fetched} fetched from IG in {len(gaps)} request(s)"
+        )
+
+        prices = self.ig_service._format_price_data(prices, "3", format)
+        return {"prices": prices, "metadata": metadata}
+
+    def fetch_resampled(
+        self,
+        epic,
+        resolution,
+        source_resolution,
+        start_date,
+        end_date,
+        offset=None,
+        origin="start_day",
+        pagesize=None,
+        format=None,
+    ):
+        """
+        Returns historical prices at a coarser resolution, aggregated from bars
+        at source_resolution. The source bars come from fetch(), so they are
+        only requested from IG if not already stored, and the same stored bars
+        can serve any number of coarser resolutions. See
+        trading_ig.resample.resample_prices() for offset and origin. With the
+        default format, bars are binned on their UTC time, like the requested
+        range, rather than on the local time of the account
+
+        :param epic: IG epic
+        :type epic: str
+        :param resolution: target resolution, eg 'HOUR_4' or '4h'
+        :type resolution: str
+        :param source_resolution: resolution of the stored bars, as for fetch()
+        :type source_resolution: str
+        :param start_date: range start, UTC
+        :type start_date: datetime or str
+        :param end_date: range end, UTC
+        :type end_date: datetime or str
+        :param offset: shift of the bin edges, eg '22h' for a session starting
+            at 22:00. Optional
+        :type offset: str
+        :param origin: timestamp the bins are aligned to
+        :type origin: str
+        :param pagesize: page size for any requests to IG. Optional
+        :type pagesize: int
+        :param format: function to convert the raw source bars to a DataFrame.
+            Optional, default IGService.format_prices()
+        :type format: function
+        :return: prices, plus metadata about what was fetched
+        :rtype: dict, with 'prices' element as a pandas.DataFrame
+        """
+        check_resolutions(source_resolution, resolution)
+        data = self.fetch(
+            epic,
+            source_resolution,
+            start_date,
+            end_date,
+            pagesize,
+            format=lambda prices, version: prices,
+        )
+        if format is None:
+            prices = self.ig_service.format_prices(data["prices"], "3")
+            prices.index = self.ig_service._price_index(
+                [bar["snapshotTimeUTC"] for bar in data["prices"]]
+            )
+        else:
+            prices = format(data["prices"], "3")
+        data["prices"] = resample_prices(prices, resolution, offset, origin)
+        return data
+
+    def _fetch_range(self, epic, resolution, key, start, end, pagesize):
+        kwargs = {}
+        if pagesize is not None:
+            kwargs["pagesize"] = pagesize
+        data = self.ig_service.fetch_historical_prices_by_epic(
+            epic,
+            resolution=resolution,
+            start_date=start,
+            end_date=end,
+            format=lambda prices, version: prices,
+            **kwargs,
+        )
+        prices = data["prices"]
+        self.write(epic, resolution, prices)
+
+        # never mark the future as covered, and if the range reaches the
+        # present, leave the latest (possibly incomplete) bar to be refreshed
+        now = datetime.now(timezone.utc).strftime(TIME_FORMAT)
+        if end >= now:
+            end = prices[-1]["snapshotTimeUTC"] if prices else start
+        self._add_coverage(epic, key, start, end)
+        return len(prices)
+
+    def write(self, epic, resolution, prices):
+        """
+        Stores raw (v3 format) price bars, replacing any already stored for the
+        same times
+        :param epic: IG epic
+        :type epic: str
+        :param resolution: resolution, as passed to the fetch methods
+        :type resolution: str
+        :param prices: raw price data
+        :type prices: list of dict
+        """
+        key = self._resolution_key(resolution)
+        rows = [
+            (epic, key, bar["snapshotTimeUTC"], bar["snapshotTime"])
+            + tuple(bar[field][typ] for field, typ in BAR_FIELDS)
+            + (bar["lastTradedVolume"],)
+            for bar in prices
+        ]
+        placeholders = ", ".join(["?"] * (len(BAR_COLUMNS) + 5))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO bars VALUES ({placeholders})", rows
+            )
+
+    def read(self, epic, resolution, start_date, end_date):
+        """
+        Returns stored price bars for the given range, without fetching
+        anything from IG
+        :return: raw (v3 format) price data
+        :rtype: list of dict
+        """
+        key = self._resolution_key(resolution)
+        with self._lock:
+            rows = self._conn.execute(
+                f"""SELECT time, snapshot_time, {", ".join(BAR_COLUMNS)}, volume
+                    FROM bars
+                    WHERE epic = ? AND resolution = ? AND time >= ? AND time <= ?
+                    ORDER BY time""",
+                (epic, key, to_utc_string(start_date), to_utc_string(end_date)),
+            ).fetchall()
+
+        prices = []
+        for row in rows:
+            bar = {"snapshotTime": row[1], "snapshotTimeUTC": row[0]}
+            for i, (field, typ) in enumerate(BAR_FIELDS):
+                bar.setdefault(field, {})[typ] = row[i + 2]
+            volume = row[-1]
+            bar["lastTradedVolume"] = int(volume) if volume is not None else None
+            prices.append(bar)
+        return prices
+
+    def _add_coverage(self, epic, key, start, end):
+        if end <= start:
+            return
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT start, end FROM coverage WHERE epic = ? AND resolution = ?",
+                (epic, key),
+            ).fetchall()
+            merged = merge_ranges([tuple(row) for row in rows] + [(start, end)])
+            self._conn.execute(
+                "DELETE FROM coverage WHERE epic = ? AND resolution = ?", (epic, key)
+            )
+            self._conn.executemany(
+                "INSERT INTO coverage VALUES (?, ?, ?, ?)",
+                [(epic, key, s, e) for s, e in merged],
+            )
+
+    def clear(self, epic=None, resolution=None):
+        """
+        Removes stored bars and coverage, optionally for just one epic, or one
+        epic and resolution
+        """
+        where, args = "", ()
+        if epic is not None:
+            where, args = " WHERE epic = ?", (epic,)
+            if resolution is not None:
+                where += " AND resolution = ?"
+                args += (self._resolution_key(resolution),)
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM bars{where}", args)
+            self._conn.execute(f"DELETE FROM coverage{where}", args)
@@ -4,6 +4,8 @@ import traceback
 
 from lightstreamer.client import ClientListener, LightstreamerClient, Subscription
 
+from .streamer.trade import ConfirmStore, TradeListener, TradeSubscription
+
 logger = logging.getLogger(__name__)
 
 
@@ -13,6 +15,8 @@ class IGStreamService:
         self.lightstreamerEndpoint = None
         self.acc_number = None
         self.ls_client = None
+        self.trade_subscription = None
+        self.trade_listener = None
 
     def create_session(self, encryption=False, version="2"):
         ig_session = self.ig_service.create_session(
@@ -51,6 +55,46 @@ class IGStreamService:
         for sub in subscriptions:
             self.ls_client.unsubscribe(sub)
 
+    def subscribe_trade_confirms(self, timeout=2.0):
+        """
+        Subscribes to TRADE:<account>, and has the REST service take deal
+        confirmations from it, instead of polling /confirms. If a confirm
+        hasn't arrived after timeout seconds, the REST service falls back to
+        polling
+
+        :param timeout: how long to wait for a streamed confirm, in seconds
+        :type timeout: float
+        :return: the listener, for adding OPU and WOU handlers
+        :rtype: TradeListener
+        """
+        listener = self.subscribe_trade()
+        self.ig_service.confirms = listener.confirms
+        self.ig_service.confirm_timeout = timeout
+        return listener
+
+    def subscribe_trade(self):
+        """
+        Subscribes to TRADE:<account>, if not already subscribed. Add
+        handlers to the listener for OPU and WOU updates
+        :return: the listener
+        :rtype: TradeListener
+        """
+        if self.trade_subscription is None:
+            account = self.acc_number or self.ig_service.ACC_NUMBER
+            self.trade_listener = TradeListener(ConfirmStore())
+            self.trade_subscription = TradeSubscription(account)
+            self.trade_subscription.addListener(self.trade_listener)
+            self.subscribe(self.trade_subscription)
+        return self.trade_listener
+
+    def unsubscribe_trade_confirms(self):
+        """Stops the TRADE subscription. Deal confirmations are polled again"""
+        self.ig_service.confirms = None
+        if self.trade_subscription is not None:
+            self.unsubscribe(self.trade_subscription)
+            self.trade_subscription = None
+            self.trade_listener = None
+
     def add_client_listener(self, listener: ClientListener):
         self.ls_client.addListener(listener)
 
@@ -58,5 +102,8 @@ class IGStreamService:
         self.ls_client.removeListener(listener)
 
     def disconnect(self):
+        self.ig_service.confirms = None
+        self.trade_subscription = None
+        self.trade_listener = None
         self.unsubscribe_all()
         self.ls_client.disconnect()
@@ -0,0 +1,264 @@
+import logging
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from threading import RLock
+
+logger = logging.getLogger(__name__)
+
+SIGNS = {"BUY": 1, "SELL": -1}
+
+
+class DealBook(ABC):
+    """
+    An in-memory book of deals, by deal ID, seeded from REST and then kept up
+    to date by a field of the TRADE stream. Deals are also indexed by epic.
+    Updates received before the book is seeded are held back and applied
+    after the seed, so nothing is missed between the two
+
+    Listeners are called with the update status ('OPEN', 'UPDATED' or
+    'DELETED') and the deal, after the book has been updated
+    """
+
+    # TRADE field with the updates, set by subclasses
+    field = None
+    # update statuses that take a deal out of the book
+    removals = ("DELETED",)
+
+    def __init__(self):
+        self._lock = RLock()
+        self._deals = {}
+        self._by_epic = {}
+        self._listeners = []
+        self._pending = []
+        self.seeded = False
+
+    def __len__(self):
+        return len(self._deals)
+
+    def __contains__(self, deal_id):
+        return deal_id in self._deals
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._deals.values()))
+
+    def get(self, deal_id):
+        """Returns the deal with the deal ID, or None"""
+        return self._deals.get(deal_id)
+
+    def by_epic(self, epic):
+        """Returns the deals for an epic"""
+        with self._lock:
+            return list(self._by_epic.get(epic, {}).values())
+
+    def epics(self):
+        with self._lock:
+            return list(self._by_epic)
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def attach(self, ig_stream_service):
+        """Subscribes to TRADE updates, then seeds the book from REST"""
+        listener = ig_stream_service.subscribe_trade()
+        listener.add_handler(self.field, self.apply)
+        self.load(ig_stream_service.ig_service)
+        return self
+
+    @abstractmethod
+    def load(self, ig_service):
+        """Seeds the book from REST"""
+
+    def seed(self, deals):
+        """
+        Replaces the book with deals, then applies any updates received
+        while it was unseeded
+        :param deals: deals, as returned by from_rest()
+        :type deals: list of dict
+        """
+        with self._lock:
+            self._clear()
+            for deal in deals:
+                self._add(deal)
+            self.seeded = True
+            pending, self._pending = self._pending, []
+            # replayed with the lock held, so live updates can't come first
+            events = [self._apply(update) for update in pending]
+        for event in events:
+            if event is not None:
+                self._notify(*event)
+        logger.info(f"{type(self).__name__} seeded with {len(self)} deals")
+
+    def apply(self, update):
+        """Applies an update from the TRADE stream"""
+        with self._lock:
+            if not self.seeded:
+                self._pending.append(update)
+                return
+            event = self._apply(update)
+        if event is not None:
+            self._notify(*event)
+
+    def _apply(self, update):
+        """Updates the book, with the lock held. Returns the (status, deal)
+        to pass to the listeners, or None"""
+        if update.get("dealStatus") == "REJECTED":
+            return None
+        status = update.get("status")
+        if status in self.removals:
+            deal = self._removed(update)
+            if deal is None:
+                return None
+        else:
+            old = self._remove(update["dealId"]) or {}
+            deal = self._add(dict(old, **self.from_stream(update)))
+        return status, deal
+
+    def _notify(self, status, deal):
+        for listener in self._listeners:
+            listener(status, deal)
+
+    def from_stream(self, update):
+        """Returns the deal fields of a stream update"""
+        return update
+
+    def _removed(self, update):
+        return self._remove(update["dealId"])
+
+    def _clear(self):
+        self._deals.clear()
+        self._by_epic.clear()
+
+    def _add(self, deal):
+        self._deals[deal["dealId"]] = deal
+        self._by_epic.setdefault(deal["epic"], {})[deal["dealId"]] = deal
+        return deal
+
+    def _remove(self, deal_id):
+        deal = self._deals.pop(deal_id, None)
+        if deal is not None:
+            deals = self._by_epic[deal["epic"]]
+            del deals[deal_id]
+            if not deals:
+                del self._by_epic[deal["epic"]]
+        return deal
+
+
+class PositionBook(DealBook):
+    """
+    Open positions, kept up to date by OPU updates on the TRADE stream. Net
+    exposure (BUY sizes less SELL sizes) is kept for each epic as positions
+    change, so it's as quick to look up as a position
+
+        book = PositionBook().attach(ig_stream_service)
+        book.net_exposure("CS.D.GBPUSD.TODAY.IP")
+    """
+
+    field = "OPU"
+
+    def __init__(self):
+        super().__init__()
+        self._exposure = {}
+
+    def load(self, ig_service):
+        data = ig_service._fetch_open_positions_raw()
+        self.seed([self.from_rest(position) for position in data["positions"]])
+
+    @staticmethod
+    def from_rest(position):
+        """Flattens a (v2) REST position into the fields of an OPU update"""
+        deal = dict(position["position"])
+        for key in ("epic", "expiry", "instrumentName"):
+            deal[key] = position["market"].get(key)
+        return deal
+
+    def net_exposure(self, epic):
+        """Returns the net size of the open positions for an epic"""
+        return self._exposure.get(epic, 0)
+
+    def _clear(self):
+        super()._clear()
+        self._exposure.clear()
+
+    def _add(self, deal):
+        deal = super()._add(deal)
+        self._exposure[deal["epic"]] = self.net_exposure(deal["epic"]) + _signed(deal)
+        return deal
+
+    def _remove(self, deal_id):
+        deal = super()._remove(deal_id)
+        if deal is not None:
+            exposure = self.net_exposure(deal["epic"]) - _signed(deal)
+            if deal["epic"] in self._by_epic:
+                self._exposure[deal["epic"]] = exposure
+            else:
+                self._exposure.pop(deal["epic"], None)
+        return deal
+
+
+class WorkingOrderBook(DealBook):
+    """
+    Working orders, kept up to date by WOU updates on the TRADE stream
+
+    Listeners are also called with 'FILLED' when an order is triggered, which
+    is seen as an OPU update opening a position with the order's deal ID. A
+    fill is usually preceded by a 'DELETED' update for the order, while a
+    cancelled order only gets the 'DELETED' update
+
+        book = WorkingOrderBook().attach(ig_stream_service)
+        book.add_listener(on_order)
+    """
+
+    field = "WOU"
+    removals = ("DELETED", "FILLED")
+    # deleted orders remembered, in case they turn out to have been filled
+    max_recent = 100
+
+    def __init__(self):
+        super().__init__()
+        self._recent = OrderedDict()
+
+    def attach(self, ig_stream_service):
+        listener = ig_stream_service.subscribe_trade()
+        listener.add_handler("OPU", self._position_update)
+        return super().attach(ig_stream_service)
+
+    def load(self, ig_service):
+        data = ig_service._fetch_working_orders_raw()
+        self.seed([self.from_rest(order) for order in data["workingOrders"]])
+
+    @staticmethod
+    def from_rest(order):
+        """Flattens a (v2) REST working order into the fields of a WOU update"""
+        deal = dict(order["workingOrderData"])
+        deal["size"] = deal.pop("orderSize", None)
+        deal["level"] = deal.pop("orderLevel", None)
+        for key in ("epic", "expiry", "instrumentName"):
+            deal[key] = order["marketData"].get(key)
+        return deal
+
+    def _position_update(self, update):
+        if update.get("status") == "OPEN":
+            self.apply(
+                {
+                    "dealId": update["dealId"],
+                    "dealStatus": update.get("dealStatus"),
+                    "status": "FILLED",
+                }
+            )
+
+    def _removed(self, update):
+        deal_id = update["dealId"]
+        deal = self._remove(deal_id)
+        if update["status"] == "DELETED":
+            if deal is not None:
+                self._recent[deal_id] = deal
+                while len(self._recent) > self.max_recent:
+                    self._recent.popitem(last=False)
+            return deal
+        # a position opened, that may or may not have been an order
+        return deal or self._recent.pop(deal_id, None)
+
+
+def _signed(deal):
+    return SIGNS.get(deal.get("direction"), 0) * float(deal.get("size") or 0)
@@ -0,0 +1,113 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from threading import Condition
+
+from lightstreamer.client import ItemUpdate, Subscription, SubscriptionListener
+
+logger = logging.getLogger(__name__)
+
+TRADE_FIELDS = ["CONFIRMS", "OPU", "WOU"]
+
+
+class TradeSubscription(Subscription):
+    """Represents a subscription for deal confirmations, and open position and
+    working order updates"""
+
+    def __init__(self, account: str):
+        super().__init__(
+            mode="DISTINCT",
+            items=[f"TRADE:{account}"],
+            fields=TRADE_FIELDS,
+        )
+
+    def __repr__(self) -> str:
+        return f"TradeSubscription for {self.getItems()[0]}"
+
+
+class ConfirmStore:
+    """
+    Deal confirmations received on the TRADE stream, by deal reference. A
+    confirm often arrives before the POST that created the deal has returned,
+    so they are kept (up to max_size, oldest dropped first) until asked for
+    """
+
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self._confirms = OrderedDict()
+        self._condition = Condition()
+
+    def __len__(self):
+        with self._condition:
+            return len(self._confirms)
+
+    def put(self, confirm):
+        deal_reference = confirm.get("dealReference")
+        if deal_reference is None:
+            return
+        with self._condition:
+            self._confirms[deal_reference] = confirm
+            self._confirms.move_to_end(deal_reference)
+            while len(self._confirms) > self.max_size:
+                self._confirms.popitem(last=False)
+            self._condition.notify_all()
+
+    def get(self, deal_reference, timeout=0):
+        """
+        Returns the confirm for a deal reference, waiting up to timeout
+        seconds for it to arrive
+        :return: the confirm, or None if it hasn't arrived
+        :rtype: dict
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while deal_reference not in self._confirms:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+            return self._confirms[deal_reference]
+
+
+class TradeListener(SubscriptionListener):
+    """
+    Parses TRADE updates. Confirms go to the confirm store, and each field's
+    parsed JSON is passed to any handlers added for it. Exceptions raised by
+    handlers are logged
+    """
+
+    def __init__(self, confirms: ConfirmStore = None) -> None:
+        self.confirms = confirms
+        self._handlers = {field: [] for field in TRADE_FIELDS}
+
+    def add_handler(self, field, handler):
+        """Calls handler(value) with the parsed JSON of each update to field"""
+        self._handlers[field].append(handler)
+
+    def onItemUpdate(self, update: ItemUpdate):
+        for field, value in update.getChangedFields().items():
+            if not value or field not in self._handlers:
+                continue
+            try:
+                value = json.loads(value)
+            except ValueError:
+                logger.warning(f"TradeListener: can't parse {field} '{value}'")
+                continue
+            if field == "CONFIRMS" and self.confirms is not None:
+                self.confirms.put(value)
+            # one failing handler mustn't stop the others, or the stream
+            for handler in self._handlers[field]:
+                try:
+                    handler(value)
+                except Exception:
+                    logger.exception(f"TradeListener: {field} handler failed")
+
+    def onSubscription(self):
+        logger.info("TradeListener onSubscription()")
+
+    def onSubscriptionError(self, code, message):
+        logger.info(f"TradeListener onSubscriptionError(): '{code}' {message}")
+
+    def onUnsubscription(self):
+        logger.info("TradeListener onUnsubscription()")
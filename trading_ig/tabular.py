@@ -0,0 +1,211 @@
+"""
+Tabular output backends. Each backend builds its own table type directly from
+the parsed JSON (or from NumPy arrays, for prices), without going through pandas
+"""
+
+import logging
+from operator import itemgetter
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except ImportError:
+    _HAS_NUMPY = False
+else:
+    _HAS_NUMPY = True
+
+try:
+    import pyarrow as pa
+except ImportError:
+    _HAS_PYARROW = False
+else:
+    _HAS_PYARROW = True
+
+try:
+    import polars as pl
+except ImportError:
+    _HAS_POLARS = False
+else:
+    _HAS_POLARS = True
+
+ACTIVITY_DETAIL_COLUMNS = [
+    "marketName",
+    "goodTillDate",
+    "currency",
+    "size",
+    "direction",
+    "level",
+    "stopLevel",
+    "stopDistance",
+    "guaranteedStop",
+    "trailingStopDistance",
+    "trailingStep",
+    "limitLevel",
+    "limitDistance",
+]
+ACTIVITY_COLUMNS = [
+    "date",
+    "epic",
+    "period",
+    "dealId",
+    "channel",
+    "type",
+    "status",
+    "description",
+] + ACTIVITY_DETAIL_COLUMNS
+
+
+def expand_records(records, d_cols, flag_col_prefix=False, col_overlap_allowed=None):
+    """
+    Flattens nested records, in a single pass. The equivalent of
+    IGService.expand_columns(), for a list of dict
+    :param records: parsed JSON records
+    :type records: list of dict
+    :param d_cols: nested columns to expand, keyed by the name of the nested dict
+    :type d_cols: dict
+    :param flag_col_prefix: prefix expanded column names with the nested dict name
+    :type flag_col_prefix: bool
+    :param col_overlap_allowed: columns that may appear at more than one level;
+        the last one expanded wins
+    :type col_overlap_allowed: list
+    :return: flattened records, and the column names in order
+    :rtype: tuple of (list of dict, list of str)
+    """
+    if col_overlap_allowed is None:
+        col_overlap_allowed = []
+    columns = []
+    for record in records[:1]:
+        columns = [col for col in record if col not in d_cols]
+
+    # (nested dict name, source key, output column) for every expanded column
+    plan = []
+    for col_lev1, lst_col in d_cols.items():
+        for col in lst_col:
+            colname = col_lev1 + "_" + col if flag_col_prefix else col
+            if colname not in columns:
+                columns.append(colname)
+            elif col not in col_overlap_allowed:
+                raise (NotImplementedError(f"col overlap: {col}"))
+            plan.append((col_lev1, col, colname))
+
+    rows = []
+    for record in records:
+        row = {key: value for key, value in record.items() if key not in d_cols}
+        for col_lev1, col, colname in plan:
+            nested = record.get(col_lev1)
+            row[colname] = nested.get(col) if nested else None
+        rows.append(row)
+    return rows, columns
+
+
+def activity_columns(activities, missing=float("nan")):
+    """
+    Flattens detailed (v3) activities, one row per action, into columns. The
+    activity and details fields are read into one row per activity, which is
+    then repeated for each of that activity's actions. Columns are in the order
+    pandas.json_normalize() would give them, with record_path details.actions:
+    the action keys, in the order first seen, then ACTIVITY_COLUMNS. Missing
+    action keys are the missing value, missing activity keys None
+    :param activities: parsed 'activities' JSON
+    :type activities: list of dict
+    :param missing: value for missing action keys. Default NaN, as pandas
+        would give
+    :type missing: object
+    :return: column name -> values. Activity columns are object arrays
+    :rtype: dict
+    """
+    get_activity = itemgetter(*ACTIVITY_COLUMNS[:8])
+    get_details = itemgetter(*ACTIVITY_DETAIL_COLUMNS)
+    rows = []
+    actions = []
+    counts = []
+    for activity in activities:
+        details = activity["details"]
+        try:
+            row = get_activity(activity) + get_details(details)
+        except KeyError:
+            row = tuple(activity.get(col) for col in ACTIVITY_COLUMNS[:8])
+            row += tuple(details.get(col) for col in ACTIVITY_DETAIL_COLUMNS)
+        rows.append(row)
+        actions.extend(details["actions"])
+        counts.append(len(details["actions"]))
+
+    keys = {}
+    for action in actions:
+        for key in action:
+            keys.setdefault(key)
+    columns = {key: [action.get(key, missing) for action in actions] for key in keys}
+
+    meta = np.empty((len(rows), len(ACTIVITY_COLUMNS)), dtype=object)
+    if rows:
+        meta[:] = rows
+    meta = meta.repeat(counts, axis=0)
+    for i, col in enumerate(ACTIVITY_COLUMNS):
+        columns[col] = meta[:, i]
+    return columns
+
+
+class ArrowBackend:
+    """Builds pyarrow Tables"""
+
+    def from_records(self, records, columns=None):
+        if len(records) == 0:
+            columns = columns or []
+            return pa.table({col: pa.array([], pa.null()) for col in columns})
+        table = pa.Table.from_pylist(records)
+        if columns:
+            table = table.select(columns)
+        return table
+
+    def from_arrays(self, arrays):
+        return pa.table(arrays)
+
+
+class PolarsBackend:
+    """Builds Polars DataFrames"""
+
+    def from_records(self, records, columns=None):
+        if len(records) == 0:
+            return pl.DataFrame(schema=columns or [])
+        frame = pl.from_dicts(records, infer_schema_length=None)
+        if columns:
+            frame = frame.select(columns)
+        return frame
+
+    def from_arrays(self, arrays):
+        return pl.DataFrame({name: _polars_array(arr) for name, arr in arrays.items()})
+
+
+def _polars_array(arr):
+    # Polars does not take second resolution datetimes, and keeps object
+    # arrays as Python objects rather than inferring their type
+    if arr.dtype.kind == "M":
+        return arr.astype("datetime64[ms]")
+    if arr.dtype.kind == "O":
+        return arr.tolist()
+    return arr
+
+
+BACKENDS = {"arrow": ArrowBackend, "polars": PolarsBackend}
+BACKEND_AVAILABLE = {"arrow": _HAS_PYARROW, "polars": _HAS_POLARS}
+
+
+def register_backend(name, backend_class):
+    """
+    Adds a tabular backend. The class needs from_records(records, columns=None),
+    to build a table from a list of dict, and from_arrays(arrays), to build a
+    table from a dict of NumPy arrays
+    """
+    BACKENDS[name] = backend_class
+    BACKEND_AVAILABLE[name] = True
+
+
+def get_backend(name):
+    """Returns a new instance of the named backend"""
+    if not BACKEND_AVAILABLE[name]:
+        raise ImportError(
+            f"output format '{name}' needs an optional dependency that is not "
+            f"installed, see pyproject.toml"
+        )
+    return BACKENDS[name]()
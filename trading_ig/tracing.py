@@ -0,0 +1,332 @@
+"""
+Latency tracing for dealing. Each deal made through IGService is timed from
+the call, through the trading rate limiter, the POST and its deal reference,
+to the confirm and (if a stream is attached) the position or order update on
+the TRADE stream. Intervals between these are collected into histograms by
+epic and by order type, to show whether time goes on our limiter, on IG's
+dealing engine or on waiting for the confirm
+"""
+
+import bisect
+import logging
+import time
+from collections import OrderedDict
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+# timestamps recorded for each deal, in the order they usually happen
+STAGES = ("start", "admitted", "sent", "reference", "confirmed", "streamed")
+
+# interval name -> (from stage, to stage)
+INTERVALS = {
+    "limiter": ("start", "admitted"),
+    "dealing": ("sent", "reference"),
+    "confirm": ("reference", "confirmed"),
+    "stream": ("sent", "streamed"),
+    "total": ("start", "confirmed"),
+}
+
+# upper bounds of the histogram buckets, in seconds
+BUCKETS = (
+    0.001,
+    0.002,
+    0.005,
+    0.01,
+    0.02,
+    0.05,
+    0.1,
+    0.2,
+    0.5,
+    1.0,
+    2.0,
+    5.0,
+    10.0,
+    float("inf"),
+)
+
+
+class LatencyHistogram:
+    """Counts of latencies in BUCKETS, with their total and maximum"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def quantile(self, q):
+        """The upper bound of the bucket holding the q quantile, capped at
+        the maximum seen"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "max": self.max if self.count else None,
+            "buckets": dict(zip(self.buckets, self.counts)),
+        }
+
+
+class DealTrace:
+    """The timestamps (time.monotonic()) of one deal, by stage"""
+
+    def __init__(self, tracer, method, epic=None, order_type=None):
+        self.tracer = tracer
+        self.method = method
+        self.epic = epic
+        # calls without an order type are grouped by dealing method
+        self.order_type = order_type or method
+        self.deal_reference = None
+        self.deal_id = None
+        self.deal_status = None
+        self.confirm_source = None
+        self.started = time.time()
+        self.marks = {"start": time.monotonic()}
+
+    def __repr__(self):
+        return f"DealTrace({self.method}, {self.epic}, {self.deal_reference!r})"
+
+    def mark(self, stage, at=None):
+        """Records the time of a stage, unless it has been recorded already"""
+        self.marks.setdefault(stage, time.monotonic() if at is None else at)
+
+    def referenced(self, deal_reference):
+        """Records the deal reference IG replied with"""
+        self.mark("reference")
+        self.deal_reference = deal_reference
+        self.tracer._register(self)
+
+    def intervals(self):
+        """Returns the seconds taken by each of INTERVALS that was seen"""
+        return {
+            name: self.marks[end] - self.marks[start]
+            for name, (start, end) in INTERVALS.items()
+            if start in self.marks and end in self.marks
+        }
+
+    def to_dict(self):
+        return {
+            "method": self.method,
+            "epic": self.epic,
+            "order_type": self.order_type,
+            "deal_reference": self.deal_reference,
+            "deal_id": self.deal_id,
+            "deal_status": self.deal_status,
+            "confirm_source": self.confirm_source,
+            "started": self.started,
+            **self.intervals(),
+        }
+
+
+class _NoTrace:
+    """Stands in for a DealTrace when no tracer is attached"""
+
+    def mark(self, stage, at=None):
+        pass
+
+    def referenced(self, deal_reference):
+        pass
+
+
+NO_TRACE = _NoTrace()
+
+
+class LatencyTracer:
+    """
+    Times the deals made through an IGService, and keeps latency histograms
+    of INTERVALS by epic and by order type. Attach a stream too, to time the
+    confirms and position and order updates as they arrive on it
+
+        tracer = LatencyTracer().attach(ig_service, ig_stream_service)
+        tracer.add_exporter(lambda trace: log.write(trace.to_dict()))
+        ...
+        tracer.summary()
+
+    A deal is finished once it is confirmed, and, if a stream is attached
+    and the deal was accepted, its update has been seen. Finished deals are
+    added to the histograms and passed to each exporter. Deals still waiting
+    when there are more than max_pending are finished as they are
+
+    :param max_pending: how many unfinished deals to keep
+    :type max_pending: int
+    :param buckets: upper bounds of the histogram buckets, in seconds
+    :type buckets: tuple of float
+    """
+
+    def __init__(self, max_pending=1000, buckets=BUCKETS):
+        self.max_pending = max_pending
+        self.buckets = buckets
+        self.streaming = False
+        self._pending = OrderedDict()
+        # stream events for deals whose reference hasn't been returned yet
+        self._early = OrderedDict()
+        self._histograms = {}
+        self._exporters = []
+        self._lock = Lock()
+
+    def attach(self, ig_service, ig_stream_service=None):
+        """Traces the deals made through ig_service, and the updates for them
+        on the TRADE stream of ig_stream_service"""
+        ig_service.tracer = self
+        if ig_stream_service is not None:
+            listener = ig_stream_service.subscribe_trade()
+            listener.add_handler("CONFIRMS", self._stream_confirm)
+            listener.add_handler("OPU", self._stream_update)
+            listener.add_handler("WOU", self._stream_update)
+            self.streaming = True
+        return self
+
+    def add_exporter(self, exporter):
+        """Calls exporter(trace) with each finished DealTrace"""
+        self._exporters.append(exporter)
+
+    def start(self, method, epic=None, order_type=None):
+        """Starts timing a call to a dealing method"""
+        return DealTrace(self, method, epic, order_type)
+
+    def confirmed(self, deal_reference, confirm, source):
+        """
+        Records a deal confirmation, as returned by the REST service
+        :param source: where the confirm came from, 'rest' or 'stream'
+        :type source: str
+        """
+        with self._lock:
+            trace = self._pending.get(deal_reference)
+            if trace is None:
+                return
+            trace.mark("confirmed")
+            trace.confirm_source = source
+            trace.deal_id = confirm.get("dealId")
+            trace.deal_status = confirm.get("dealStatus")
+            if trace.epic is None:
+                trace.epic = confirm.get("epic")
+            done = self._pop_if_done(trace)
+        if done:
+            self._finish(trace)
+
+    def histogram(self, interval, epic=None, order_type=None):
+        """
+        Returns the LatencyHistogram of an interval for an epic or an order
+        type, or over every deal if neither is given
+        """
+        if epic is not None:
+            key = (interval, "epic", epic)
+        elif order_type is not None:
+            key = (interval, "order_type", order_type)
+        else:
+            key = (interval, "all", None)
+        with self._lock:
+            return self._histograms.get(key) or LatencyHistogram(self.buckets)
+
+    def summary(self):
+        """
+        Returns the histograms as rows, with count, mean and quantiles in
+        seconds
+        :rtype: list of dict
+        """
+        with self._lock:
+            items = sorted(self._histograms.items(), key=lambda item: str(item[0]))
+        rows = []
+        for (interval, by, key), histogram in items:
+            row = {"interval": interval, "by": by, "key": key}
+            row.update(histogram.to_dict())
+            del row["buckets"]
+            rows.append(row)
+        return rows
+
+    def reset(self):
+        with self._lock:
+            self._pending.clear()
+            self._early.clear()
+            self._histograms.clear()
+
+    def _register(self, trace):
+        evicted = []
+        with self._lock:
+            self._pending[trace.deal_reference] = trace
+            for stage, at in self._early.pop(trace.deal_reference, {}).items():
+                trace.mark(stage, at)
+            while len(self._pending) > self.max_pending:
+                evicted.append(self._pending.popitem(last=False)[1])
+        for old in evicted:
+            self._finish(old)
+
+    def _stream_confirm(self, confirm):
+        self._stream_event(confirm, "confirmed")
+
+    def _stream_update(self, update):
+        self._stream_event(update, "streamed")
+
+    def _stream_event(self, update, stage):
+        deal_reference = update.get("dealReference")
+        if deal_reference is None:
+            return
+        at = time.monotonic()
+        with self._lock:
+            trace = self._pending.get(deal_reference)
+            if trace is None:
+                self._early.setdefault(deal_reference, {}).setdefault(stage, at)
+                while len(self._early) > self.max_pending:
+                    self._early.popitem(last=False)
+                return
+            trace.mark(stage, at)
+            done = stage == "streamed" and self._pop_if_done(trace)
+        if done:
+            self._finish(trace)
+
+    def _pop_if_done(self, trace):
+        """Takes a finished trace out of the pending ones, with the lock held"""
+        if trace.confirm_source is None:
+            return False
+        if (
+            self.streaming
+            and trace.deal_status == "ACCEPTED"
+            and "streamed" not in trace.marks
+        ):
+            return False
+        del self._pending[trace.deal_reference]
+        return True
+
+    def _finish(self, trace):
+        with self._lock:
+            for interval, seconds in trace.intervals().items():
+                for key in (
+                    (interval, "all", None),
+                    (interval, "epic", trace.epic),
+                    (interval, "order_type", trace.order_type),
+                ):
+                    histogram = self._histograms.get(key)
+                    if histogram is None:
+                        histogram = self._histograms[key] = LatencyHistogram(
+                            self.buckets
+                        )
+                    histogram.add(seconds)
+        for exporter in self._exporters:
+            try:
+                exporter(trace)
+            except Exception:
+                logger.exception(f"LatencyTracer: exporter failed for {trace}")
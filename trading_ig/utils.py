@@ -1,16 +1,25 @@
 import logging
 import os
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
 import six
 
+from .conversions import DATE_FORMATS, conv_datetime, conv_resol  # noqa: F401
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.WARNING)
 
 OPT_URL = "https://trading-ig.readthedocs.io/en/latest/faq.html#optional-dependencies"
 
 try:
-    import numpy as np  # noqa
+    import numpy as np
+except ImportError:
+    _HAS_NUMPY = False
+else:
+    _HAS_NUMPY = True
+
+try:
     import pandas as pd
 except ImportError:
     _HAS_PANDAS = False
@@ -27,66 +36,49 @@ else:
     _HAS_MUNCH = True
 
 
-DATE_FORMATS = {1: "%Y:%m:%d-%H:%M:%S", 2: "%Y/%m/%d %H:%M:%S", 3: "%Y/%m/%d %H:%M:%S"}
-
-
-def conv_resol(resolution):
-    """Returns a string for resolution (from a Pandas)"""
-    if _HAS_PANDAS:
-        from pandas.tseries.frequencies import to_offset
-
-        d = {
-            to_offset("1s"): "SECOND",
-            to_offset("1Min"): "MINUTE",
-            to_offset("2Min"): "MINUTE_2",
-            to_offset("3Min"): "MINUTE_3",
-            to_offset("5Min"): "MINUTE_5",
-            to_offset("10Min"): "MINUTE_10",
-            to_offset("15Min"): "MINUTE_15",
-            to_offset("30Min"): "MINUTE_30",
-            to_offset("1h"): "HOUR",
-            to_offset("2h"): "HOUR_2",
-            to_offset("3h"): "HOUR_3",
-            to_offset("4h"): "HOUR_4",
-            to_offset("D"): "DAY",
-            to_offset("W"): "WEEK",
-            to_offset("ME"): "MONTH",
-        }
-        # pandas 3.0 removes the 'H' and 'M' frequency aliases, in favour of
-        # 'h' and 'ME' so normalise them before calling to_offset
-        alias = resolution
-        if isinstance(alias, str):
-            if alias.endswith("H"):
-                alias = alias[:-1] + "h"
-            elif alias in ("M", "1M"):
-                alias = "ME"
-
-        offset = to_offset(alias)
-        if offset in d:
-            return d[offset]
-        else:
-            logger.error(traceback.format_exc())
-            logger.warning(f"conv_resol returns '{resolution}'")
-            return resolution
-    else:
-        return resolution
+PRICE_TYPES = ("bid", "ask", "lastTraded")
+PRICE_FIELDS = ("openPrice", "highPrice", "lowPrice", "closePrice")
 
 
-def conv_datetime(dt, version=2):
-    """Converts dt to string like
-    version 1 = 2014:12:15-00:00:00
-    version 2 = 2014/12/15 00:00:00
-    version 3 = 2014/12/15 00:00:00
-    """
-    try:
-        if isinstance(dt, six.string_types) and _HAS_PANDAS:
-            dt = pd.to_datetime(dt)
+def _bar_values(bar):
+    o, h, lo, c = bar["openPrice"], bar["highPrice"], bar["lowPrice"], bar["closePrice"]
+    return (
+        o["bid"],
+        h["bid"],
+        lo["bid"],
+        c["bid"],
+        o["ask"],
+        h["ask"],
+        lo["ask"],
+        c["ask"],
+        o["lastTraded"],
+        h["lastTraded"],
+        lo["lastTraded"],
+        c["lastTraded"],
+    )
+
 
-        fmt = DATE_FORMATS[int(version)]
-        return dt.strftime(fmt)
-    except (ValueError, TypeError):
-        logger.warning(f"conv_datetime returns {dt}")
-        return dt
+def price_arrays(prices, time_key="snapshotTime"):
+    """
+    Extracts raw price data into NumPy arrays, in a single pass
+    :param prices: raw price data
+    :type prices: list of dict
+    :param time_key: name of the timestamp field
+    :type time_key: str
+    :return: timestamps as strings; prices as float64, shape (len(prices), 3, 4),
+        indexed by PRICE_TYPES then PRICE_FIELDS, NaN if missing; volumes as
+        int64, or float64 with NaN if any are missing
+    :rtype: tuple of numpy.ndarray
+    """
+    times = np.array([bar[time_key] for bar in prices])
+    values = np.array([_bar_values(bar) for bar in prices], dtype=np.float64)
+    values = values.reshape(len(prices), len(PRICE_TYPES), len(PRICE_FIELDS))
+    volumes = [bar["lastTradedVolume"] for bar in prices]
+    if None in volumes:
+        volumes = np.array(volumes, dtype=np.float64)
+    else:
+        volumes = np.array(volumes, dtype=np.int64)
+    return times, values, volumes
 
 
 def conv_to_ms(td):
@@ -129,6 +121,37 @@ def print_full(x):
     pd.reset_option("display.max_colwidth")
 
 
+def map_concurrently(fn, items, max_workers=4):
+    """
+    Calls fn once for each item, using a pool of threads
+    :param fn: function taking a single argument
+    :type fn: function
+    :param items: arguments for fn
+    :type items: iterable
+    :param max_workers: maximum number of concurrent calls
+    :type max_workers: int
+    :return: a (result, exception) tuple for each item, in the same order as items.
+        One of the two will always be None
+    :rtype: list
+    """
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1:
+        futures = None
+    else:
+        executor = ThreadPoolExecutor(max_workers=min(max_workers, len(items)))
+        with executor:
+            futures = [executor.submit(fn, item) for item in items]
+
+    results = []
+    for i, item in enumerate(items):
+        try:
+            result = futures[i].result() if futures else fn(item)
+            results.append((result, None))
+        except Exception as ex:
+            results.append((None, ex))
+    return results
+
+
 def api_limit_hit(response_text):
     # note we don't check for historical data allowance - it only gets reset
     # once a week
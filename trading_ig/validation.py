@@ -0,0 +1,370 @@
+"""
+Pre-trade checks against IG's dealing rules, so that orders IG would reject
+(too small, stop too close, market closed) fail locally instead of costing a
+round trip and a REJECTED confirm. Dealing rules are fetched once per market
+and cached. Market status and prices change much more often, so they are only
+checked while they are recent
+"""
+
+import logging
+import time
+from dataclasses import dataclass
+from threading import Lock
+
+from .rest import IGException
+
+logger = logging.getLogger(__name__)
+
+# IG's limit on the number of epics in one /markets request
+MAX_EPICS = 50
+
+# allows for levels like 1.2345 - 1.2335 not quite making 0.001
+_EPSILON = 1e-9
+
+
+class OrderValidationError(IGException):
+    """Raised when an order breaks the dealing rules of its market"""
+
+    def __init__(self, epic, errors):
+        super().__init__(f"{epic}: {'; '.join(errors)}")
+        self.epic = epic
+        self.errors = errors
+
+
+@dataclass
+class MarketRules:
+    """
+    The dealing rules and latest snapshot of a market. Distances are
+    (value, unit) pairs, with unit 'POINTS' or 'PERCENTAGE' (of the price).
+    fetched, status_time and price_time are the time.monotonic() at which
+    the rules, market status and prices were last set
+    """
+
+    epic: str
+    min_deal_size: float = None
+    min_step_distance: tuple = None
+    min_stop_or_limit_distance: tuple = None
+    min_guaranteed_stop_distance: tuple = None
+    max_stop_or_limit_distance: tuple = None
+    market_status: str = None
+    bid: float = None
+    offer: float = None
+    fetched: float = 0.0
+    status_time: float = 0.0
+    price_time: float = 0.0
+
+    @classmethod
+    def from_market(cls, market):
+        """Builds the rules from market details, as returned by
+        IGService.fetch_market_by_epic()"""
+        rules = market["dealingRules"]
+        snapshot = market["snapshot"]
+        min_deal_size = _distance(rules.get("minDealSize"))
+        now = time.monotonic()
+        return cls(
+            epic=market["instrument"]["epic"],
+            min_deal_size=min_deal_size[0] if min_deal_size else None,
+            min_step_distance=_distance(rules.get("minStepDistance")),
+            min_stop_or_limit_distance=_distance(
+                rules.get("minNormalStopOrLimitDistance")
+            ),
+            min_guaranteed_stop_distance=_distance(
+                rules.get("minControlledRiskStopDistance")
+            ),
+            max_stop_or_limit_distance=_distance(rules.get("maxStopOrLimitDistance")),
+            market_status=snapshot.get("marketStatus"),
+            bid=snapshot.get("bid"),
+            offer=snapshot.get("offer"),
+            fetched=now,
+            status_time=now,
+            price_time=now,
+        )
+
+    def price(self, direction):
+        """The price a market order in direction would deal at"""
+        return self.offer if direction == "BUY" else self.bid
+
+
+class MarketStore:
+    """
+    Dealing rules by epic, fetched from IG when first needed and again once
+    they are older than max_age seconds. Prices and market status come from
+    the same snapshot, but are only used while they are less than
+    snapshot_max_age seconds old. Keep them current with update(), eg from a
+    price stream, otherwise the status and price checks are skipped once the
+    snapshot is stale
+
+        markets = MarketStore(ig_service)
+        markets.load(["CS.D.GBPUSD.TODAY.IP", "IX.D.FTSE.DAILY.IP"])
+    """
+
+    def __init__(self, ig_service, max_age=3600, snapshot_max_age=10):
+        self.ig_service = ig_service
+        self.max_age = max_age
+        self.snapshot_max_age = snapshot_max_age
+        self._markets = {}
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._markets)
+
+    def __contains__(self, epic):
+        return epic in self._markets
+
+    def get(self, epic):
+        """Returns the MarketRules for an epic, fetching them if needed"""
+        rules = self._markets.get(epic)
+        if rules is None or time.monotonic() - rules.fetched > self.max_age:
+            market = self.ig_service.fetch_market_by_epic(epic)
+            rules = self._put(MarketRules.from_market(market))
+        return rules
+
+    def load(self, epics):
+        """Fetches the rules for several markets, MAX_EPICS per request"""
+        epics = list(epics)
+        for i in range(0, len(epics), MAX_EPICS):
+            markets = self.ig_service.fetch_markets_by_epics(
+                ",".join(epics[i : i + MAX_EPICS])
+            )
+            for market in markets:
+                self._put(MarketRules.from_market(market))
+
+    def update(self, epic, bid=None, offer=None, market_status=None):
+        """Updates the prices and status of a cached market"""
+        rules = self._markets.get(epic)
+        if rules is None:
+            return
+        now = time.monotonic()
+        if bid is not None:
+            rules.bid = float(bid)
+            rules.price_time = now
+        if offer is not None:
+            rules.offer = float(offer)
+            rules.price_time = now
+        if market_status is not None:
+            rules.market_status = market_status
+            rules.status_time = now
+
+    def market_status(self, rules):
+        """The market status of rules, or None if it is stale"""
+        if time.monotonic() - rules.status_time > self.snapshot_max_age:
+            return None
+        return rules.market_status
+
+    def price(self, rules, direction):
+        """The price a market order in direction would deal at, or None if
+        the prices are stale"""
+        if time.monotonic() - rules.price_time > self.snapshot_max_age:
+            return None
+        return rules.price(direction)
+
+    def invalidate(self, epic=None):
+        """Drops the rules for an epic, or for every market"""
+        with self._lock:
+            if epic is None:
+                self._markets.clear()
+            else:
+                self._markets.pop(epic, None)
+
+    def _put(self, rules):
+        with self._lock:
+            self._markets[rules.epic] = rules
+        return rules
+
+
+class OrderValidator:
+    """
+    Checks orders against the cached dealing rules of their market. Once
+    attached, IGService.create_open_position() and create_working_order()
+    raise OrderValidationError for an order that breaks the rules, before
+    anything is sent
+
+        validator = OrderValidator(MarketStore(ig_service)).attach(ig_service)
+    """
+
+    # market statuses that new deals are accepted in
+    tradeable = ("TRADEABLE",)
+
+    def __init__(self, markets):
+        self.markets = markets
+
+    def attach(self, ig_service):
+        """Validates the orders made through ig_service"""
+        ig_service.validator = self
+        return self
+
+    def check_open_position(
+        self,
+        epic,
+        direction,
+        size,
+        order_type="MARKET",
+        level=None,
+        stop_distance=None,
+        stop_level=None,
+        limit_distance=None,
+        limit_level=None,
+        guaranteed_stop=False,
+        trailing_stop=False,
+        trailing_stop_increment=None,
+    ):
+        """
+        Returns the dealing rules an open position would break
+        :return: descriptions of the problems, empty if there are none
+        :rtype: list of str
+        """
+        rules = self.markets.get(epic)
+        if order_type in ("LIMIT", "QUOTE") and level is not None:
+            entry = float(level)
+        else:
+            entry = self.markets.price(rules, direction)
+        errors = self._check(
+            rules,
+            direction,
+            size,
+            entry,
+            stop_distance,
+            stop_level,
+            limit_distance,
+            limit_level,
+            guaranteed_stop,
+        )
+        if trailing_stop and trailing_stop_increment is not None:
+            step = _points(rules.min_step_distance, entry)
+            if step is not None and float(trailing_stop_increment) + _EPSILON < step:
+                errors.append(
+                    f"trailing stop increment {trailing_stop_increment} is below "
+                    f"the minimum {step:g}"
+                )
+        return errors
+
+    def check_working_order(
+        self,
+        epic,
+        direction,
+        size,
+        level,
+        order_type,
+        stop_distance=None,
+        stop_level=None,
+        limit_distance=None,
+        limit_level=None,
+        guaranteed_stop=False,
+    ):
+        """
+        Returns the dealing rules a working order would break
+        :return: descriptions of the problems, empty if there are none
+        :rtype: list of str
+        """
+        rules = self.markets.get(epic)
+        entry = float(level)
+        errors = self._check(
+            rules,
+            direction,
+            size,
+            entry,
+            stop_distance,
+            stop_level,
+            limit_distance,
+            limit_level,
+            guaranteed_stop,
+        )
+        # a LIMIT order deals at a better price than now, a STOP order worse
+        price = self.markets.price(rules, direction)
+        if price is not None and order_type in ("LIMIT", "STOP"):
+            better = entry < price if direction == "BUY" else entry > price
+            if better != (order_type == "LIMIT"):
+                side = "below" if (direction == "BUY") == better else "above"
+                errors.append(
+                    f"{direction} {order_type} level {level} is {side} the "
+                    f"current price {price:g}"
+                )
+        return errors
+
+    def validate_open_position(self, epic, **kwargs):
+        """Raises OrderValidationError if an open position breaks the rules"""
+        errors = self.check_open_position(epic, **kwargs)
+        if errors:
+            raise OrderValidationError(epic, errors)
+
+    def validate_working_order(self, epic, **kwargs):
+        """Raises OrderValidationError if a working order breaks the rules"""
+        errors = self.check_working_order(epic, **kwargs)
+        if errors:
+            raise OrderValidationError(epic, errors)
+
+    def _check(
+        self,
+        rules,
+        direction,
+        size,
+        entry,
+        stop_distance,
+        stop_level,
+        limit_distance,
+        limit_level,
+        guaranteed_stop,
+    ):
+        errors = []
+        # skipped once the status is stale, as the market may have reopened
+        market_status = self.markets.market_status(rules)
+        if market_status is not None and market_status not in self.tradeable:
+            errors.append(f"market is {market_status}")
+        if rules.min_deal_size is not None and float(size) < rules.min_deal_size:
+            errors.append(
+                f"size {size} is below the minimum deal size {rules.min_deal_size:g}"
+            )
+        # BUY stops are below the entry and limits above, SELL the other way
+        sign = 1 if direction == "BUY" else -1
+        min_stop = (
+            rules.min_guaranteed_stop_distance
+            if guaranteed_stop
+            else rules.min_stop_or_limit_distance
+        )
+        for name, distance, level, side, minimum in (
+            ("stop", stop_distance, stop_level, -sign, min_stop),
+            (
+                "limit",
+                limit_distance,
+                limit_level,
+                sign,
+                rules.min_stop_or_limit_distance,
+            ),
+        ):
+            if distance is None and level is not None and entry is not None:
+                distance = side * (float(level) - entry)
+                if distance <= 0:
+                    errors.append(
+                        f"{name} level {level} is on the wrong side of {entry:g}"
+                    )
+                    continue
+            if distance is None:
+                continue
+            distance = float(distance)
+            low = _points(minimum, entry)
+            high = _points(rules.max_stop_or_limit_distance, entry)
+            if low is not None and distance + _EPSILON < low:
+                errors.append(
+                    f"{name} distance {distance:g} is below the minimum {low:g}"
+                )
+            if high is not None and distance - _EPSILON > high:
+                errors.append(
+                    f"{name} distance {distance:g} is above the maximum {high:g}"
+                )
+        return errors
+
+
+def _distance(rule):
+    if not rule or rule.get("value") is None:
+        return None
+    return float(rule["value"]), rule.get("unit")
+
+
+def _points(distance, price):
+    """A (value, unit) distance in points, or None if it can't be worked out"""
+    if distance is None:
+        return None
+    value, unit = distance
+    if unit == "PERCENTAGE":
+        return None if price is None else value * price / 100
+    return value